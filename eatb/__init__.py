@@ -3,6 +3,7 @@
 # -*- coding: utf-8 -*-
 import logging
 import os
+import re
 from logging.config import fileConfig
 
 ROOT = os.path.split(os.path.abspath(os.path.dirname(__file__)))[0]
@@ -13,3 +14,6 @@ LOGGER = logging.getLogger()
 logger = logging.getLogger(__name__)
 
 VersionDirFormat = 'v%05d'
+
+# version directory names (group 1: version number)
+VersionDirPattern = re.compile(r'^v([0-9]{5,})$')
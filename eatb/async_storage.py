@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import weakref
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from eatb import logger, VersionDirFormat, VersionDirPattern
+from eatb.pairtree_storage import PairtreeStorage
+from eatb.storage import update_storage_with_differences, write_inventory_from_directory
+from eatb.utils.fileutils import copy_file_content
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+    s3_disabled = False
+except ImportError:
+    s3_disabled = True
+
+# default maximum number of concurrent storage operations of a backend
+DEFAULT_MAX_CONCURRENCY = 8
+
+# S3 objects larger than the threshold are uploaded in parts of the given size (8 MiB)
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+
+StorageObjectInfo = namedtuple("StorageObjectInfo", ["key", "size", "mtime"])
+
+
+class AsyncStorageBackend(ABC):
+    """
+    Asynchronous storage backend. Objects are addressed by keys (paths using '/' as separator). The blocking
+    operations of the implementations are executed in a thread pool and at most 'max_concurrency' operations of a
+    backend run at the same time, so that many transfers can be awaited together (e.g. using asyncio.gather).
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        Constructor
+        :param max_concurrency: maximum number of concurrent storage operations
+        """
+        if max_concurrency < 1:
+            raise ValueError("Maximum concurrency must be at least 1: %s" % max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._semaphores = {}
+        self._locks = {}
+
+    def _semaphore(self):
+        # semaphores are bound to the event loop they are used in
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    def _lock(self, name):
+        # locks are bound to the event loop as well; a lock is kept as long as it is held or awaited
+        locks = self._locks.setdefault(asyncio.get_running_loop(), weakref.WeakValueDictionary())
+        lock = locks.get(name)
+        if lock is None:
+            lock = locks[name] = asyncio.Lock()
+        return lock
+
+    async def _run(self, func, *args):
+        async with self._semaphore():
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def put(self, key, source_file_path):
+        """
+        Store a file
+        :param key: object key
+        :param source_file_path: source file path
+        :return: number of bytes stored
+        """
+        return await self._run(self._put, key, source_file_path)
+
+    async def get(self, key, target_file_path):
+        """
+        Retrieve an object
+        :param key: object key
+        :param target_file_path: target file path
+        :return: number of bytes retrieved
+        :except FileNotFoundError: if the object does not exist
+        """
+        return await self._run(self._get, key, target_file_path)
+
+    async def list(self, prefix=""):
+        """
+        List object keys
+        :param prefix: key prefix
+        :return: sorted list of the keys starting with the prefix
+        """
+        return sorted(await self._run(self._list, prefix))
+
+    async def exists(self, key):
+        """
+        Check if an object exists
+        :param key: object key
+        :return: True if the object exists
+        """
+        return await self._run(self._exists, key)
+
+    async def stat(self, key):
+        """
+        Get size and modification time of an object
+        :param key: object key
+        :return: StorageObjectInfo (key, size, mtime as POSIX timestamp)
+        :except FileNotFoundError: if the object does not exist
+        """
+        return await self._run(self._stat, key)
+
+    async def put_directory(self, source_directory, prefix="", exclude_files=None):
+        """
+        Store all files of a directory concurrently (key: prefix followed by the path relative to the directory)
+        :param source_directory: source directory
+        :param prefix: key prefix (e.g. 'identifier/v00001/')
+        :param exclude_files: names of files not to be stored
+        :return: dictionary of stored keys with the number of bytes stored
+        """
+        keys = []
+        transfers = []
+        for root, _, files in os.walk(source_directory):
+            for file in files:
+                if exclude_files and file in exclude_files:
+                    continue
+                source_file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(source_file_path, source_directory).replace(os.sep, "/")
+                keys.append(prefix + rel_path)
+                transfers.append(self.put(prefix + rel_path, source_file_path))
+        return dict(zip(keys, await asyncio.gather(*transfers)))
+
+    def close(self):
+        """
+        Release the thread pool of the backend
+        """
+        self._executor.shutdown(wait=True)
+
+    @abstractmethod
+    def _put(self, key, source_file_path):
+        pass
+
+    @abstractmethod
+    def _get(self, key, target_file_path):
+        pass
+
+    @abstractmethod
+    def _list(self, prefix):
+        pass
+
+    @abstractmethod
+    def _exists(self, key):
+        pass
+
+    @abstractmethod
+    def _stat(self, key):
+        pass
+
+
+def _write_file(source_file_path, target_file_path):
+    """
+    Copy a file using a temporary file which replaces the target when it is complete
+    :return: number of bytes copied
+    """
+    target_dir = os.path.dirname(os.path.abspath(target_file_path))
+    os.makedirs(target_dir, exist_ok=True)
+    # unique temporary file in the target directory, so that concurrent writes of the same key do not interfere
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, prefix=".", suffix=".part")
+    os.close(fd)
+    try:
+        copied, _ = copy_file_content(source_file_path, tmp_path)
+        shutil.copymode(source_file_path, tmp_path)
+        os.replace(tmp_path, target_file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return copied
+
+
+class LocalAsyncBackend(AsyncStorageBackend):
+    """
+    Asynchronous storage backend using a local directory (key: path relative to the root directory)
+    """
+
+    def __init__(self, root_directory, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        Constructor
+        :param root_directory: root directory
+        :param max_concurrency: maximum number of concurrent storage operations
+        """
+        super().__init__(max_concurrency)
+        self.root_directory = root_directory
+
+    def _path(self, key):
+        parts = key.strip("/").split("/")
+        if not key.strip("/") or ".." in parts:
+            raise ValueError("Invalid key: %s" % key)
+        return os.path.join(self.root_directory, *parts)
+
+    def _key(self, path):
+        return os.path.relpath(path, self.root_directory).replace(os.sep, "/")
+
+    def _put(self, key, source_file_path):
+        return _write_file(source_file_path, self._path(key))
+
+    def _get(self, key, target_file_path):
+        return _write_file(self._path(key), target_file_path)
+
+    def _list(self, prefix):
+        keys = []
+        for root, _, files in os.walk(self.root_directory):
+            for file in files:
+                key = self._key(os.path.join(root, file))
+                if key.startswith(prefix):
+                    keys.append(key)
+        return keys
+
+    def _exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def _stat(self, key):
+        st = os.stat(self._path(key))
+        return StorageObjectInfo(key, st.st_size, st.st_mtime)
+
+
+class OcflAsyncBackend(LocalAsyncBackend):
+    """
+    Asynchronous storage backend for a local OCFL object (the data directory holding the inventory and the version
+    directories, see eatb.storage). Keys are paths relative to the object directory (e.g. 'v00001/metadata/x.xml').
+    """
+
+    def _list(self, prefix):
+        return [key for key in super()._list(prefix) if "/" in key]
+
+    def _head_version(self):
+        inventory_path = os.path.join(self.root_directory, "inventory.json")
+        if os.path.exists(inventory_path):
+            with open(inventory_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("head")
+        return None
+
+    async def head_version(self):
+        """
+        Get the head version of the object
+        :return: version string (e.g. 'v00001') or None if no version was written
+        """
+        return await self._run(self._head_version)
+
+    def _allocate_version(self):
+        head = self._head_version()
+        head_num = int(VersionDirPattern.match(head).group(1)) if head else 0
+        version = VersionDirFormat % (head_num + 1)
+        os.makedirs(self.root_directory, exist_ok=True)
+        # fails if another writer has allocated the version already
+        os.mkdir(os.path.join(self.root_directory, version))
+        return head_num, version
+
+    async def commit_version(self, identifier, working_dir, action="ingest", exclude_files=None, workers=1,
+                             deduplicate=False, content_pool=None):
+        """
+        Write a new version of the object: new or changed files of the working directory are stored in the new
+        version directory and the inventory is updated.
+        :param identifier: object identifier
+        :param working_dir: directory holding the current state of the object
+        :param action: message of the version entry (e.g. 'ingest')
+        :param exclude_files: names of files not to be stored
+        :param workers: number of hashing threads
+        :param deduplicate: content already stored in the object is recorded in the version state only
+        :param content_pool: repository-level content pool (see eatb.storage.ContentPool)
+        :return: tuple (version, added or changed files, deleted files)
+        :except FileExistsError: if the version directory was created by another writer
+        """
+        # commits of the object are serialized, each commit is based on the inventory written by the previous one
+        async with self._lock(self.root_directory):
+            head_num, version = await self._run(self._allocate_version)
+            previous_versions = [VersionDirFormat % num for num in range(1, head_num + 1)]
+            version_dir = os.path.join(self.root_directory, version)
+            inventory_path = os.path.join(self.root_directory, "inventory.json")
+            try:
+                added, deleted = await self._run(update_storage_with_differences, working_dir, version_dir,
+                                                 previous_versions, inventory_path, exclude_files, workers,
+                                                 deduplicate, content_pool)
+                await self._run(write_inventory_from_directory, identifier, version, self.root_directory, action,
+                                {"added": added, "removed": deleted}, workers, deduplicate, content_pool)
+            except Exception:
+                # the version is not recorded in the inventory, remove it so that it can be allocated again
+                if self._head_version() != version:
+                    shutil.rmtree(version_dir, ignore_errors=True)
+                raise
+        logger.info("OCFL object %s: version %s written (%d added or changed, %d deleted)"
+                    % (identifier, version, len(added), len(deleted)))
+        return version, added, deleted
+
+
+class PairtreeAsyncBackend(AsyncStorageBackend):
+    """
+    Asynchronous storage backend for a pairtree repository (see PairtreeStorage). Keys have the form
+    '<identifier>/<version>/<file name>', e.g. 'urn:uuid:1234/v00001/urn+uuid+1234.tar'.
+    """
+
+    def __init__(self, repository_storage_dir, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        Constructor
+        :param repository_storage_dir: repository storage directory
+        :param max_concurrency: maximum number of concurrent storage operations
+        """
+        super().__init__(max_concurrency)
+        self.storage = PairtreeStorage(repository_storage_dir)
+
+    def _path(self, key):
+        parts = key.rsplit("/", 2)
+        if len(parts) != 3 or not parts[0] or not VersionDirPattern.match(parts[1]) or parts[2] in ("", ".", ".."):
+            raise ValueError("Invalid key: %s" % key)
+        identifier, version, name = parts
+        return os.path.join(self.storage.get_dir_path_from_id(identifier), "data", version, name)
+
+    def _put(self, key, source_file_path):
+        return _write_file(source_file_path, self._path(key))
+
+    def _get(self, key, target_file_path):
+        return _write_file(self._path(key), target_file_path)
+
+    # noinspection PyProtectedMember
+    def _list(self, prefix):
+        keys = []
+        pairtree_root = os.path.join(self.storage.repository_storage_dir, "pairtree_root")
+        for root, dirs, _ in os.walk(pairtree_root):
+            if "data" not in dirs:
+                continue
+            dirs.remove("data")
+            identifier = self.storage.repo_storage_client._get_id_from_dirpath(root)
+            data_dir = os.path.join(root, "data")
+            for version in os.listdir(data_dir):
+                version_dir = os.path.join(data_dir, version)
+                if not VersionDirPattern.match(version) or not os.path.isdir(version_dir):
+                    continue
+                for name in os.listdir(version_dir):
+                    key = "%s/%s/%s" % (identifier, version, name)
+                    if key.startswith(prefix) and os.path.isfile(os.path.join(version_dir, name)):
+                        keys.append(key)
+        return keys
+
+    def _exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def _stat(self, key):
+        st = os.stat(self._path(key))
+        return StorageObjectInfo(key, st.st_size, st.st_mtime)
+
+    async def store(self, identifier, source_file_path, **kwargs):
+        """
+        Store a container as a new version of the object (see PairtreeStorage.store)
+        :param identifier: identifier
+        :param source_file_path: source file path
+        :param kwargs: further arguments of PairtreeStorage.store_container (index, mode)
+        :return: StoredContainer (version, number of bytes written)
+        """
+        # versions of an identifier are allocated one at a time
+        async with self._lock(identifier):
+            return await self._run(lambda: self.storage.store_container(identifier, source_file_path, **kwargs))
+
+
+class S3AsyncBackend(AsyncStorageBackend):
+    """
+    Asynchronous storage backend for an S3-compatible object store (requires boto3). Files larger than the multipart
+    threshold are uploaded (and downloaded) in parts; parts of a file are transferred concurrently as well.
+    """
+
+    def __init__(self, bucket, client=None, prefix="", max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 multipart_threshold=MULTIPART_THRESHOLD, multipart_chunksize=MULTIPART_CHUNKSIZE,
+                 part_concurrency=4, **client_kwargs):
+        """
+        Constructor
+        :param bucket: bucket name
+        :param client: S3 client (default: boto3 client created using the client arguments)
+        :param prefix: prefix of all keys in the bucket (e.g. 'repository/')
+        :param max_concurrency: maximum number of concurrent storage operations
+        :param multipart_threshold: size from which files are transferred in parts
+        :param multipart_chunksize: size of the parts
+        :param part_concurrency: number of parts of a file transferred concurrently
+        :param client_kwargs: arguments of the boto3 client (e.g. endpoint_url of a MinIO server)
+        """
+        assert not s3_disabled, "boto3 module is not available!"
+        super().__init__(max_concurrency)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client if client else boto3.client("s3", **client_kwargs)
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize,
+                                              max_concurrency=part_concurrency, use_threads=part_concurrency > 1)
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError("Object not found: %s" % key) from e
+            raise
+
+    def _put(self, key, source_file_path):
+        self.client.upload_file(source_file_path, self.bucket, self.prefix + key, Config=self.transfer_config)
+        return os.path.getsize(source_file_path)
+
+    def _get(self, key, target_file_path):
+        self._head(key)
+        os.makedirs(os.path.dirname(os.path.abspath(target_file_path)), exist_ok=True)
+        self.client.download_file(self.bucket, self.prefix + key, target_file_path, Config=self.transfer_config)
+        return os.path.getsize(target_file_path)
+
+    def _list(self, prefix):
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            keys.extend(obj["Key"][len(self.prefix):] for obj in page.get("Contents", []))
+        return keys
+
+    def _exists(self, key):
+        try:
+            self._head(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _stat(self, key):
+        head = self._head(key)
+        return StorageObjectInfo(key, head["ContentLength"], head["LastModified"].timestamp())
@@ -2,9 +2,16 @@
 # -*- coding: utf-8 -*-
 import hashlib
 import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from eatb import logger
-from eatb.utils.fileutils import fsize
+from eatb.fixity_cache import FixityCache, DEFAULT_MAX_ENTRIES
+from eatb.utils.fileutils import fsize, copy_file_content
+
+# size of the read buffer used by the hashing engine (1 MiB)
+DEFAULT_BLOCKSIZE = 1024 * 1024
 
 
 class ChecksumAlgorithm:
@@ -24,7 +31,7 @@ class ChecksumAlgorithm:
             return ChecksumAlgorithm.MD5
         if alg.lower() == "sha256" or alg.lower() == "sha-256":
             return ChecksumAlgorithm.SHA256
-        if alg.lower() == "sha256" or alg.lower() == "sha-256":
+        if alg.lower() == "sha512" or alg.lower() == "sha-512":
             return ChecksumAlgorithm.SHA512
         return ChecksumAlgorithm.NONE
 
@@ -34,17 +41,273 @@ class ChecksumAlgorithm:
             return "MD5"
         if alg is ChecksumAlgorithm.SHA256:
             return "SHA256"
-        if alg is ChecksumAlgorithm.SHA256:
+        if alg is ChecksumAlgorithm.SHA512:
             return "SHA512"
         return "NONE"
 
 
+_hashlib_names = {
+    ChecksumAlgorithm.MD5: "md5",
+    ChecksumAlgorithm.SHA256: "sha256",
+    ChecksumAlgorithm.SHA512: "sha512",
+}
+
+_buffers = threading.local()
+
+# persistent fixity cache (opt-in, see enable_fixity_cache)
+_fixity_cache = None
+
+
+def hashlib_name(checksum_algorithm):
+    """
+    Get the hashlib name of a checksum algorithm
+    :param checksum_algorithm: ChecksumAlgorithm value or algorithm string (e.g. 'SHA-256', 'sha512', 'MD5')
+    :return: hashlib algorithm name
+    :except ValueError: if the algorithm is not supported
+    """
+    alg = checksum_algorithm
+    if isinstance(alg, str):
+        alg = ChecksumAlgorithm.get(alg)
+    if alg not in _hashlib_names:
+        raise ValueError("Unsupported checksum algorithm: %s" % checksum_algorithm)
+    return _hashlib_names[alg]
+
+
+def _read_buffer(blocksize):
+    """
+    Get the read buffer of the current thread (allocated once and reused for subsequent calls)
+    :param blocksize: buffer size
+    :return: memoryview of the buffer
+    """
+    buf = getattr(_buffers, "buf", None)
+    if buf is None or len(buf) != blocksize:
+        buf = memoryview(bytearray(blocksize))
+        _buffers.buf = buf
+    return buf
+
+
+def _compute_digests(file_path, algorithms, blocksize=DEFAULT_BLOCKSIZE):
+    """
+    Read a file once and compute the digests of all algorithms (fixity cache is not consulted)
+    :param file_path: Path to file
+    :param algorithms: Algorithms (ChecksumAlgorithm values or algorithm strings)
+    :param blocksize: Size of the read buffer
+    :return: Dictionary of hex digests, keyed by the algorithms as passed
+    """
+    hashers = [(alg, hashlib.new(hashlib_name(alg))) for alg in algorithms]
+    buf = _read_buffer(blocksize)
+    with open(file_path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            chunk = buf[:n]
+            for _, hashval in hashers:
+                hashval.update(chunk)
+    return {alg: hashval.hexdigest() for alg, hashval in hashers}
+
+
+def enable_fixity_cache(db_path, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Enable the persistent fixity cache which is consulted before a file is read by the hashing functions.
+    e.g. enable_fixity_cache(os.path.join(working_dir, ".fixity-cache.sqlite"))
+    :param db_path: Path to the SQLite cache database
+    :param max_entries: Maximum number of cached digests
+    :return: Fixity cache
+    """
+    global _fixity_cache
+    disable_fixity_cache()
+    _fixity_cache = FixityCache(db_path, max_entries)
+    return _fixity_cache
+
+
+def disable_fixity_cache():
+    """
+    Disable (and close) the persistent fixity cache
+    """
+    global _fixity_cache
+    if _fixity_cache is not None:
+        _fixity_cache.close()
+        _fixity_cache = None
+
+
+def get_fixity_cache():
+    """
+    Get the fixity cache
+    :return: Fixity cache or None if the cache is not enabled
+    """
+    return _fixity_cache
+
+
+def _cached_digests(file_path, algorithms):
+    """
+    Get digests from the fixity cache
+    :return: Dictionary of hex digests, keyed by the algorithms as passed, or None if not cached
+    """
+    if _fixity_cache is None:
+        return None
+    cached = _fixity_cache.lookup(file_path, [hashlib_name(alg) for alg in algorithms])
+    if cached is None:
+        return None
+    return {alg: cached[hashlib_name(alg)] for alg in algorithms}
+
+
+def _cache_digests(file_path, digests, stat=None):
+    """
+    Store digests in the fixity cache (if enabled)
+    """
+    if _fixity_cache is not None:
+        _fixity_cache.store(file_path, {hashlib_name(alg): digest for alg, digest in digests.items()}, stat)
+
+
+def _stat_key(file_path):
+    st = os.stat(file_path)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def hash_file(file_path, algorithms=(ChecksumAlgorithm.SHA256,), blocksize=DEFAULT_BLOCKSIZE):
+    """
+    Compute the digests of a file for any set of algorithms reading the file only once. If the fixity cache is
+    enabled, cached digests are returned without reading the file as long as the file is unchanged.
+    e.g. hash_file("/tmp/test.txt", ["sha512", "md5"]) returns {"sha512": "...", "md5": "..."}
+    :param file_path: Path to file
+    :param algorithms: Algorithms (ChecksumAlgorithm values or algorithm strings)
+    :param blocksize: Size of the read buffer
+    :return: Dictionary of hex digests, keyed by the algorithms as passed
+    """
+    if _fixity_cache is None:
+        return _compute_digests(file_path, algorithms, blocksize)
+    digests = _cached_digests(file_path, algorithms)
+    if digests is None:
+        stat = _stat_key(file_path)
+        digests = _compute_digests(file_path, algorithms, blocksize)
+        _cache_digests(file_path, digests, stat)
+    return digests
+
+
+def _hash_file_task(task):
+    """
+    Worker task of the parallel hashing functions (module level so that it can be pickled by process pools)
+    :param task: tuple (file path, algorithms, blocksize)
+    :return: tuple (file path, digests)
+    """
+    file_path, algorithms, blocksize = task
+    return file_path, _compute_digests(file_path, algorithms, blocksize)
+
+
+def hash_files(file_paths, algorithms=(ChecksumAlgorithm.SHA256,), workers=None, executor="thread",
+               blocksize=DEFAULT_BLOCKSIZE):
+    """
+    Compute the digests of a list of files using a pool of workers.
+    :param file_paths: List of file paths
+    :param algorithms: Algorithms (ChecksumAlgorithm values or algorithm strings)
+    :param workers: Number of workers (default: number of CPUs, 1 means sequential processing)
+    :param executor: "thread" (hashlib releases the GIL while hashing large buffers) or "process"
+    :param blocksize: Size of the read buffer
+    :return: Dictionary mapping each file path to the dictionary of its hex digests
+    """
+    if executor not in ("thread", "process"):
+        raise ValueError("Unsupported executor: %s (must be 'thread' or 'process')" % executor)
+    algorithms = list(algorithms)
+    result = {}
+    stats = {}
+    if _fixity_cache is not None:
+        # the cache is consulted (and updated) by the calling process only
+        for file_path in file_paths:
+            digests = _cached_digests(file_path, algorithms)
+            if digests is None:
+                stats[file_path] = _stat_key(file_path)
+            else:
+                result[file_path] = digests
+        file_paths = list(stats.keys())
+    tasks = [(file_path, algorithms, blocksize) for file_path in file_paths]
+    workers = workers if workers else (os.cpu_count() or 1)
+    if workers <= 1 or len(tasks) <= 1:
+        result.update(map(_hash_file_task, tasks))
+    elif executor == "process":
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            result.update(pool.map(_hash_file_task, tasks, chunksize=chunksize))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            result.update(pool.map(_hash_file_task, tasks))
+    for file_path, stat in stats.items():
+        _cache_digests(file_path, result[file_path], stat)
+    return result
+
+
+def hash_tree(root, algorithms=(ChecksumAlgorithm.SHA256,), workers=None, executor="thread",
+              blocksize=DEFAULT_BLOCKSIZE):
+    """
+    Walk a directory and compute the digests of all files using a pool of workers.
+    e.g. hash_tree("/tmp/package", ["sha512", "md5"], workers=8)
+    :param root: Root directory
+    :param algorithms: Algorithms (ChecksumAlgorithm values or algorithm strings)
+    :param workers: Number of workers (default: number of CPUs, 1 means sequential processing)
+    :param executor: "thread" or "process"
+    :param blocksize: Size of the read buffer
+    :return: Dictionary mapping each file path (os.path.join of the walked directory and file name) to the
+             dictionary of its hex digests
+    """
+    file_paths = [os.path.join(top, fn) for top, _, files in os.walk(root) for fn in files]
+    return hash_files(file_paths, algorithms, workers, executor, blocksize)
+
+
+class HashingWriter():
+    """
+    Writable file object wrapper computing the digests of all data written through it, so that the digests of a
+    file are available as soon as it is written, without reading it again.
+    e.g. with open("/tmp/test.tar", "wb") as f:
+             writer = HashingWriter(f, [ChecksumAlgorithm.SHA256])
+             writer.write(data)
+         writer.hexdigest(ChecksumAlgorithm.SHA256)
+    """
+
+    def __init__(self, fileobj, algorithms=(ChecksumAlgorithm.SHA256,)):
+        """
+        Constructor
+        :param fileobj: Writable binary file object
+        :param algorithms: Algorithms (ChecksumAlgorithm values or algorithm strings)
+        """
+        self.fileobj = fileobj
+        self.algorithms = list(algorithms)
+        self.hashers = [hashlib.new(hashlib_name(alg)) for alg in self.algorithms]
+        self.bytes_written = 0
+
+    def write(self, data):
+        for hasher in self.hashers:
+            hasher.update(data)
+        self.bytes_written += len(data)
+        return self.fileobj.write(data)
+
+    def tell(self):
+        return self.bytes_written
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def hexdigest(self, algorithm):
+        """
+        Get the digest of the data written so far
+        :param algorithm: Algorithm (as passed to the constructor)
+        :return: hex digest
+        """
+        return self.hashers[self.algorithms.index(algorithm)].hexdigest()
+
+    def hexdigests(self):
+        """
+        Get the digests of the data written so far
+        :return: Dictionary of hex digests, keyed by the algorithms as passed to the constructor
+        """
+        return {alg: hasher.hexdigest() for alg, hasher in zip(self.algorithms, self.hashers)}
+
+
 class ChecksumFile():
     """
     Checksum validation
     """
 
-    blocksize = 65536
+    blocksize = DEFAULT_BLOCKSIZE
 
     def __init__(self, file_path):
         """
@@ -59,21 +322,15 @@ class ChecksumFile():
         :param checksum_algorithm: Algorithm used to create the checksum
         :return: Checksum string
         """
-        hashval = None
-        if checksum_algorithm in [ChecksumAlgorithm.SHA256, 'SHA-256']:
-            hashval = hashlib.sha256()
-        if checksum_algorithm in [ChecksumAlgorithm.SHA512, 'SHA-512']:
-            hashval = hashlib.sha512()
-        elif checksum_algorithm in [ChecksumAlgorithm.MD5, 'MD5']:
-            hashval = hashlib.md5()
+        return hash_file(self.file_path, [checksum_algorithm], self.blocksize)[checksum_algorithm]
 
-        with open(self.file_path, 'rb') as f:
-            while True:
-                buf = f.read(self.blocksize)
-                if not buf:
-                    break
-                hashval.update(buf)
-        return hashval.hexdigest()
+    def get_all(self, checksum_algorithms):
+        """
+        This function calculates the checksums for several algorithms reading the file only once.
+        :param checksum_algorithms: Algorithms used to create the checksums
+        :return: Dictionary of checksum strings keyed by algorithm
+        """
+        return hash_file(self.file_path, checksum_algorithms, self.blocksize)
 
 
 class ChecksumValidation():
@@ -100,21 +357,7 @@ def get_hash(file, checksum_algorithm):
     :param file: Path to file
     :return: MD5/SHA256/SHA512 hash
     """
-    blocksize = 65536
-    hashval = None
-    if checksum_algorithm in [ChecksumAlgorithm.SHA256, 'SHA-256']:
-        hashval = hashlib.sha256()
-    if checksum_algorithm in [ChecksumAlgorithm.SHA512, 'SHA-512']:
-        hashval = hashlib.sha512()
-    elif checksum_algorithm in [ChecksumAlgorithm.MD5, 'MD5']:
-        hashval = hashlib.md5()
-    with open(file, 'rb') as file:
-        while True:
-            buf = file.read(blocksize)
-            if not buf:
-                break
-            hashval.update(buf)
-    return hashval.hexdigest()
+    return hash_file(file, [checksum_algorithm])[checksum_algorithm]
 
 
 def get_hash_values(file):
@@ -123,19 +366,9 @@ def get_hash_values(file):
     :param file: Path to file
     :return: MD5/SHA256/SHA512 hash
     """
-    blocksize = 65536
-    hashval_sha256 = hashlib.sha256()
-    hashval_md5 = hashlib.md5()
-    hashval_sha512 = hashlib.sha512()
-    with open(file, 'rb') as file:
-        while True:
-            buf = file.read(blocksize)
-            if not buf:
-                break
-            hashval_md5.update(buf)
-            hashval_sha256.update(buf)
-            hashval_sha512.update(buf)
-    return hashval_md5.hexdigest(), hashval_sha256.hexdigest(), hashval_sha512.hexdigest()
+    digests = hash_file(file, [ChecksumAlgorithm.MD5, ChecksumAlgorithm.SHA256, ChecksumAlgorithm.SHA512])
+    return digests[ChecksumAlgorithm.MD5], digests[ChecksumAlgorithm.SHA256], digests[ChecksumAlgorithm.SHA512]
+
 
 def get_md5_hash(file):
     """
@@ -177,28 +410,102 @@ def checksum(file_path, wd=None, alg=ChecksumAlgorithm.SHA256):
     return ChecksumFile(path).get(alg)
 
 
-def check_transfer(source, target):
+def _drop_cached_pages(file_path, sync=False):
     """
-    Check successful transfer by comparing checksum values and file sizes of source and target
-    :param file_path: file path
-    :param wd: working directory
-    :param alg: algorithm
+    Drop the cached pages of a file from the page cache (posix_fadvise DONTNEED, if supported)
+    :param file_path: Path to file
+    :param sync: write dirty pages first (only clean pages can be dropped)
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        if sync:
+            os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _hash_file_uncached(file_path, algorithm):
+    """
+    Compute the digest of a file reading it from the storage device rather than from the page cache where possible;
+    the cached pages are dropped before and after the file is read, so that the verification does not pollute the
+    page cache either.
+    :param file_path: Path to file
+    :param algorithm: Algorithm
+    :return: hex digest
+    """
+    _drop_cached_pages(file_path, sync=True)
+    digest = _compute_digests(file_path, [algorithm])[algorithm]
+    _drop_cached_pages(file_path)
+    return digest
+
+
+def verified_transfer(source, target, algorithm=ChecksumAlgorithm.SHA256, progress_reporter=None,
+                      preserve_metadata=True):
+    """
+    Copy a file and verify the copy. The digest of the source is computed while the file is copied (single read of
+    the source), the target is verified by reading it once. If the fixity cache is enabled, the digest is cached for
+    source and target.
+    :param source: Source file path
+    :param target: Target file path
+    :param algorithm: Algorithm (ChecksumAlgorithm value or algorithm string)
+    :param progress_reporter: progress reporter of the copy (percentage)
+    :param preserve_metadata: copy permission bits and timestamps of the source (like shutil.copy2)
+    :except ValueError: if size or digest of source and target are not equal
+    :return: hex digest of the transferred file (e.g. to be recorded as PREMIS fixity)
+    """
+    source_stat = _stat_key(source)
+    copied, digests = copy_file_content(source, target, [algorithm], progress_reporter)
+    if preserve_metadata:
+        shutil.copystat(source, target)
+    source_digest = digests[algorithm]
+    target_size = fsize(target)
+    if not copied == target_size:
+        raise ValueError("Size of source file (%d bytes) and size of target file (%d bytes) are not equal" %
+                         (copied, target_size))
+    if not source_digest == _hash_file_uncached(target, algorithm):
+        raise ValueError("Checksums of source %s and target %s are not equal" % (source, target))
+    _cache_digests(source, {algorithm: source_digest}, source_stat)
+    _cache_digests(target, {algorithm: source_digest})
+    return source_digest
+
+
+def check_transfer(source, target, source_digest=None, algorithm=ChecksumAlgorithm.SHA256):
+    """
+    Check successful transfer by comparing checksum values and file sizes of source and target; the files are only
+    read if the sizes are equal.
+    :param source: Source file path
+    :param target: Target file path
+    :param source_digest: Digest of the source if known (e.g. computed during the transfer), the source is not read
+                          again in this case
+    :param algorithm: Algorithm (ChecksumAlgorithm value or algorithm string)
     :except Different file sizes or checksum values
-    :return: None
+    :return: hex digest of the target
     """
     source_size = fsize(source)
     target_size = fsize(target)
     if not source_size == target_size:
         raise ValueError("Size of source file (%d bytes) and size of target file (%d bytes) are not equal" %
                          (source_size, target_size))
-    if not ChecksumFile(source).get(ChecksumAlgorithm.SHA256) == ChecksumFile(target).get(ChecksumAlgorithm.SHA256):
+    if source_digest is None:
+        source_digest = hash_file(source, [algorithm])[algorithm]
+    target_digest = hash_file(target, [algorithm])[algorithm]
+    if not source_digest == target_digest:
         raise ValueError("Checksums of source %s and target %s are not equal" % (source, target))
+    return target_digest
 
 
 def files_identical(file1, file2):
     if not (os.path.exists(file1) and os.path.exists(file2)):
         logger.error("Files must both exist to verify if they are identical: %s, %s" % (file1, file2))
         return False
+    if fsize(file1) != fsize(file2):
+        logger.debug("Files differ in size: %s, %s" % (file1, file2))
+        return False
     checksum_source_file = ChecksumFile(file1).get('SHA-256')
     checksum_target_file = ChecksumFile(file2).get('SHA-256')
     logger.debug("f1: %s, f2: %s" % (file1, file2))
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import gzip
+import lzma
+import os
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+    zstd_disabled = False
+except ImportError:
+    zstd_disabled = True
+
+# size of the independently compressed blocks of the parallel gzip codec (4 MiB)
+PARALLEL_GZIP_BLOCKSIZE = 4 * 1024 * 1024
+
+
+class CompressionCodec(ABC):
+    """
+    Compression codec of container packages. Writers and readers wrap a binary file object; closing them does not
+    close the wrapped file object.
+    """
+
+    name = None
+    extension = None
+    default_level = None
+
+    def __init__(self, level=None, workers=None):
+        """
+        Constructor
+        :param level: compression level (codec default if not provided)
+        :param workers: number of compression threads (used by multi-threaded codecs only, default: number of CPUs)
+        """
+        self.level = self.default_level if level is None else level
+        self.workers = workers if workers else (os.cpu_count() or 1)
+
+    @abstractmethod
+    def writer(self, fileobj):
+        pass
+
+    @abstractmethod
+    def reader(self, fileobj):
+        pass
+
+    @staticmethod
+    def factory(name, level=None, workers=None):
+        """
+        Get compression codec by name
+        :param name: codec name ('gzip', 'pgzip', 'xz' or 'zstd')
+        :param level: compression level
+        :param workers: number of compression threads
+        :return: compression codec
+        :except ValueError: if the codec is unknown or not available
+        """
+        codecs = {codec.name: codec for codec in [GzipCodec, ParallelGzipCodec, XzCodec, ZstdCodec]}
+        if name not in codecs:
+            raise ValueError("Unsupported compression: %s" % name)
+        if name == ZstdCodec.name and zstd_disabled:
+            raise ValueError("Compression 'zstd' requires the 'zstandard' package")
+        return codecs[name](level, workers)
+
+
+class GzipCodec(CompressionCodec):
+    """
+    gzip compression (zlib levels 1-9)
+    """
+    name = "gzip"
+    extension = ".tar.gz"
+    default_level = 6
+
+    def writer(self, fileobj):
+        return gzip.GzipFile(filename="", mode="wb", compresslevel=self.level, fileobj=fileobj)
+
+    def reader(self, fileobj):
+        return gzip.GzipFile(mode="rb", fileobj=fileobj)
+
+
+class ParallelGzipCodec(GzipCodec):
+    """
+    Multi-threaded gzip compression: the data is split into blocks which are compressed on multiple cores as
+    independent gzip members. The concatenation of gzip members is a valid gzip file which can be read by any gzip
+    decompressor.
+    """
+    name = "pgzip"
+
+    def writer(self, fileobj):
+        return ParallelGzipWriter(fileobj, self.level, self.workers)
+
+
+class XzCodec(CompressionCodec):
+    """
+    xz (LZMA2) compression (presets 0-9)
+    """
+    name = "xz"
+    extension = ".tar.xz"
+    default_level = 6
+
+    def writer(self, fileobj):
+        return lzma.LZMAFile(fileobj, mode="wb", preset=self.level)
+
+    def reader(self, fileobj):
+        return lzma.LZMAFile(fileobj, mode="rb")
+
+
+class ZstdCodec(CompressionCodec):
+    """
+    Zstandard compression (levels 1-22, requires the 'zstandard' package), compressing on multiple cores
+    """
+    name = "zstd"
+    extension = ".tar.zst"
+    default_level = 3
+
+    def writer(self, fileobj):
+        compressor = zstandard.ZstdCompressor(level=self.level, threads=self.workers if self.workers > 1 else 0)
+        return compressor.stream_writer(fileobj, closefd=False)
+
+    def reader(self, fileobj):
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+
+
+class ParallelGzipWriter():
+    """
+    Writable file object compressing blocks of data as independent gzip members using a pool of threads (zlib
+    releases the GIL while compressing). The members are written in order; the number of blocks in progress is
+    bounded.
+    """
+
+    def __init__(self, fileobj, level=GzipCodec.default_level, workers=None, blocksize=PARALLEL_GZIP_BLOCKSIZE):
+        self.fileobj = fileobj
+        self.level = level
+        self.workers = workers if workers else (os.cpu_count() or 1)
+        self.blocksize = blocksize
+        self.buffer = bytearray()
+        self.pending = deque()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.closed = False
+
+    def _compress(self, block):
+        return gzip.compress(block, compresslevel=self.level, mtime=0)
+
+    def _submit(self, block):
+        self.pending.append(self.pool.submit(self._compress, block))
+        while len(self.pending) > self.workers * 2:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.blocksize:
+            self._submit(bytes(self.buffer[:self.blocksize]))
+            del self.buffer[:self.blocksize]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.buffer or not self.pending:
+                self._submit(bytes(self.buffer))
+                self.buffer = bytearray()
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().result())
+        finally:
+            self.pool.shutdown()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
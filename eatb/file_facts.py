@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from collections import namedtuple
+from mimetypes import MimeTypes
+
+from eatb.checksum import ChecksumAlgorithm, hash_files, hashlib_name
+from eatb.fixity_cache import RACY_WINDOW_NS
+from eatb.utils.datetime import get_timestamp_iso_date_str, DT_ISO_FMT_SEC_PREC
+
+FileFact = namedtuple("FileFact", ["path", "size", "mtime_ns", "ctime", "mimetype", "digests", "inode", "ctime_ns"])
+
+
+class PackageFileFacts:
+    """
+    File facts (size, ctime, mime type, PUID, digests) of all files of an information package, collected by a single
+    scan of the package directory. The facts can be passed to the METS and PREMIS generators so that every file is
+    hashed and identified only once per package.
+
+    A fact is only returned as long as inode, size, modification and change time of the file are unchanged; files
+    created or modified after the scan (e.g. generated METS and PREMIS files) are not covered and must be processed
+    by the caller. Files modified less than RACY_WINDOW_NS before the scan are not covered either, because a later
+    modification within the timestamp granularity of the file system would not be detected.
+    """
+
+    mime = MimeTypes()
+
+    def __init__(self, root_path, algorithms=(ChecksumAlgorithm.SHA256,), workers=1, format_identification=None):
+        """
+        Constructor
+        :param root_path: root path of the information package
+        :param algorithms: digest algorithms computed for each file
+        :param workers: number of workers used to compute the digests in parallel
+        :param format_identification: FormatIdentification object used for PUID identification (optional)
+        """
+        self.root_path = root_path
+        self.algorithms = [hashlib_name(alg) for alg in algorithms]
+        self.workers = workers
+        self.format_identification = format_identification
+        self.facts = {}
+        self.puids = {}
+        self.lock = threading.Lock()
+
+    def scan(self):
+        """
+        Scan the package directory, stat and hash every file (except recently modified files, see RACY_WINDOW_NS)
+        :return: self
+        """
+        stats = {}
+        scan_time_ns = time.time_ns()
+        for top, _, files in os.walk(self.root_path):
+            for fn in files:
+                file_path = os.path.join(top, fn)
+                st = os.stat(file_path)
+                if scan_time_ns - st.st_mtime_ns >= RACY_WINDOW_NS:
+                    stats[file_path] = st
+        digests = hash_files(list(stats.keys()), self.algorithms, workers=self.workers)
+        for file_path, st in stats.items():
+            mimetype, _ = self.mime.guess_type(os.path.relpath(file_path, self.root_path))
+            self.facts[os.path.abspath(file_path)] = FileFact(
+                path=file_path, size=st.st_size, mtime_ns=st.st_mtime_ns, ctime=st.st_ctime,
+                mimetype=mimetype if mimetype else "application/octet-stream", digests=digests[file_path],
+                inode=st.st_ino, ctime_ns=st.st_ctime_ns)
+        return self
+
+    def subset(self, path):
+        """
+        Get the facts of the files below a directory (e.g. a representation) which can be passed to a worker process;
+        the format identification and the PUIDs identified so far are not included, the worker identifies the formats.
+        :param path: directory path
+        :return: PackageFileFacts
+        """
+        prefix = os.path.join(os.path.abspath(path), "")
+        file_facts = PackageFileFacts(self.root_path, workers=self.workers)
+        file_facts.algorithms = self.algorithms
+        file_facts.facts = {k: v for k, v in self.facts.items() if k.startswith(prefix)}
+        return file_facts
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get(self, file_path):
+        """
+        Get the facts of a file
+        :param file_path: file path
+        :return: FileFact or None if the file was not scanned or changed since the scan
+        """
+        fact = self.facts.get(os.path.abspath(file_path))
+        if fact is None:
+            return None
+        try:
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        if (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns) != \
+                (fact.inode, fact.size, fact.mtime_ns, fact.ctime_ns):
+            return None
+        return fact
+
+    def digest(self, file_path, algorithm=ChecksumAlgorithm.SHA256):
+        """
+        Get the digest of a file
+        :param file_path: file path
+        :param algorithm: digest algorithm
+        :return: hex digest or None if not available
+        """
+        fact = self.get(file_path)
+        if fact is None:
+            return None
+        return fact.digests.get(hashlib_name(algorithm))
+
+    def created(self, file_path, fmt=DT_ISO_FMT_SEC_PREC):
+        """
+        Get the formatted ctime of a file
+        :param file_path: file path
+        :param fmt: date format
+        :return: formatted date string or None if not available
+        """
+        fact = self.get(file_path)
+        if fact is None:
+            return None
+        return get_timestamp_iso_date_str(fact.ctime, fmt)
+
+    def puid(self, file_path):
+        """
+        Get the PRONOM identifier of a file; the format is identified on first request only.
+        :param file_path: file path
+        :return: PUID or None if format identification is not available or the file is unknown/changed
+        """
+        if self.format_identification is None or self.get(file_path) is None:
+            return None
+        key = os.path.abspath(file_path)
+        with self.lock:
+            if key not in self.puids:
+                self.puids[key] = self.format_identification.identify_file(file_path)
+            return self.puids[key]
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+import time
+
+from eatb import logger
+
+# default maximum number of cached digests
+DEFAULT_MAX_ENTRIES = 1000000
+
+# number of last access times recorded in memory before they are written to the database
+ACCESS_BATCH_SIZE = 1000
+
+# files modified less than this number of nanoseconds before they were hashed are not cached, because a later
+# modification within the timestamp granularity of the file system would not be detected
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+
+class FixityCache:
+    """
+    Persistent fixity cache (SQLite) storing file digests keyed by (path, inode, size, mtime_ns). A cached digest is
+    only returned as long as inode, size and modification time of the file are unchanged. If the number of cached
+    digests exceeds the size cap, the least recently used entries are evicted.
+
+    The size cap is a soft limit: it is checked after every max_entries/10 inserted digests and when the cache is
+    closed, so the cache can temporarily hold up to 10% more entries. Lookups do not write to the database, the last
+    access times are recorded in memory and written in batches (ACCESS_BATCH_SIZE), before an eviction and when the
+    cache is closed.
+    """
+
+    def __init__(self, db_path, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Constructor opens (or creates) the cache database
+        :param db_path: Path to the SQLite database file (e.g. a file in the package working directory)
+        :param max_entries: Maximum number of cached digests (soft limit, see above)
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.inserts = 0
+        self.accessed = {}
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fixity ("
+            "path TEXT NOT NULL, algorithm TEXT NOT NULL, inode INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL, last_access INTEGER NOT NULL, "
+            "PRIMARY KEY (path, algorithm))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS fixity_last_access ON fixity (last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def _stat(file_path):
+        st = os.stat(file_path)
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def lookup(self, file_path, algorithms):
+        """
+        Get cached digests of a file
+        :param file_path: Path to file
+        :param algorithms: hashlib algorithm names (e.g. ['sha256', 'md5'])
+        :return: Dictionary of hex digests keyed by algorithm name if digests for all algorithms are cached and the
+                 file is unchanged, None otherwise
+        """
+        path = os.path.abspath(file_path)
+        inode, size, mtime_ns = self._stat(path)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT algorithm, digest FROM fixity WHERE path = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                (path, inode, size, mtime_ns)).fetchall()
+            digests = {algorithm: digest for algorithm, digest in rows}
+            if not all(algorithm in digests for algorithm in algorithms):
+                return None
+            self.accessed[path] = time.time_ns()
+            if len(self.accessed) >= ACCESS_BATCH_SIZE:
+                self._flush_accessed()
+                self.conn.commit()
+        return {algorithm: digests[algorithm] for algorithm in algorithms}
+
+    def store(self, file_path, digests, stat=None):
+        """
+        Store digests of a file
+        :param file_path: Path to file
+        :param digests: Dictionary of hex digests keyed by hashlib algorithm name
+        :param stat: tuple (inode, size, mtime_ns) taken before the file was read; if the file was modified in the
+                     meantime, the digests are not stored
+        """
+        path = os.path.abspath(file_path)
+        current = self._stat(path)
+        if stat is not None and stat != current:
+            logger.debug("File changed while it was hashed, not caching digests: %s" % path)
+            return
+        inode, size, mtime_ns = current
+        if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+            return
+        last_access = time.time_ns()
+        with self.lock:
+            self.conn.execute("DELETE FROM fixity WHERE path = ? AND (inode != ? OR size != ? OR mtime_ns != ?)",
+                              (path, inode, size, mtime_ns))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO fixity (path, algorithm, inode, size, mtime_ns, digest, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(path, algorithm, inode, size, mtime_ns, digest, last_access)
+                 for algorithm, digest in digests.items()])
+            self.accessed.pop(path, None)
+            self.inserts += len(digests)
+            if self.inserts >= max(1, self.max_entries // 10):
+                self.inserts = 0
+                self._evict()
+            self.conn.commit()
+
+    def _flush_accessed(self):
+        """
+        Write the last access times recorded by lookups to the database (caller holds the lock and commits)
+        """
+        if self.accessed:
+            self.conn.executemany("UPDATE fixity SET last_access = ? WHERE path = ?",
+                                  [(last_access, path) for path, last_access in self.accessed.items()])
+            self.accessed = {}
+
+    def _evict(self):
+        """
+        Evict the least recently used entries if the size cap is exceeded (caller holds the lock)
+        """
+        self._flush_accessed()
+        count = self.conn.execute("SELECT COUNT(*) FROM fixity").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM fixity WHERE rowid IN (SELECT rowid FROM fixity ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,))
+
+    def invalidate(self, file_path):
+        """
+        Remove the cached digests of a file
+        :param file_path: Path to file
+        """
+        with self.lock:
+            self.accessed.pop(os.path.abspath(file_path), None)
+            self.conn.execute("DELETE FROM fixity WHERE path = ?", (os.path.abspath(file_path),))
+            self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM fixity").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self._evict()
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from eatb.checksum import hash_file, ChecksumAlgorithm
+
+
+def format_mtime(mtime_ns):
+    """
+    Format a modification time like summain does (e.g. '2024-11-28 09:15:02.123456789 +0000')
+    :param mtime_ns: modification time in nanoseconds since the epoch
+    :return: formatted modification time
+    """
+    seconds, nanoseconds = divmod(mtime_ns, 10 ** 9)
+    return "%s.%09d +0000" % (time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds)), nanoseconds)
+
+
+def _walk_entries(directory):
+    """
+    Walk a directory and get (path, stat, is_file) tuples in a stable order (directories before their content)
+    :param directory: directory
+    :return: generator of (path, stat result, is regular file)
+    """
+    for top, dirs, files in os.walk(directory):
+        dirs.sort()
+        yield top, os.lstat(top), False
+        for fn in sorted(files):
+            path = os.path.join(top, fn)
+            st = os.lstat(path)
+            yield path, st, os.path.isfile(path) and not os.path.islink(path)
+
+
+def _entry(path, st, digest=None):
+    entry = {"Name": path, "Mtime": format_mtime(st.st_mtime_ns), "Size": str(st.st_size)}
+    if digest:
+        entry["SHA256"] = digest
+    return entry
+
+
+def _pending_entry(item):
+    path, st, future = item
+    return _entry(path, st, future.result()[ChecksumAlgorithm.SHA256] if future else None)
+
+
+def manifest_entries(directory, workers=None):
+    """
+    Get the manifest entries of a directory (summain schema: Name, Mtime, Size and, for files, SHA256). The files are
+    hashed by a pool of threads, the entries are yielded in walk order while only a bounded number of files is in
+    progress, so that the memory consumption does not depend on the number of files.
+    :param directory: directory
+    :param workers: number of hashing threads (default: number of CPUs)
+    :return: generator of manifest entries (dict)
+    """
+    workers = workers if workers else (os.cpu_count() or 1)
+    if workers <= 1:
+        for path, st, is_file in _walk_entries(directory):
+            yield _entry(path, st, hash_file(path, [ChecksumAlgorithm.SHA256])[ChecksumAlgorithm.SHA256]
+                         if is_file else None)
+        return
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, st, is_file in _walk_entries(directory):
+            future = pool.submit(hash_file, path, [ChecksumAlgorithm.SHA256]) if is_file else None
+            pending.append((path, st, future))
+            while len(pending) > workers * 4:
+                yield _pending_entry(pending.popleft())
+        while pending:
+            yield _pending_entry(pending.popleft())
+
+
+def write_manifest(directory, manifest_file, json_lines=False, workers=None):
+    """
+    Write the manifest of a directory incrementally.
+    :param directory: directory
+    :param manifest_file: manifest file path
+    :param json_lines: write one JSON object per line (JSON Lines) instead of a JSON array
+    :param workers: number of hashing threads (default: number of CPUs)
+    :return: number of manifest entries
+    """
+    num_entries = 0
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        if not json_lines:
+            f.write("[")
+        for entry in manifest_entries(directory, workers):
+            if json_lines:
+                f.write(json.dumps(entry))
+                f.write("\n")
+            else:
+                f.write(",\n" if num_entries else "\n")
+                f.write(json.dumps(entry))
+            num_entries += 1
+        if not json_lines:
+            f.write("\n]\n")
+    return num_entries
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import itertools
+import threading
+import uuid
+
+
+class IdScheme:
+    """
+    Schemes for the generation of XML element IDs (METS and PREMIS)
+    """
+    UUID4 = "uuid4"  # random UUID (default)
+    COUNTER = "counter"  # sequence number, restarted for every document
+    UUID5 = "uuid5"  # name-based UUID derived from a seed (e.g. OBJID) and the element key (e.g. file path)
+
+
+class IdFactory:
+    """
+    Factory for XML element IDs ('ID' followed by a random UUID). The generators call reset() before a document is
+    created and the factory with a key identifying the element (element name and, if available, the path of the
+    described file); the key is ignored by this scheme.
+    """
+
+    prefix = "ID"
+
+    def reset(self, seed=None):
+        """
+        Start a new document
+        :param seed: seed of the document (e.g. the OBJID), used if no seed was given to the constructor
+        """
+        pass
+
+    def __call__(self, *key):
+        """
+        Get a new ID
+        :param key: parts of the element key
+        :return: ID
+        """
+        return self.prefix + uuid.uuid4().__str__()
+
+
+class CounterIdFactory(IdFactory):
+    """
+    Factory for sequential IDs (ID00000001, ID00000002, ...). Cheap and reproducible as long as the elements of a
+    document are created in the same order.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+
+    def reset(self, seed=None):
+        with self.lock:
+            self.counter = itertools.count(1)
+
+    def __call__(self, *key):
+        with self.lock:
+            return "%s%08d" % (self.prefix, next(self.counter))
+
+
+class ContentIdFactory(IdFactory):
+    """
+    Factory for name-based IDs: UUIDv5 of the element key in a namespace derived from the seed (e.g. the OBJID of the
+    package). The ID of an element therefore does not change when the METS file of an unchanged package is
+    regenerated. Keys which are requested more than once get an occurrence number appended.
+    """
+
+    def __init__(self, seed=None):
+        """
+        Constructor
+        :param seed: seed of the IDs (default: seed passed to reset)
+        """
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.namespace = uuid.uuid5(uuid.NAMESPACE_URL, seed if seed else "")
+        self.occurrences = {}
+
+    def reset(self, seed=None):
+        with self.lock:
+            self.namespace = uuid.uuid5(uuid.NAMESPACE_URL, self.seed if self.seed else (seed if seed else ""))
+            self.occurrences = {}
+
+    def __call__(self, *key):
+        name = "/".join(str(part) for part in key)
+        with self.lock:
+            occurrence = self.occurrences.get(name, 0)
+            self.occurrences[name] = occurrence + 1
+        if occurrence:
+            name = "%s#%d" % (name, occurrence)
+        return self.prefix + uuid.uuid5(self.namespace, name).__str__()
+
+
+def get_id_factory(scheme=IdScheme.UUID4, seed=None):
+    """
+    Get an ID factory
+    :param scheme: ID scheme (IdScheme value)
+    :param seed: seed of the name-based IDs (UUID5 scheme only, default: OBJID of the generated METS file)
+    :return: IdFactory
+    """
+    if scheme == IdScheme.UUID4:
+        return IdFactory()
+    if scheme == IdScheme.COUNTER:
+        return CounterIdFactory()
+    if scheme == IdScheme.UUID5:
+        return ContentIdFactory(seed)
+    raise ValueError("Unknown ID scheme: %s" % scheme)
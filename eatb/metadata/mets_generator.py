@@ -1,20 +1,62 @@
-import fnmatch
 import os
-import uuid
 from mimetypes import MimeTypes
 from subprocess import PIPE, Popen
 
 from lxml import etree
 
-from eatb.checksum import get_sha256_hash
+from eatb.checksum import get_sha256_hash, hash_files, ChecksumAlgorithm
 from eatb.file_format import FormatIdentification
-from eatb.metadata import logger, M, CSIP_NS, PROFILE_XML, default_mets_schema_location, \
-    default_xlink_schema_location, default_csip_location, folders_with_USE
-from eatb.metadata.mets import get_folder_with_USE
+from eatb.metadata import logger, M, CSIP_NS, METS_NSMAP, PROFILE_XML, default_mets_schema_location, \
+    default_xlink_schema_location, default_csip_location
+from eatb.metadata.identifiers import IdFactory
+from eatb.metadata.package_scan import scan_package, PackageFile, PackageFileKind
+from eatb.metadata.parsed_mets import ParsedMets
 from eatb.metadata.mets_validation import XLINK_NS, METS_NS
 from eatb.settings import application_name, application_version
 from eatb.utils.XmlHelper import q, XSI_NS
-from eatb.utils.datetime import get_file_ctime_iso_date_str, DT_ISO_FMT_SEC_PREC, current_timestamp
+from eatb.utils.datetime import get_file_ctime_iso_date_str, get_timestamp_iso_date_str, DT_ISO_FMT_SEC_PREC, \
+    current_timestamp
+
+
+# number of files whose checksums are computed at once when the METS file is written incrementally
+STREAM_BATCH_SIZE = 1000
+
+
+class _XmlStreamWriter:
+    """
+    Pretty printed incremental output of elements using lxml.etree.xmlfile. Elements registered as hooks are
+    completed by a function writing further child elements.
+    """
+
+    def __init__(self, xf, hooks=None):
+        """
+        :param xf: xmlfile context
+        :param hooks: dictionary mapping elements to functions writing child elements (argument: indentation level,
+                      return value: number of elements written)
+        """
+        self.xf = xf
+        self.hooks = hooks if hooks else {}
+
+    def write(self, element, level):
+        """
+        Write an element
+        :param element: element
+        :param level: indentation level
+        :return: 1
+        """
+        self.xf.write("\n" + "  " * level)
+        with self.xf.element(element.tag, dict(element.attrib)):
+            if element.text:
+                self.xf.write(element.text)
+            written = 0
+            for child in element.iterchildren():
+                written += self.write(child, level + 1)
+            hook = self.hooks.get(element)
+            if hook:
+                written += hook(level + 1)
+            if written:
+                self.xf.write("\n" + "  " * level)
+        return 1
 
 
 class MetsGenerator(object):
@@ -31,8 +73,98 @@ class MetsGenerator(object):
     root_path = ""
     mets_data = None
 
-    def __init__(self, root_path):
+    def __init__(self, root_path, workers=1, file_facts=None, id_factory=None):
+        """
+        :param root_path: root path of the information package
+        :param workers: number of workers used to compute the file checksums in parallel
+        :param file_facts: package file facts (PackageFileFacts) collected in advance, files covered by the facts are
+                           not hashed again
+        :param id_factory: factory of the element IDs (IdFactory, default: random UUIDs), name-based factories are
+                           seeded with the package identifier
+        """
         self.root_path = root_path
+        self.workers = workers
+        self.file_facts = file_facts
+        self.id_factory = id_factory if id_factory else IdFactory()
+        self.digests = {}
+        self.previous_entries = {}
+        self.reserved_ids = set()
+
+    def sha256(self, file_name):
+        """
+        Get the SHA-256 checksum of a file, either taken from the previous METS file (incremental mode), the file
+        facts, computed in advance by the worker pool or computed on demand.
+        :param file_name: file path
+        :return: SHA-256 checksum
+        """
+        entry = self.previous_entries.get(file_name)
+        if entry:
+            return entry.checksum
+        digests = self.digests.get(file_name)
+        if digests:
+            return digests[ChecksumAlgorithm.SHA256]
+        if self.file_facts:
+            digest = self.file_facts.digest(file_name, ChecksumAlgorithm.SHA256)
+            if digest:
+                return digest
+        return get_sha256_hash(file_name)
+
+    def prefetch_digests(self, file_names):
+        """
+        Compute the SHA-256 checksums of the given files in parallel using the configured number of workers.
+        :param file_names: list of file paths
+        """
+        if self.file_facts:
+            file_names = [fn for fn in file_names if not self.file_facts.digest(fn, ChecksumAlgorithm.SHA256)]
+        if self.previous_entries:
+            file_names = [fn for fn in file_names if fn not in self.previous_entries]
+        self.digests = hash_files(file_names, [ChecksumAlgorithm.SHA256], workers=self.workers)
+
+    def new_id(self, *key):
+        """
+        Get a new element ID from the ID factory, skipping IDs taken over from the previous METS file
+        :param key: parts of the element key (see IdFactory)
+        :return: ID
+        """
+        id = self.id_factory(*key)
+        while id in self.reserved_ids:
+            id = self.id_factory(*key)
+        return id
+
+    def file_id(self, package_file, key="file"):
+        """
+        Get the ID of a file entry or metadata reference: the ID of the previous METS file if the file is unchanged
+        (incremental mode), otherwise a new ID
+        :param package_file: entry of the package file table (PackageFile)
+        :param key: element name used as key of the new ID
+        :return: ID
+        """
+        entry = self.previous_entries.get(package_file.path)
+        return entry.id if entry else self.new_id(key, package_file.rel_path)
+
+    def load_previous_entries(self, mets_file_path, file_table):
+        """
+        Take over the entries of the unchanged files from an existing METS file. A file is regarded as unchanged if
+        its size is the one recorded in the METS file and it was last modified before the METS file was written.
+        :param mets_file_path: path of the existing METS file
+        :param file_table: package file table (PackageFileTable)
+        """
+        self.previous_entries = {}
+        self.reserved_ids = set()
+        if not os.path.exists(mets_file_path):
+            return
+        mets_mtime_ns = os.stat(mets_file_path).st_mtime_ns
+        parsed_mets = ParsedMets(self.root_path)
+        parsed_mets.load_mets(mets_file_path)
+        entries = parsed_mets.get_file_entries()
+        for package_file in file_table.files():
+            entry = entries.get(package_file.rel_path)
+            if entry and entry.id and entry.checksum and entry.checksum_type == "SHA-256" \
+                    and entry.size == str(package_file.size) and package_file.mtime_ns < mets_mtime_ns:
+                self.previous_entries[package_file.path] = entry
+                self.reserved_ids.add(entry.id)
+        logger.debug("Taking over %d of %d file entries from %s" % (len(self.previous_entries), len(file_table),
+                                                                     mets_file_path))
 
     def runCommand(self, program, stdin=PIPE, stdout=PIPE, stderr=PIPE):
         result, res_stdout, res_stderr = None, None, None
@@ -68,50 +200,238 @@ class MetsGenerator(object):
             agent = M.agent({"ROLE": role, "TYPE": type}, M.name(name), M.note(note), M.note(note, {q(CSIP_NS, "NOTETYPE"): "SOFTWARE VERSION"}))
         return agent
 
-    def addFile(self, file_name, mets_filegroup):
-        # reload(sys)
-        # sys.setdefaultencoding('utf8')
+    def addFile(self, file_name, mets_filegroup, package_file=None):
+        """
+        Add a file entry to a file group
+        :param file_name: file path
+        :param mets_filegroup: METS fileGrp element
+        :param package_file: entry of the package file table (PackageFile), the file is not stat'ed again
+        :return: file ID
+        """
+        if package_file:
+            file_id = self.file_id(package_file)
+        else:
+            file_id = self.new_id("file", os.path.relpath(file_name, self.root_path))
+        mets_filegroup.append(self.file_element(file_name, file_id, package_file))
+        return file_id
+
+    def file_element(self, file_name, file_id, package_file=None):
+        """
+        Create a file entry
+        :param file_name: file path
+        :param file_id: file ID
+        :param package_file: entry of the package file table (PackageFile), the file is not stat'ed again
+        :return: METS file element
+        """
         file_url = "%s" % os.path.relpath(file_name, self.root_path)
-        file_mimetype, _ = self.mime.guess_type(file_url)
-        file_mimetype = file_mimetype if file_mimetype else "application/octet-stream"
-        file_checksum = get_sha256_hash(file_name)
-        file_size = os.path.getsize(file_name)
-        file_cdate = get_file_ctime_iso_date_str(file_name, DT_ISO_FMT_SEC_PREC)
-        file_id = "ID" + uuid.uuid4().__str__()
+        fact = self.file_facts.get(file_name) if self.file_facts else None
+        if fact:
+            file_mimetype = fact.mimetype
+            file_size = fact.size
+            file_cdate = self.file_facts.created(file_name, DT_ISO_FMT_SEC_PREC)
+        else:
+            file_mimetype, _ = self.mime.guess_type(file_url)
+            file_mimetype = file_mimetype if file_mimetype else "application/octet-stream"
+            if package_file:
+                file_size = package_file.size
+                file_cdate = get_timestamp_iso_date_str(package_file.ctime, DT_ISO_FMT_SEC_PREC)
+            else:
+                file_size = os.path.getsize(file_name)
+                file_cdate = get_file_ctime_iso_date_str(file_name, DT_ISO_FMT_SEC_PREC)
+        entry = self.previous_entries.get(file_name)
+        if entry and entry.created:
+            file_cdate = entry.created
+        file_checksum = self.sha256(file_name)
         mets_file = M.file(
             {"MIMETYPE": file_mimetype, "CHECKSUMTYPE": "SHA-256", "CREATED": file_cdate, "CHECKSUM": file_checksum,
              "USE": "Datafile", "ID": file_id, "SIZE": file_size})
-        mets_filegroup.append(mets_file)
-        # _,fname = os.path.split(file_name)
         mets_FLocat = M.FLocat({q(XLINK_NS, 'href'): file_url, "LOCTYPE": "URL", q(XLINK_NS, 'type'): 'simple'})
         mets_file.append(mets_FLocat)
-        return file_id
+        return mets_file
 
     def addFiles(self, folder, mets_filegroup):
         ids = []
-        for top, dirs, files in os.walk(folder):
-            for fn in files:
-                file_name = os.path.join(top, fn)
-                file_id = self.addFile(file_name, mets_filegroup)
-                ids.append(file_id)
+        file_names = [os.path.join(top, fn) for top, dirs, files in os.walk(folder) for fn in files]
+        self.prefetch_digests(file_names)
+        for file_name in file_names:
+            file_id = self.addFile(file_name, mets_filegroup)
+            ids.append(file_id)
         return ids
 
+    def listed_files(self):
+        """
+        Get the files outside of the metadata folders which are listed in the fileSec (same traversal rules as
+        createMets, see scan_package).
+        :return: list of file paths
+        """
+        return [package_file.path for package_file in scan_package(self.root_path).files(PackageFileKind.file_kinds)]
+
     def make_mdref(self, path, file, id, mdtype):
-        mimetype, _ = self.mime.guess_type(os.path.join(path, file))
+        """
+        Create the attributes of a metadata reference (mdRef) of a file
+        :param path: directory of the metadata file
+        :param file: name of the metadata file
+        :param id: ID of the reference
+        :param mdtype: metadata type
+        :return: attribute dictionary
+        """
+        file_path = os.path.join(path, file)
+        st = os.stat(file_path)
+        package_file = PackageFile(file_path, os.path.relpath(file_path, self.root_path), st.st_size, st.st_ctime,
+                                   st.st_mtime_ns, None, None, None)
+        return self.package_file_mdref(package_file, id, mdtype)
+
+    def package_file_mdref(self, package_file, id, mdtype):
+        """
+        Create the attributes of a metadata reference (mdRef) of an entry of the package file table
+        :param package_file: entry of the package file table (PackageFile)
+        :param id: ID of the reference
+        :param mdtype: metadata type
+        :return: attribute dictionary
+        """
+        mimetype, _ = self.mime.guess_type(package_file.path)
         mimetype = mimetype if mimetype else "application/octet-stream"
-        rel_path = "%s" % os.path.relpath(os.path.join(path, file), self.root_path)
+        entry = self.previous_entries.get(package_file.path)
         mets_mdref = {"LOCTYPE": "URL",
                       "MIMETYPE": mimetype,
-                      "CREATED": current_timestamp(),
+                      "CREATED": entry.created if entry and entry.created else current_timestamp(),
                       q(XLINK_NS, "type"): "simple",
-                      q(XLINK_NS, "href"): rel_path,
+                      q(XLINK_NS, "href"): package_file.rel_path,
                       "CHECKSUMTYPE": "SHA-256",
-                      "CHECKSUM": get_sha256_hash(os.path.join(path, file)),
+                      "CHECKSUM": self.sha256(package_file.path),
                       "ID": id,
-                      "SIZE": os.path.getsize(os.path.join(path, file)),
+                      "SIZE": package_file.size,
                       "MDTYPE": mdtype}
         return mets_mdref
 
+    def metadata_section(self, package_file, id):
+        """
+        Create the metadata section of a descriptive (dmdSec) or preservation (digiprovMD) metadata file
+        :param package_file: entry of the package file table (PackageFile)
+        :param id: ID of the metadata reference
+        :return: dmdSec or digiprovMD element
+        """
+        if package_file.kind == PackageFileKind.DESCRIPTIVE:
+            mets_dmd = M.dmdSec({"ID": self.new_id("dmdSec", package_file.rel_path), "CREATED": current_timestamp(), "STATUS": "CURRENT"})
+            # TODO: change MDTYPE
+            mets_dmd.append(M.mdRef(self.package_file_mdref(package_file, id, 'OTHER')))
+            return mets_dmd
+        digiprovmd_attributes = {"ID": self.new_id("digiprovMD", package_file.rel_path)}
+        if package_file.status:
+            digiprovmd_attributes["STATUS"] = package_file.status
+        mets_digiprovmd = M.digiprovMD(digiprovmd_attributes)
+        filename = os.path.basename(package_file.path)
+        if filename.startswith('premis') or filename.endswith('premis.xml'):
+            mdtype = 'PREMIS'
+        else:
+            mdtype = 'OTHER'
+        mets_digiprovmd.append(M.mdRef(self.package_file_mdref(package_file, id, mdtype)))
+        return mets_digiprovmd
+
+    def mets_pointer(self, package_file, packagetype, packageid):
+        """
+        Create the pointer (mptr) to the METS file of a representation
+        :param package_file: entry of the package file table (PackageFile)
+        :param packagetype: package type
+        :param packageid: package identifier
+        :return: mptr element
+        """
+        rep_name = os.path.basename(os.path.dirname(package_file.path))
+        return M.mptr({"LOCTYPE": "URL",
+                       q(XLINK_NS, "title"): ("Mets file describing representation: %s of %s: urn:uuid:%s." % (rep_name, packagetype, packageid)),
+                       q(XLINK_NS, "href"): package_file.rel_path,
+                       q(XLINK_NS, 'type'): 'simple',
+                       "ID": self.new_id("mptr", package_file.rel_path)})
+
+    def _prefetched(self, package_files):
+        """
+        Iterate over package files computing their checksums in batches
+        :param package_files: iterable of PackageFile
+        :return: generator of PackageFile
+        """
+        batch = []
+        for package_file in package_files:
+            batch.append(package_file)
+            if len(batch) == STREAM_BATCH_SIZE:
+                self.prefetch_digests([f.path for f in batch])
+                yield from batch
+                batch = []
+        self.prefetch_digests([f.path for f in batch])
+        yield from batch
+        self.digests = {}
+
+    def _write_mets_stream(self, root, sections, file_table, mets_file_path):
+        """
+        Write the METS file incrementally: the skeleton elements are written as they are, the content of the sections
+        is generated from the package file table while the file is written.
+        :param root: METS root element (skeleton)
+        :param sections: skeleton elements to be filled (keys: amdSec, fileGrps, package_div, metadata_div,
+                         schema_div, content_div)
+        :param file_table: package file table (PackageFileTable)
+        :param mets_file_path: METS file path
+        """
+        packageid = self.mets_data['packageid']
+        packagetype = self.mets_data['type']
+        mets_filegroups = sections["fileGrps"]
+
+        # IDs of the listed files (referenced by the fileSec and the structMaps)
+        ids = {}
+        for package_file in file_table.files():
+            if package_file.kind in PackageFileKind.file_kinds and package_file.use not in mets_filegroups:
+                if package_file.kind != PackageFileKind.CONTENT:
+                    raise KeyError(package_file.use)
+                logger.error("Error looking up '%s' element for file '%s'" % (package_file.use, package_file.path))
+                continue
+            kind = "mdRef" if package_file.kind in PackageFileKind.metadata_kinds else "file"
+            ids[package_file.path] = self.file_id(package_file, kind)
+
+        def metadata_sections(kind, reverse=False):
+            package_files = list(file_table.files([kind])) if reverse else file_table.files([kind])
+            return lambda level: sum(writer.write(self.metadata_section(package_file, ids[package_file.path]), level)
+                                     for package_file in self._prefetched(
+                                         reversed(package_files) if reverse else package_files))
+
+        def files(use):
+            return lambda level: sum(writer.write(self.file_element(package_file.path, ids[package_file.path],
+                                                                    package_file), level)
+                                     for package_file in self._prefetched(
+                                         f for f in file_table.files(PackageFileKind.file_kinds) if f.use == use))
+
+        def fptrs(kinds):
+            return lambda level: sum(writer.write(M.fptr({"FILEID": ids[package_file.path]}), level)
+                                     for package_file in file_table.files(kinds) if package_file.path in ids)
+
+        def directory_divs(level):
+            for directory in file_table.directories:
+                physical_div = M.div({"LABEL": directory.rel_path, "ID": self.new_id("div", directory.rel_path)})
+                for package_file in directory.files:
+                    if package_file.kind == PackageFileKind.METS:
+                        physical_div.append(self.mets_pointer(package_file, packagetype, packageid))
+                    if package_file.path in ids:
+                        physical_div.append(M.fptr({"FILEID": ids[package_file.path]}))
+                writer.write(physical_div, level)
+            return len(file_table.directories)
+
+        hooks = {sections["amdSec"]: metadata_sections(PackageFileKind.PRESERVATION),
+                 sections["package_div"]: directory_divs,
+                 sections["metadata_div"]: fptrs(PackageFileKind.metadata_kinds),
+                 sections["schema_div"]: fptrs([PackageFileKind.SCHEMA]),
+                 sections["content_div"]: fptrs([PackageFileKind.CONTENT])}
+        for use in file_table.use_folders:
+            hooks[mets_filegroups[use]] = files(use)
+
+        with etree.xmlfile(mets_file_path, encoding='UTF-8') as xf:
+            writer = _XmlStreamWriter(xf, hooks)
+            xf.write_declaration()
+            with xf.element(root.tag, dict(root.attrib), nsmap=METS_NSMAP):
+                children = list(root.iterchildren())
+                # header followed by the descriptive metadata sections
+                writer.write(children[0], 1)
+                metadata_sections(PackageFileKind.DESCRIPTIVE, reverse=True)(1)
+                for child in children[1:]:
+                    writer.write(child, 1)
+                xf.write("\n")
+
     def setParentRelation(self, identifier):
         parentmets = os.path.join(self.root_path, 'METS.xml')
         packagetype = self.mets_data['type']
@@ -125,7 +445,7 @@ class MetsGenerator(object):
                               "OTHERLOCTYPE": "UUID",
                               q(XLINK_NS, "title"): ("Referencing a parent %s." % packagetype),
                               q(XLINK_NS, "href"): identifier,
-                              "ID": "ID" + uuid.uuid4().__str__()})
+                              "ID": self.new_id("mptr", "parent", identifier)})
             parent.append(pointer)
 
             parent_map = parent_root.find("%s[@LABEL='parent %s']" % (q(METS_NS, 'structMap'), packagetype))
@@ -157,7 +477,7 @@ class MetsGenerator(object):
                               "OTHERLOCTYPE": "UUID",
                               q(XLINK_NS, "title"): ("Referencing a child %s." % packagetype),
                               q(XLINK_NS, "href"): identifier,
-                              "ID": "ID" + uuid.uuid4().__str__()})
+                              "ID": self.new_id("mptr", "child", identifier)})
             child.append(pointer)
 
             children_map = parent_root.find("%s[@LABEL='child %s']" % (q(METS_NS, 'structMap'), packagetype))
@@ -177,9 +497,34 @@ class MetsGenerator(object):
         else:
             logger.debug('Couldn\'t find the parent %ss Mets file.' % packagetype)
 
-    def createMets(self, mets_data, mets_file_path=None, additional_metadata={}):
+    def createMets(self, mets_data, mets_file_path=None, additional_metadata={}, file_table=None, streaming=False,
+                   incremental=False):
+        """
+        Create the METS file of the package in two phases: the package directory is scanned once (scan_package) and
+        the METS is emitted from the resulting file table.
+        :param mets_data: dictionary with 'packageid', 'type', 'schemas' and 'parent'
+        :param mets_file_path: METS file path (default: METS.xml in the package root)
+        :param additional_metadata: dictionary with 'contentCategory' and 'contentInformationType' (optional)
+        :param file_table: package file table (PackageFileTable) scanned in advance (optional)
+        :param streaming: write the METS file incrementally (lxml.etree.xmlfile) instead of building the document in
+                          memory; the file and structMap entries are written section by section and the checksums
+                          are computed in batches. The element tree of the document is not held in memory, the
+                          package file table and the file IDs still are (memory use is linear in the number of files)
+        :param incremental: take over checksum, size, creation date and ID of the files which are unchanged since
+                            the existing METS file was written (see load_previous_entries), only new and modified
+                            files are hashed
+        """
+        if file_table is None:
+            file_table = scan_package(self.root_path)
+        if not mets_file_path:
+            mets_file_path = os.path.join(self.root_path, 'METS.xml')
+        if incremental:
+            self.load_previous_entries(mets_file_path, file_table)
+        else:
+            self.previous_entries, self.reserved_ids = {}, set()
         self.mets_data = mets_data
         packageid = mets_data['packageid']
+        self.id_factory.reset(packageid)
         packagetype = mets_data['type']
         schemafolder = mets_data['schemas']
         parent = mets_data['parent']
@@ -226,47 +571,46 @@ class MetsGenerator(object):
         mets_hdr.append(M.metsDocumentID("METS.xml"))
 
         # create amdSec
-        mets_amdSec = M.amdSec({"ID": "ID" + uuid.uuid4().__str__()})
+        mets_amdSec = M.amdSec({"ID": self.new_id("amdSec")})
         root.append(mets_amdSec)
 
         # create fileSec
-        mets_fileSec = M.fileSec({"ID": "ID" + uuid.uuid4().__str__()})
+        mets_fileSec = M.fileSec({"ID": self.new_id("fileSec")})
         root.append(mets_fileSec)
 
         # filegroups
         mets_filegroups = dict()
 
-        folder_with_USE = get_folder_with_USE(self.root_path)
-        mets_filegroups[folder_with_USE] = M.fileGrp({"ID": "ID" + uuid.uuid4().__str__(), "USE": folder_with_USE})
+        mets_filegroups[file_table.root_use] = M.fileGrp({"ID": self.new_id("fileGrp", file_table.root_use),
+                                                          "USE": file_table.root_use})
         # for METSs in subfolders
-        for subdir in next(os.walk(self.root_path))[1]:
-            if subdir in folders_with_USE:
-                mets_filegroups[subdir] = M.fileGrp({"ID": "ID" + uuid.uuid4().__str__(), "USE": subdir})
-                mets_fileSec.append(mets_filegroups[subdir])
+        for subdir in file_table.use_folders:
+            mets_filegroups[subdir] = M.fileGrp({"ID": self.new_id("fileGrp", subdir), "USE": subdir})
+            mets_fileSec.append(mets_filegroups[subdir])
 
         # structMap 'CSIP' - default, physical structure
-        mets_earkstructmap = M.structMap({"LABEL": "CSIP", "TYPE": "PHYSICAL", "ID": "ID" + uuid.uuid4().__str__()})
+        mets_earkstructmap = M.structMap({"LABEL": "CSIP", "TYPE": "PHYSICAL", "ID": self.new_id("structMap", "CSIP")})
         root.append(mets_earkstructmap)
-        package_div = M.div({"LABEL": packageid, "ID": "ID" + uuid.uuid4().__str__()})
+        package_div = M.div({"LABEL": packageid, "ID": self.new_id("div", ".")})
         # append physical structMap
         mets_earkstructmap.append(package_div)
 
         # structMap and div for the whole package (metadata, schema and /data)
-        mets_structmap = M.structMap({"LABEL": "Simple %s structuring" % packagetype, "TYPE": "logical", "ID": "ID" + uuid.uuid4().__str__()})
+        mets_structmap = M.structMap({"LABEL": "Simple %s structuring" % packagetype, "TYPE": "logical", "ID": self.new_id("structMap", "logical")})
         root.append(mets_structmap)
-        mets_structmap_div = M.div({"LABEL": "Package structure", "ID": "ID" + uuid.uuid4().__str__()})
+        mets_structmap_div = M.div({"LABEL": "Package structure", "ID": self.new_id("div", "logical")})
         mets_structmap.append(mets_structmap_div)
 
         # metadata structmap - IP root level!
-        mets_structmap_metadata_div = M.div({"LABEL": "metadata files", "ID": "ID" + uuid.uuid4().__str__()})
+        mets_structmap_metadata_div = M.div({"LABEL": "metadata files", "ID": self.new_id("div", "logical", "metadata")})
         mets_structmap_div.append(mets_structmap_metadata_div)
 
         # structmap for schema files
-        mets_structmap_schema_div = M.div({"LABEL": "schema files", "ID": "ID" + uuid.uuid4().__str__()})
+        mets_structmap_schema_div = M.div({"LABEL": "schema files", "ID": self.new_id("div", "logical", "schemas")})
         mets_structmap_div.append(mets_structmap_schema_div)
 
         # content structmap - all representations! (is only filled if no separate METS exists for the rep)
-        mets_structmap_content_div = M.div({"LABEL": "content files", "ID": "ID" + uuid.uuid4().__str__()})
+        mets_structmap_content_div = M.div({"LABEL": "content files", "ID": self.new_id("div", "logical", "content")})
         mets_structmap_div.append(mets_structmap_content_div)
 
         # create structmap and div for Mets files from representations
@@ -280,166 +624,64 @@ class MetsGenerator(object):
             logger.debug('creating link to parent %s' % packagetype)
             mets_structmap_relation = M.structMap({'TYPE': 'logical', 'LABEL': 'parent'})
             root.append(mets_structmap_relation)
-            mets_div_rel = M.div({'LABEL': '%s parent identifier' % packagetype, "ID": "ID" + uuid.uuid4().__str__()})
+            mets_div_rel = M.div({'LABEL': '%s parent identifier' % packagetype, "ID": self.new_id("div", "parent")})
             mets_structmap_relation.append(mets_div_rel)
             parent_pointer = M.mptr({"LOCTYPE": "OTHER",
                                      "OTHERLOCTYPE": "UUID",
                                      q(XLINK_NS, "title"): ("Referencing the parent %s of this (%s) %s." % (packagetype, packageid, packagetype)),
                                      q(XLINK_NS, "href"): parent,
-                                     "ID": "ID" + uuid.uuid4().__str__()})
+                                     "ID": self.new_id("mptr", "parent", parent)})
             mets_div_rel.append(parent_pointer)
 
+        if streaming:
+            sections = {"amdSec": mets_amdSec, "fileGrps": mets_filegroups, "package_div": package_div,
+                        "metadata_div": mets_structmap_metadata_div, "schema_div": mets_structmap_schema_div,
+                        "content_div": mets_structmap_content_div}
+            self._write_mets_stream(root, sections, file_table, mets_file_path)
+            return
+
         ###########################
         # add to Mets skeleton
         ###########################
 
+        # compute the checksums of the listed files in advance (in parallel if more than one worker is configured)
+        self.prefetch_digests([package_file.path for package_file in file_table.files()])
+
         # add the package content to the Mets skeleton
-        for directory, subdirectories, filenames in os.walk(self.root_path):
-            folder_with_USE = get_folder_with_USE(directory)
+        for directory in file_table.directories:
             # build the earkstructmap
-            path = os.path.relpath(directory, self.root_path)
-            physical_div = ''
-            if path != 'representations': # otherwise an empty div is created
-                if path != '.':
-                    physical_div = M.div({"LABEL": path, "ID": "ID" + uuid.uuid4().__str__()})
-                    package_div.append(physical_div)
-                # if directory.endswith('metadata/conduit'):
-                #     # Ignore temp files only needed for IP processing with conduit
-                #     del filenames[:]
-                #     del subdirectories[:]
-                if directory.endswith('/metadata'):
-                    del filenames[:]
-                    del subdirectories[:]
-                if directory == os.path.join(self.root_path, 'metadata'):
-                    # Metadata on IP root level - if there are folders for representation-specific metadata,
-                    # check if the corresponding representation has a Mets file. If yes, skip; if no, add to IP root Mets.
-                    for filename in filenames:
-                        if filename == 'conduit.log':
-                            mets_digiprovmd = M.digiprovMD({"ID": "ID" + uuid.uuid4().__str__()})
-                            mets_amdSec.append(mets_digiprovmd)
-                            id = "ID" + uuid.uuid4().__str__()
-                            ref = self.make_mdref(directory, filename, id, 'OTHER')
-                            mets_mdref = M.mdRef(ref)
-                            mets_digiprovmd.append(mets_mdref)
-                            mets_structmap_metadata_div.append(M.fptr({"FILEID": id}))
-                            physical_div.append(M.fptr({"FILEID": id}))
-                    del subdirectories[:]  # prevent loop to iterate subfolders outside of this if statement
-                    dirlist = os.listdir(os.path.join(self.root_path, 'metadata'))
-                    for dirname in dirlist:
-                        if fnmatch.fnmatch(dirname, '*_mig-*'):
-                            # TODO: maybe list it all the time?
-                            # this folder contains metadata for a representation/migration, currently:
-                            # only listed if no representation Mets file exists
-                            if os.path.isfile(os.path.join(self.root_path, 'representations/%s/METS.xml') % dirname):
-                                pass
-                            else:
-                                for dir, subdir, files in os.walk(os.path.join(self.root_path, 'metadata/%s') % dirname):
-                                    for filename in files:
-                                        if dir.endswith('descriptive'):
-                                            mets_dmd = M.dmdSec({"ID": "ID" + uuid.uuid4().__str__(), "CREATED": current_timestamp(), "STATUS": "CURRENT"})
-                                            root.insert(1, mets_dmd)
-                                            id = "ID" + uuid.uuid4().__str__()
-                                            ref = self.make_mdref(dir, filename, id, 'OTHER')
-                                            mets_mdref = M.mdRef(ref)
-                                            mets_dmd.append(mets_mdref)
-                                            mets_structmap_metadata_div.append(M.fptr({"FILEID": id}))
-                                            physical_div.append(M.fptr({"FILEID": id}))
-                                        elif dir.endswith('preservation'):
-                                            mets_digiprovmd = M.digiprovMD({"ID": "ID" + uuid.uuid4().__str__()})
-                                            mets_amdSec.append(mets_digiprovmd)
-                                            id = "ID" + uuid.uuid4().__str__()
-                                            mdtype = ''
-                                            if filename.startswith('premis') or filename.endswith('premis.xml'):
-                                                mdtype = 'PREMIS'
-                                            else:
-                                                mdtype = 'OTHER'
-                                            ref = self.make_mdref(dir, filename, id, mdtype)
-                                            mets_mdref = M.mdRef(ref)
-                                            mets_digiprovmd.append(mets_mdref)
-                                            mets_structmap_metadata_div.append(M.fptr({"FILEID": id}))
-                                            physical_div.append(M.fptr({"FILEID": id}))
-                                        elif filename:
-                                            logger.debug('Unclassified metadata file %s in %s.' % (filename, dir))
-                        else:
-                            # metadata that should be listed in the Mets
-                            for dir, subdir, files in os.walk(os.path.join(self.root_path, 'metadata/%s') % dirname):
-                                if len(files) > 0:
-                                    for filename in files:
-                                        #if dir.endswith('descriptive'):
-                                        if dirname == 'descriptive':
-                                            mets_dmd = M.dmdSec({"ID": "ID" + uuid.uuid4().__str__(), "CREATED": current_timestamp(), "STATUS": "CURRENT"})
-                                            root.insert(1, mets_dmd)
-                                            id = "ID" + uuid.uuid4().__str__()
-                                            # TODO: change MDTYPE
-                                            ref = self.make_mdref(dir, filename, id, 'OTHER')
-                                            mets_mdref = M.mdRef(ref)
-                                            mets_dmd.append(mets_mdref)
-                                            mets_structmap_metadata_div.append(M.fptr({"FILEID": id}))
-                                            physical_div.append(M.fptr({"FILEID": id}))
-                                        #elif dir.endswith('preservation'):
-                                        elif dirname == 'preservation' or dirname == 'conduit':
-                                            mets_digiprovmd = M.digiprovMD({"ID": "ID" + uuid.uuid4().__str__(), "STATUS": "CURRENT"})
-                                            mets_amdSec.append(mets_digiprovmd)
-                                            id = "ID" + uuid.uuid4().__str__()
-                                            mdtype = ''
-                                            if filename.startswith('premis') or filename.endswith('premis.xml'):
-                                                mdtype = 'PREMIS'
-                                            elif filename:
-                                                mdtype = 'OTHER'
-                                            ref = self.make_mdref(dir, filename, id, mdtype)
-                                            mets_mdref = M.mdRef(ref)
-                                            mets_digiprovmd.append(mets_mdref)
-                                            mets_structmap_metadata_div.append(M.fptr({"FILEID": id}))
-                                            physical_div.append(M.fptr({"FILEID": id}))
-                                        elif filename:
-                                            logger.debug('Unclassified metadata file %s in %s.' % (filename, dir))
+            physical_div = M.div({"LABEL": directory.rel_path, "ID": self.new_id("div", directory.rel_path)})
+            package_div.append(physical_div)
+            for package_file in directory.files:
+                if package_file.kind in PackageFileKind.metadata_kinds:
+                    id = self.file_id(package_file, "mdRef")
+                    if package_file.kind == PackageFileKind.DESCRIPTIVE:
+                        root.insert(1, self.metadata_section(package_file, id))
+                    else:
+                        mets_amdSec.append(self.metadata_section(package_file, id))
+                    mets_structmap_metadata_div.append(M.fptr({"FILEID": id}))
+                    physical_div.append(M.fptr({"FILEID": id}))
+                elif package_file.kind == PackageFileKind.METS:
+                    # mets file is added as <mets:mptr> to <structMap> for corresponding rep
+                    physical_div.append(self.mets_pointer(package_file, packagetype, packageid))    # IMPORTANT: The <mptr> element needs to be the first entry in a <div>, or the Mets will be invalid!
+                    # also create a <fptr> for the Mets file
+                    id = self.addFile(package_file.path, mets_filegroups[package_file.use], package_file)
+                    physical_div.append(M.fptr({"FILEID": id}))
+                elif package_file.kind == PackageFileKind.SCHEMA:
+                    # schema files
+                    id = self.addFile(package_file.path, mets_filegroups[package_file.use], package_file)
+                    mets_structmap_schema_div.append(M.fptr({'FILEID': id}))
+                    physical_div.append(M.fptr({'FILEID': id}))
                 else:
-                    # Any other folder outside of /<root>/metadata
-                    for filename in filenames:
-                        if directory == self.root_path:
-                            # ignore files on IP root level
-                            del filename
-                        else:
-                            # TODO: list rep metadata only in the rep Mets?
-                            rel_path_file = "%s" % os.path.relpath(os.path.join(directory, filename), self.root_path)
-                            if filename.lower() == 'mets.xml':
-                                # delete the subdirectories list to stop os.walk from traversing further;
-                                # mets file should be added as <mets:mptr> to <structMap> for corresponding rep
-                                del subdirectories[:]
-                                rep_name = directory.rsplit('/', 1)[1]
-                                # create structMap div and append to representations structMap
-                                # mets_structmap_rep_div = M.div({"LABEL": rep_name, "TYPE": "representation mets", "ID": "ID" + uuid.uuid4().__str__()})
-                                # mets_div_reps.append(mets_structmap_rep_div)
-                                # add mets file as <mets:mptr>
-                                metspointer = M.mptr({"LOCTYPE": "URL",
-                                                      q(XLINK_NS, "title"): ("Mets file describing representation: %s of %s: urn:uuid:%s." % (rep_name, packagetype, packageid)),
-                                                      q(XLINK_NS, "href"): rel_path_file,
-                                                      q(XLINK_NS, 'type'): 'simple',
-                                                      "ID": "ID" + uuid.uuid4().__str__()})
-                                #mets_structmap_rep_div.append(metspointer)
-                                #mets_structmap_rep_div.append(M.fptr({"FILEID": id}))
-                                physical_div.append(metspointer)    # IMPORTANT: The <mptr> element needs to be the first entry in a <div>, or the Mets will be invalid!
-                                # also create a <fptr> for the Mets file
-                                id = self.addFile(os.path.join(directory, filename), mets_filegroups[folder_with_USE])
-                                physical_div.append(M.fptr({"FILEID": id}))
-                            elif filename and directory.endswith('schemas'):
-                                # schema files
-                                id = self.addFile(os.path.join(directory, filename), mets_filegroups[folder_with_USE])
-                                mets_structmap_schema_div.append(M.fptr({'FILEID': id}))
-                                physical_div.append(M.fptr({'FILEID': id}))
-                            elif filename:
-                                try:
-                                    id = self.addFile(os.path.join(directory, filename),
-                                                      mets_filegroups[folder_with_USE])
-                                    mets_structmap_content_div.append(M.fptr({'FILEID': id}))
-                                    physical_div.append(M.fptr({'FILEID': id}))
-                                except KeyError as error:
-                                    logger.error("Error looking up '%s' element for file '%s'" % (folder_with_USE, filename), error)
+                    try:
+                        id = self.addFile(package_file.path, mets_filegroups[package_file.use], package_file)
+                        mets_structmap_content_div.append(M.fptr({'FILEID': id}))
+                        physical_div.append(M.fptr({'FILEID': id}))
+                    except KeyError as error:
+                        logger.error("Error looking up '%s' element for file '%s'" % (package_file.use, package_file.path), error)
 
         str = etree.tostring(root, encoding='UTF-8', pretty_print=True, xml_declaration=True)
 
-        if not mets_file_path:
-            mets_file_path = os.path.join(self.root_path, 'METS.xml')
         with open(mets_file_path, 'w') as output_file:
             output_file.write(str.decode('utf-8'))
 
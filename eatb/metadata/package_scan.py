@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import fnmatch
+import os
+from collections import namedtuple
+
+from eatb.metadata import logger, folders_with_USE
+from eatb.metadata.mets import get_folder_with_USE
+
+
+class PackageFileKind:
+    """
+    Kinds of files listed in a METS file
+    """
+    METS = "mets"  # METS file of a representation (mptr and file entry)
+    SCHEMA = "schema"  # schema file (file entry)
+    CONTENT = "content"  # any other file outside of the metadata folders (file entry)
+    DESCRIPTIVE = "descriptive"  # descriptive metadata (dmdSec)
+    PRESERVATION = "preservation"  # preservation metadata (digiprovMD)
+    file_kinds = (METS, SCHEMA, CONTENT)
+    metadata_kinds = (DESCRIPTIVE, PRESERVATION)
+
+
+# file of the package (status: STATUS attribute of the metadata section, None if the section has no STATUS)
+PackageFile = namedtuple("PackageFile", ["path", "rel_path", "size", "ctime", "mtime_ns", "use", "kind", "status"])
+
+# directory of the package represented by a div of the physical structMap (files in METS order)
+PackageDirectory = namedtuple("PackageDirectory", ["path", "rel_path", "use", "files"])
+
+
+class PackageFileTable:
+    """
+    In-memory table of the files of an information package which are described by its METS file, produced by a single
+    scan of the package directory (see scan_package). The directories are in the order of the physical structMap divs,
+    the files of a directory in the order of their METS entries.
+    """
+
+    def __init__(self, root_path, root_use, use_folders, directories):
+        """
+        Constructor
+        :param root_path: root path of the information package
+        :param root_use: USE of the package root folder
+        :param use_folders: folders on package root level which have a file group (USE)
+        :param directories: list of PackageDirectory
+        """
+        self.root_path = root_path
+        self.root_use = root_use
+        self.use_folders = use_folders
+        self.directories = directories
+
+    def files(self, kinds=None):
+        """
+        Get the files of the table
+        :param kinds: kinds of the files (PackageFileKind values, default: all)
+        :return: generator of PackageFile
+        """
+        for directory in self.directories:
+            for package_file in directory.files:
+                if kinds is None or package_file.kind in kinds:
+                    yield package_file
+
+    def __len__(self):
+        return sum(len(directory.files) for directory in self.directories)
+
+
+def _scandir(directory):
+    """
+    List a directory like os.walk (directories including symbolic links to directories; unreadable directories are
+    ignored)
+    :return: tuple (list of sub-directory entries, list of file entries)
+    """
+    dirs, files = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                (dirs if is_dir else files).append(entry)
+    except OSError:
+        pass
+    return dirs, files
+
+
+def _package_file(entry, root_path, use, kind, status=None):
+    st = entry.stat()
+    return PackageFile(entry.path, os.path.relpath(entry.path, root_path), st.st_size, st.st_ctime, st.st_mtime_ns,
+                       use, kind, status)
+
+
+def _sub_use(entry, use):
+    """
+    Get the USE of a sub-directory (the directory name if it is a folder with USE, otherwise the USE of the parent)
+    """
+    return entry.name if entry.name in folders_with_USE else use
+
+
+def _walk_entries(directory, use):
+    """
+    Walk a directory tree (top-down, symbolic links to directories are not followed)
+    :return: generator of tuples (directory path, USE, list of file entries)
+    """
+    dirs, files = _scandir(directory)
+    yield directory, use, files
+    for entry in dirs:
+        if not entry.is_symlink():
+            yield from _walk_entries(entry.path, _sub_use(entry, use))
+
+
+def _scan_metadata(root_path, metadata_dir, use):
+    """
+    Scan the metadata folder on package root level: descriptive and preservation metadata in the sub-folders, metadata
+    of representations ('*_mig-*' folders) only if the representation has no METS file.
+    :return: list of PackageFile
+    """
+    files = []
+    dirs, _ = _scandir(metadata_dir)
+    for dir_entry in dirs:
+        dirname = dir_entry.name
+        migration = fnmatch.fnmatch(dirname, '*_mig-*')
+        if migration and os.path.isfile(os.path.join(root_path, 'representations', dirname, 'METS.xml')):
+            continue
+        for directory, sub_use, file_entries in _walk_entries(dir_entry.path, _sub_use(dir_entry, use)):
+            for entry in file_entries:
+                if (migration and directory.endswith('descriptive')) or (not migration and dirname == 'descriptive'):
+                    files.append(_package_file(entry, root_path, sub_use, PackageFileKind.DESCRIPTIVE, "CURRENT"))
+                elif migration and directory.endswith('preservation'):
+                    files.append(_package_file(entry, root_path, sub_use, PackageFileKind.PRESERVATION))
+                elif not migration and dirname in ('preservation', 'conduit'):
+                    files.append(_package_file(entry, root_path, sub_use, PackageFileKind.PRESERVATION, "CURRENT"))
+                else:
+                    logger.debug('Unclassified metadata file %s in %s.' % (entry.name, directory))
+    return files
+
+
+def scan_package(root_path):
+    """
+    Scan an information package (one os.scandir call per directory) and build the table of the files described by
+    the METS file of the package. Traversal rules: files on package root level and directly in the 'representations'
+    folder are not listed; 'metadata' folders are not traversed, except the metadata folder on package root level,
+    whose sub-folders hold descriptive and preservation metadata; folders below a directory containing a METS file
+    are not traversed.
+    :param root_path: root path of the information package
+    :return: PackageFileTable
+    """
+    root_use = get_folder_with_USE(root_path)
+    root_dirs, root_files = _scandir(root_path)
+    use_folders = [entry.name for entry in root_dirs if entry.name in folders_with_USE]
+    root_metadata_dir = os.path.join(root_path, 'metadata')
+    directories = []
+
+    def scan(directory, use, dirs, file_entries):
+        rel_path = os.path.relpath(directory, root_path)
+        if rel_path != 'representations':
+            files = []
+            if directory.endswith('/metadata'):
+                dirs = []
+                if directory == root_metadata_dir:
+                    files = _scan_metadata(root_path, directory, use)
+            elif rel_path != '.':
+                for entry in file_entries:
+                    if entry.name.lower() == 'mets.xml':
+                        dirs = []
+                        files.append(_package_file(entry, root_path, use, PackageFileKind.METS))
+                    elif directory.endswith('schemas'):
+                        files.append(_package_file(entry, root_path, use, PackageFileKind.SCHEMA))
+                    else:
+                        files.append(_package_file(entry, root_path, use, PackageFileKind.CONTENT))
+            if rel_path != '.':
+                directories.append(PackageDirectory(directory, rel_path, use, files))
+        for entry in dirs:
+            if not entry.is_symlink():
+                sub_dirs, sub_files = _scandir(entry.path)
+                scan(entry.path, _sub_use(entry, use), sub_dirs, sub_files)
+
+    scan(root_path, root_use, root_dirs, root_files)
+    return PackageFileTable(root_path, root_use, use_folders, directories)
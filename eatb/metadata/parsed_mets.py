@@ -1,5 +1,10 @@
+from collections import namedtuple
+
 from lxml import etree
 
+# entry of a file (mets:file) or metadata reference (mets:mdRef) of a METS file
+MetsFileEntry = namedtuple("MetsFileEntry", ["id", "href", "checksum", "checksum_type", "size", "created"])
+
 
 class ParsedMets():
     """
@@ -46,6 +51,28 @@ class ParsedMets():
     def get_file_elements(self):
         return self.mets_tree.getroot().xpath('/mets:mets/mets:fileSec/mets:fileGrp/mets:file', namespaces=ParsedMets.ns)
 
+    def get_file_entries(self):
+        """
+        Get the entries of the files and metadata references listed in the METS file
+
+        @rtype:     dict
+        @return:    Dictionary mapping the file reference (xlink:href) to MetsFileEntry
+        """
+        entries = {}
+        href = '{%s}href' % ParsedMets.ns['xlink']
+        for file_element in self.get_file_elements():
+            flocat = file_element.find('{%s}FLocat' % ParsedMets.ns['mets'])
+            if flocat is not None and flocat.get(href):
+                entries[flocat.get(href)] = MetsFileEntry(
+                    file_element.get('ID'), flocat.get(href), file_element.get('CHECKSUM'),
+                    file_element.get('CHECKSUMTYPE'), file_element.get('SIZE'), file_element.get('CREATED'))
+        for mdref in self.mets_tree.getroot().iter('{%s}mdRef' % ParsedMets.ns['mets']):
+            if mdref.get(href):
+                entries[mdref.get(href)] = MetsFileEntry(
+                    mdref.get('ID'), mdref.get(href), mdref.get('CHECKSUM'), mdref.get('CHECKSUMTYPE'),
+                    mdref.get('SIZE'), mdref.get('CREATED'))
+        return entries
+
     def get_first_file_element(self):
         file_elements = self.get_file_elements()
         if len(file_elements) > 0:
@@ -22,8 +22,15 @@ class PremisCreator:
     premis_successor_sections = ['object', 'event', 'agent', 'right']
     working_dir = None
 
-    def __init__(self, working_dir, f=None):
+    def __init__(self, working_dir, f=None, id_factory=None):
+        """
+        :param working_dir: working directory
+        :param f: PREMIS file to be extended (optional)
+        :param id_factory: factory of the object IDs (IdFactory), objects get an xmlID attribute only if a factory is
+                           given
+        """
         self.working_dir = working_dir
+        self.id_factory = id_factory
         if f is None:
             self.root = P.premis(
                 {q(XSI_NS, 'schemaLocation'): PREMIS_NS + ' https://www.loc.gov/standards/premis/v3/premis-v3-0.xsd'},
@@ -33,9 +40,12 @@ class PremisCreator:
             self.root = objectify.parse(f).getroot()
 
     def add_object(self, identifier_value):
+        attributes = {q(XSI_NS, 'type'): 'file'}
+        if self.id_factory:
+            attributes['xmlID'] = self.id_factory("object", identifier_value)
         sequence_insert(
             self.root, P.object(
-                {q(XSI_NS, 'type'): 'file'},
+                attributes,
                 P.objectIdentifier(
                     P.objectIdentifierType('LOCAL'),
                     P.objectIdentifierValue(identifier_value)
@@ -1,12 +1,12 @@
-import hashlib
 import os
-import uuid
 from mimetypes import MimeTypes
 from subprocess import PIPE, Popen
 
 from lxml import etree
 
+from eatb.checksum import get_sha256_hash, hash_files, ChecksumAlgorithm
 from eatb.file_format import FormatIdentification
+from eatb.metadata.identifiers import IdFactory
 from eatb.metadata.parsed_premis import P
 from eatb.settings import fido_enabled
 from eatb.utils.XmlHelper import q, XSI_NS
@@ -18,15 +18,30 @@ class PremisGenerator(object):
     mime = MimeTypes()
     root_path = ""
 
-    def __init__(self, root_path):
+    def __init__(self, root_path, workers=1, file_facts=None, id_factory=None):
+        """
+        :param root_path: root path of the information package
+        :param workers: number of workers used to compute the file checksums in parallel
+        :param file_facts: package file facts (PackageFileFacts) collected in advance, files covered by the facts are
+                           not hashed and identified again
+        :param id_factory: factory of the object and event IDs (IdFactory, default: random UUIDs), name-based
+                           factories are seeded with the name of the package or representation folder
+        """
         self.root_path = root_path
+        self.workers = workers
+        self.file_facts = file_facts
+        self.id_factory = id_factory if id_factory else IdFactory()
+        self.digests = {}
 
     def sha256(self, fname):
-        hash = hashlib.sha256()
-        with open(fname, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash.update(chunk)
-        return hash.hexdigest()
+        digests = self.digests.get(fname)
+        if digests:
+            return digests[ChecksumAlgorithm.SHA256]
+        if self.file_facts:
+            digest = self.file_facts.digest(fname, ChecksumAlgorithm.SHA256)
+            if digest:
+                return digest
+        return get_sha256_hash(fname)
 
     def runCommand(self, program, stdin = PIPE, stdout = PIPE, stderr = PIPE):
         result, res_stdout, res_stderr = None, None, None
@@ -64,11 +79,14 @@ class PremisGenerator(object):
 
         hash = self.sha256(abs_path)
         file_url = "%s" % os.path.relpath(abs_path, self.root_path)
+        fact = self.file_facts.get(abs_path) if self.file_facts else None
         fmt = None
         if fido_enabled:
-            fmt = self.fid.identify_file(abs_path)
-        size = os.path.getsize(abs_path)
-        premis_id = 'ID' + uuid.uuid4().__str__()
+            fmt = self.file_facts.puid(abs_path) if fact else None
+            if not fmt:
+                fmt = self.fid.identify_file(abs_path)
+        size = fact.size if fact else os.path.getsize(abs_path)
+        premis_id = self.id_factory("object", file_url)
 
         if not fmt:
             fmt = 'fmt/000'
@@ -118,13 +136,14 @@ class PremisGenerator(object):
         premis_parsed = etree.parse(premis_path)
         premis_root = premis_parsed.getroot()
 
-        event_id = 'ID' + uuid.uuid4().__str__()
+        event_date_time = current_timestamp()
+        event_id = self.id_factory("event", event_type, event_date_time)
         event = P.event(
             P.eventIdentifier(
                 P.eventIdentifierType('local'),
                 P.eventIdentifierValue(event_id)),
             P.eventType(event_type),
-            P.eventDateTime(current_timestamp()),
+            P.eventDateTime(event_date_time),
             P.eventOutcomeInformation(
                 P.eventOutcome(outcome)
             ),
@@ -150,7 +169,8 @@ class PremisGenerator(object):
 
         # creates an object that references the package or representation
         # TODO: identifier!
-        premis_id = 'ID' + uuid.uuid4().__str__()
+        self.id_factory.reset(os.path.basename(self.root_path))
+        premis_id = self.id_factory("object", ".")
         object = P.object(
             {q(XSI_NS, 'type'): 'representation', "xmlID": premis_id},
             P.objectIdentifier(
@@ -169,7 +189,7 @@ class PremisGenerator(object):
             eventlist = []
             for event, element in migrations:
                 if element.tag == 'migration':
-                    event_id = 'ID' + uuid.uuid4().__str__()
+                    event_id = self.id_factory("event", "migration", element.attrib['file'])
                     if self.root_path.endswith(element.attrib['targetrep']):
                         source_object_abs = os.path.join(element.attrib['sourcedir'], element.attrib['file'])
                         source_object_rel = "%s" % os.path.relpath(source_object_abs, self.root_path)
@@ -265,7 +285,8 @@ class PremisGenerator(object):
         premis.attrib['{%s}schemaLocation' % XSI_NS] = "http://www.loc.gov/premis/v3 https://www.loc.gov/standards/premis/v3/premis-v3-0.xsd"
 
         # if there are no /data files, this will ensure that there is at least one object (the IP itself)
-        premis_id = 'ID' + uuid.uuid4().__str__()
+        self.id_factory.reset(os.path.basename(self.root_path))
+        premis_id = self.id_factory("object", ".")
         object = P.object(
             {q(XSI_NS, 'type'): 'representation', "xmlID": premis_id},
             P.objectIdentifier(
@@ -276,7 +297,12 @@ class PremisGenerator(object):
         premis.append(object)
 
         # create premis objects for files in this representation (self.root_path/data)
-        for directory, subdirectories, filenames in os.walk(os.path.join(self.root_path, 'data')):
+        data_path = os.path.join(self.root_path, 'data')
+        file_names = [os.path.join(top, fn) for top, _, files in os.walk(data_path) for fn in files]
+        if self.file_facts:
+            file_names = [fn for fn in file_names if not self.file_facts.digest(fn, ChecksumAlgorithm.SHA256)]
+        self.digests = hash_files(file_names, [ChecksumAlgorithm.SHA256], workers=self.workers)
+        for directory, subdirectories, filenames in os.walk(data_path):
             for filename in filenames:
                 object = self.addObject(os.path.join(directory, filename))
                 premis.append(object)
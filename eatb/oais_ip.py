@@ -1,5 +1,6 @@
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from pathlib import Path
 import uuid
@@ -9,7 +10,7 @@ import lxml.etree as ET
 from lxml import objectify
 
 from eatb import ROOT
-from eatb.checksum import ChecksumValidation, ChecksumAlgorithm
+from eatb.checksum import ChecksumValidation, ChecksumAlgorithm, get_sha256_hash
 from eatb.metadata.mets_generator import MetsGenerator
 from eatb.metadata.parsed_mets import ParsedMets
 
@@ -17,8 +18,8 @@ from eatb.metadata.premis_generator import PremisGenerator
 from eatb.packaging import create_package
 from eatb.csip_validation import ValidationResult, XmlValidation
 from eatb.file_format import FormatIdentification
+from eatb.file_facts import PackageFileFacts
 
-import hashlib
 from mimetypes import MimeTypes
 
 from subprocess import Popen, PIPE
@@ -37,15 +38,71 @@ class OAISPackageType(Enum):
     IP = 4
 
 
+def _process_representations(function, tasks, workers=1):
+    """
+    Process the representations of a package, in a pool of worker processes if more than one worker is configured
+    :param function: module level function called for each representation
+    :param tasks: list of argument tuples, one per representation
+    :param workers: number of worker processes
+    """
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = [pool.submit(function, *task) for task in tasks]
+            for future in futures:
+                future.result()
+    else:
+        for task in tasks:
+            function(*task)
+
+
+def _create_sip_representation(rep_path, package_dir, package_name, generate_premis, additional_metadata,
+                               file_facts):
+    """
+    Create PREMIS and METS file of a SIP representation
+    """
+    if generate_premis:
+        premisgen = PremisGenerator(rep_path, file_facts=file_facts)
+        premisgen.createPremis()
+    mets_data = {'packageid': package_name,
+                 'type': "SIP",
+                 'schemas': os.path.join(package_dir, 'schemas'),
+                 'parent': ''}
+    metsgen = MetsGenerator(rep_path, file_facts=file_facts)
+    metsgen.createMets(mets_data=mets_data, mets_file_path=None, additional_metadata=additional_metadata)
+
+
+def _create_aip_representation(rep_path, schemas, additional_metadata, incremental, file_facts):
+    """
+    Create the METS file of an AIP representation
+    """
+    # TODO: packageid?
+    # parent = task_context.additional_data['parent_id']
+    mets_data = {'packageid': os.path.basename(rep_path),
+                 'type': "AIP",
+                 'schemas': schemas,
+                 'parent': ''}
+    metsgen = MetsGenerator(rep_path, file_facts=file_facts)
+    metsgen.createMets(mets_data, additional_metadata=additional_metadata, incremental=incremental)
+
+
 def create_sip(package_dir: str, package_name: str, identifier: str, generate_premis: bool=True,
-               generate_package: bool=True, additional_metadata={}, custom_logger=None) -> bool:
+               generate_package: bool=True, additional_metadata={}, custom_logger=None, workers: int=1) -> bool:
+    """
+    Create the PREMIS and METS files of a SIP and package it
+    :param workers: number of worker processes generating the PREMIS and METS files of the representations
+                    concurrently; the package level files are created when all representations are finished. The
+                    package files are hashed by the same number of threads.
+    """
 
     logger = custom_logger if custom_logger else LOGGER
 
+    # hash and identify the package files once for all PREMIS and METS files
+    file_facts = PackageFileFacts(package_dir, workers=workers, format_identification=PremisGenerator.fid).scan()
+
     # PREMIS
     premis_path = os.path.join(package_dir, 'metadata/preservation/premis.xml')
     if generate_premis:
-        premisgen = PremisGenerator(package_dir)
+        premisgen = PremisGenerator(package_dir, file_facts=file_facts)
 
         premisgen.createPremis()
         premisinfo = {'outcome': 'success',
@@ -57,6 +114,7 @@ def create_sip(package_dir: str, package_name: str, identifier: str, generate_pr
         premisgen.addEvent('metadata/preservation/premis.xml', premisinfo)
 
     reps_path = os.path.join(package_dir, 'representations')
+    tasks = []
     for name in os.listdir(reps_path):
         rep_path = os.path.join(reps_path, name)
         if os.path.isdir(rep_path):
@@ -65,20 +123,14 @@ def create_sip(package_dir: str, package_name: str, identifier: str, generate_pr
                 logger.info(
                     "Creating representation PREMIS file %s" %
                     os.path.join(rep_path, 'metadata/preservation/premis.xml'))
-                premisgen = PremisGenerator(rep_path)
-                premisgen.createPremis()
             # representation METS
             logger.info("Creating representation METS file: %s" % os.path.join(rep_path, "METS.xml"))
-            mets_data = {'packageid': package_name,
-                         'type': "SIP",
-                         'schemas': os.path.join(package_dir, 'schemas'),
-                         'parent': ''}
-            metsgen = MetsGenerator(rep_path)
-
-            metsgen.createMets(mets_data=mets_data, mets_file_path=None, additional_metadata=additional_metadata)
+            tasks.append((rep_path, package_dir, package_name, generate_premis, additional_metadata,
+                          file_facts.subset(rep_path) if workers > 1 else file_facts))
+    _process_representations(_create_sip_representation, tasks, workers)
     if generate_premis:
         # PREMIS
-        premisgen = PremisGenerator(package_dir)
+        premisgen = PremisGenerator(package_dir, file_facts=file_facts)
         premisgen.createPremis()
 
     # METS
@@ -88,7 +140,7 @@ def create_sip(package_dir: str, package_name: str, identifier: str, generate_pr
                  'parent': ''}
     mets_path = os.path.join(package_dir, "METS.xml")
     logger.info("Creating METS file %s" % mets_path)
-    metsgen = MetsGenerator(package_dir)
+    metsgen = MetsGenerator(package_dir, file_facts=file_facts)
     metsgen.createMets(mets_data=mets_data, mets_file_path=None, additional_metadata=additional_metadata)
 
     # packaging
@@ -121,23 +173,31 @@ logger = logging.getLogger(__name__)
 
 
 def create_aip(package_dir: str, identifier: str, package_name: str, identifier_map=None, generate_premis: bool=True,
-               generate_package=True, additional_metadata={}) -> bool:
+               generate_package=True, additional_metadata={}, incremental: bool=False, workers: int=1) -> bool:
+    """
+    Create the METS files of an AIP and package it
+    :param incremental: regenerate existing METS files incrementally (only new and modified files are hashed)
+    :param workers: number of worker processes generating the METS files of the representations concurrently; the
+                    root METS file is created when all representations are finished. The package files are hashed by
+                    the same number of threads.
+    """
+
+    # hash the package files once for all METS files (incremental mode: only new and modified files are hashed when
+    # the existing METS files are regenerated)
+    file_facts = None if incremental else PackageFileFacts(package_dir, workers=workers).scan()
 
     # schema file location for Mets generation
     schemas = os.path.join(ROOT, 'resources/schemas')
 
     # for every REPRESENTATION without METS file:
-    for repdir in os.listdir(os.path.join(package_dir, 'representations')):
+    repdirs = os.listdir(os.path.join(package_dir, 'representations'))
+    tasks = []
+    for repdir in repdirs:
         rep_path = os.path.join(package_dir, 'representations/%s' % repdir)
-        # TODO: packageid?
-        # parent = task_context.additional_data['parent_id']
-        mets_data = {'packageid': repdir,
-                     'type': "AIP",
-                     'schemas': schemas,
-                     'parent': ''}
-        metsgen = MetsGenerator(rep_path)
-        metsgen.createMets(mets_data, additional_metadata=additional_metadata)
-
+        rep_file_facts = file_facts.subset(rep_path) if file_facts and workers > 1 else file_facts
+        tasks.append((rep_path, schemas, additional_metadata, incremental, rep_file_facts))
+    _process_representations(_create_aip_representation, tasks, workers)
+    for repdir in repdirs:
         logger.info('Generated a Mets file for representation %s.' % repdir)
 
     #########
@@ -150,8 +210,8 @@ def create_aip(package_dir: str, identifier: str, package_name: str, identifier_
                  'schemas': schemas,
                  'parent': None}
 
-    metsgen = MetsGenerator(package_dir)
-    metsgen.createMets(mets_data, additional_metadata=additional_metadata)
+    metsgen = MetsGenerator(package_dir, file_facts=file_facts)
+    metsgen.createMets(mets_data, additional_metadata=additional_metadata, incremental=incremental)
 
     # TODO: get structMap from submission root METS, translate SIP packagename to
     # AIP UUID and add it to the AIP root METS
@@ -323,13 +383,7 @@ class SIPGenerator():
         self.root_path = root_path
 
     def sha256(self, fname):
-
-        sha256_hash = hashlib.sha256()
-        with open(fname, "rb") as f:
-            # Read and update hash string value in blocks of 4K
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-            return sha256_hash.hexdigest()
+        return get_sha256_hash(fname)
 
     def createAgent(self,role, type, other_type, name, note):
         if other_type:
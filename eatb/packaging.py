@@ -6,81 +6,107 @@ from __future__ import generators
 import logging
 import os
 import re
+import shutil
 import sys
 import tarfile
+import threading
 import zipfile
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from subprocess import check_output
-from eatb.cli import CliCommands, CliCommand
-from eatb.checksum import ChecksumFile, ChecksumAlgorithm
+from eatb.checksum import ChecksumAlgorithm, HashingWriter, DEFAULT_BLOCKSIZE
+from eatb.compression import CompressionCodec, GzipCodec, ZstdCodec
+from eatb.manifest import write_manifest
+from eatb.tar_index import TarIndex, add_indexed, load_tar_index, tar_index_path
 from eatb.utils.reporters import default_reporter
 
 
 class ManifestCreation():
     """
-    Create package file manifest using 'summain'
+    Create package file manifest (JSON array or JSON Lines with the fields Name, Mtime, Size, SHA256)
     """
-    def __init__(self, working_directory, commands=CliCommands()):
+    def __init__(self, working_directory, commands=None, workers=None):
+        """
+        :param working_directory: working directory
+        :param commands: not used anymore (the manifest was created using 'summain' before)
+        :param workers: number of hashing threads (default: number of CPUs)
+        """
         self.working_directory = working_directory
         self.commands = commands
+        self.workers = workers
         if not os.path.exists(working_directory):
             os.makedirs(working_directory)
 
-    def create_manifest(self, package_dir, manifest_file):
-        cli_command = CliCommand("summain", self.commands.get_command_template("summain"))
-        command = cli_command.get_command(dict(manifest_file=manifest_file, package_dir=package_dir))
-        out = check_output(command)
-        return out
+    def create_manifest(self, package_dir, manifest_file, json_lines=False):
+        """
+        Create the manifest of a package directory, entries are written incrementally
+        :param package_dir: package directory
+        :param manifest_file: manifest file path
+        :param json_lines: write JSON Lines instead of a JSON array
+        :return: number of manifest entries
+        """
+        return write_manifest(package_dir, manifest_file, json_lines=json_lines, workers=self.workers)
 
 
-def create_package(input_directory, packagename, gunzip=False, output_directory=None, use_input_dir_as_root=False, exclude=[]) -> str:
+def create_package(input_directory, packagename, gunzip=False, output_directory=None, use_input_dir_as_root=False,
+                   exclude=[], checksum_algorithm=ChecksumAlgorithm.MD5, compression=None, compression_level=None,
+                   workers=None, index=False) -> str:
     """
-    Create package
+    Create package. The input directory is walked only once and the TAR stream is written through a hashing writer,
+    so that the checksum of the package is available when the container is closed (the package is not read again).
     :param input_directory: Input directory
     :param packagename: Name of the package file
     :param output_directory: Output directory (same as input directory if not provided)
-    :gunzip create compressed container package
-    :return: md5checksum of package
+    :gunzip create compressed container package (gzip, same as compression='gzip')
+    :param checksum_algorithm: Algorithm of the returned package checksum (MD5, SHA256 or SHA512)
+    :param compression: Compression codec: 'gzip', 'pgzip' (multi-threaded gzip), 'xz' or 'zstd' (requires the
+                        'zstandard' package); no compression if not provided
+    :param compression_level: Compression level of the codec (codec default if not provided)
+    :param workers: Number of compression threads used by the 'pgzip' and 'zstd' codecs (default: number of CPUs)
+    :param index: Write the sidecar member index next to the container (uncompressed containers only, see tar_index)
+    :return: checksum of package (md5 by default)
     """
 
     # append generation number to tar file; if tar file exists, the generation number is incremented
     input_path = Path(input_directory)
-    extension = '.tar.gz' if gunzip else '.tar'
+    if gunzip and not compression:
+        compression = GzipCodec.name
+    codec = CompressionCodec.factory(compression, compression_level, workers) if compression else None
+    extension = codec.extension if codec else '.tar'
     if not output_directory:
         output_directory = input_path.parent
     storage_tar_file = os.path.join(output_directory, packagename + extension)
-    write_mode = "w:gz" if gunzip else "w:"
-    tar = tarfile.open(storage_tar_file, "w:")
-    total = sum([len(files) for (root, dirs, files) in os.walk(input_directory)])
-    i = 0
-    for subdir, dirs, files in os.walk(input_directory):
-
-        for dir in dirs:
-            entry = os.path.join(os.path.basename(input_directory), subdir, dir)
-            base = os.path.basename(input_directory) if use_input_dir_as_root else ""
-            if not os.listdir(entry):
-                tar.add(entry, arcname=os.path.join(base, os.path.relpath(entry, input_directory)))
-
-        for file in files:
-            entry = os.path.join(os.path.basename(input_directory), subdir, file)
-            base = os.path.basename(input_directory) if use_input_dir_as_root else ""
-
-            def exclude_func(file_name):
-                return os.path.basename(file_name) in exclude
-
-            tar.add(entry, arcname=os.path.join(base, os.path.relpath(entry, input_directory)))
-            if i % 10 == 0:
-                perc = (i * 100) / total
-            i += 1
-    tar.close()
+    base = os.path.basename(input_directory) if use_input_dir_as_root else ""
+    tar_index = TarIndex() if index and not codec else None
 
-    checksum_file = ChecksumFile(storage_tar_file)
-    return checksum_file.get(ChecksumAlgorithm.MD5)
+    def add(tar, entry):
+        arcname = os.path.join(base, os.path.relpath(entry, input_directory))
+        if tar_index is not None:
+            add_indexed(tar, entry, arcname, tar_index)
+        else:
+            tar.add(entry, arcname=arcname)
+
+    with open(storage_tar_file, "wb") as f:
+        writer = HashingWriter(f, [checksum_algorithm])
+        with (codec.writer(writer) if codec else nullcontext(writer)) as tar_stream, \
+                tarfile.open(fileobj=tar_stream, mode="w|", bufsize=DEFAULT_BLOCKSIZE) as tar:
+            for subdir, dirs, files in os.walk(input_directory):
+                for dir in dirs:
+                    entry = os.path.join(subdir, dir)
+                    if not os.listdir(entry):
+                        add(tar, entry)
+                for file in files:
+                    add(tar, os.path.join(subdir, file))
+    if tar_index is not None:
+        st = os.stat(storage_tar_file)
+        tar_index.tar_size, tar_index.tar_mtime_ns = st.st_size, st.st_mtime_ns
+        tar_index.write(tar_index_path(storage_tar_file))
+    return writer.hexdigest(checksum_algorithm)
 
 
 class PackageFormat:
-    TARGZ, TAR, ZIP, NONE = range(4)
+    TARGZ, TAR, ZIP, NONE, TARXZ, TARZST = range(6)
 
     @staticmethod
     def get(filename):
@@ -91,6 +117,10 @@ class PackageFormat:
         """
         if filename.endswith("tar.gz"):
             return PackageFormat.TARGZ
+        if filename.endswith("tar.xz"):
+            return PackageFormat.TARXZ
+        if filename.endswith("tar.zst"):
+            return PackageFormat.TARZST
         if filename.endswith("tar"):
             return PackageFormat.TAR
         if filename.endswith("zip"):
@@ -101,22 +131,106 @@ class PackageFormat:
     def str(alg):
         if alg is PackageFormat.TARGZ:
             return "TARGZ"
+        if alg is PackageFormat.TARXZ:
+            return "TARXZ"
+        if alg is PackageFormat.TARZST:
+            return "TARZST"
         if alg is PackageFormat.TAR:
             return "TAR"
         if alg is PackageFormat.ZIP:
             return "ZIP"
         return "NONE"
 
+    @staticmethod
+    def is_tar(package_format):
+        return package_format in (PackageFormat.TAR, PackageFormat.TARGZ, PackageFormat.TARXZ, PackageFormat.TARZST)
+
+
+@contextmanager
+def open_tar(package_file_path):
+    """
+    Open TAR container for reading (uncompressed, gzip, xz or, if the 'zstandard' package is available, zstd
+    compressed). Zstandard compressed containers are opened in stream mode, i.e. members must be processed in order
+    (see is_streamed).
+    :param package_file_path: package file path
+    :return: context manager providing the TarFile object
+    """
+    if is_streamed(package_file_path):
+        codec = CompressionCodec.factory(ZstdCodec.name)
+        with open(package_file_path, 'rb') as f, codec.reader(f) as stream, \
+                tarfile.open(fileobj=stream, mode='r|', encoding='utf-8') as tar_object:
+            yield tar_object
+    else:
+        with tarfile.open(name=package_file_path, mode='r', encoding='utf-8') as tar_object:
+            yield tar_object
+
+
+def is_streamed(package_file_path):
+    """
+    Containers which can only be read sequentially (the member list is not known before the container is read)
+    :param package_file_path: package file path
+    :return: True if the container is read in stream mode
+    """
+    return PackageFormat.get(package_file_path) == PackageFormat.TARZST
+
 
 logger = logging.getLogger(__name__)
 
+# size of the chunks copied at a time when extracting container members (1 MiB)
+EXTRACT_CHUNKSIZE = 1024 * 1024
+
+
+def member_target_path(extract_to, member_name):
+    """
+    Get the target path of a container member (leading slashes are removed), rejecting members which would be
+    extracted outside of the target directory ('..' components)
+    :param extract_to: target directory
+    :param member_name: member name
+    :return: target path
+    :except ValueError: if the member is outside of the target directory
+    """
+    root = os.path.abspath(extract_to)
+    target = os.path.normpath(os.path.join(root, member_name.lstrip("/")))
+    if os.path.commonpath([root, target]) != root:
+        raise ValueError("Member outside of the target directory: %s" % member_name)
+    return target
+
+
+def copy_file_range_to(fd, offset, size, target_path):
+    """
+    Copy a byte range of an open file into a new file. The file offset of the source is not changed, so that the
+    source file descriptor can be shared by several threads (os.sendfile, os.pread if sendfile is not available).
+    :param fd: source file descriptor
+    :param offset: offset of the byte range
+    :param size: size of the byte range
+    :param target_path: target file path
+    """
+    with open(target_path, 'wb') as out:
+        out_fd = out.fileno()
+        end = offset + size
+        use_sendfile = hasattr(os, "sendfile")
+        while offset < end:
+            count = min(EXTRACT_CHUNKSIZE, end - offset)
+            if use_sendfile:
+                try:
+                    sent = os.sendfile(out_fd, fd, offset, count)
+                except OSError:
+                    use_sendfile = False
+                    continue
+            else:
+                sent = out.write(os.pread(fd, count, offset))
+                out.flush()
+            if sent == 0:
+                raise IOError("Unexpected end of file (%s)" % target_path)
+            offset += sent
+
 
 class PackagedContainer(ABC):
 
-    def __init__(self, container_file, stream=None):
+    def __init__(self, container_file, stream=None, workers=1):
         self.container_file = container_file
-        if stream is None:
-            self.stream = stream if stream else sys.stdout
+        self.stream = stream if stream else sys.stdout
+        self.workers = workers if workers else (os.cpu_count() or 1)
         self.success = False
         self.percent = 0
         self.number_of_items = 0
@@ -126,11 +240,18 @@ class PackagedContainer(ABC):
         pass
 
     @staticmethod
-    def factory(filename):
-        if PackageFormat.get(filename) == PackageFormat.TAR or PackageFormat.get(filename) == PackageFormat.TARGZ:
-            return TarContainer(filename)
+    def factory(filename, workers=1):
+        """
+        Get container object
+        :param filename: container file
+        :param workers: number of extraction threads (None: number of CPUs); parallel extraction is supported for
+                        ZIP and uncompressed TAR containers
+        :return: TarContainer or ZipContainer
+        """
+        if PackageFormat.is_tar(PackageFormat.get(filename)):
+            return TarContainer(filename, workers=workers)
         if PackageFormat.get(filename) == PackageFormat.ZIP:
-            return ZipContainer(filename)
+            return ZipContainer(filename, workers=workers)
         assert 0, "Package format not supported"
 
 
@@ -139,8 +260,8 @@ class TarContainer(PackagedContainer):
     Extract TAR container
     """
 
-    def __init__(self, container_file, stream=None):
-        super().__init__(container_file, stream)
+    def __init__(self, container_file, stream=None, workers=1):
+        super().__init__(container_file, stream, workers)
 
     def extract(self, extract_to):
         """
@@ -149,44 +270,110 @@ class TarContainer(PackagedContainer):
         :param extract_to: target directory
         :return:
         """
+        if self.workers > 1 and PackageFormat.get(self.container_file) == PackageFormat.TAR:
+            return self.extract_parallel(extract_to)
         total = 0
         try:
-            tar_object = tarfile.open(name=self.container_file, mode='r', encoding='utf-8')
-            members = tar_object.getmembers()
-            total = len(members)
-            print("Total: " + str(total))
-            i = 100
-            for member in members:
-                if i % 100 == 0:
-                    perc = (i*100)/total
-                    logger.debug("100 processed (item %d) ... (%d)" % (i, perc))
-                tar_object.extract(member, extract_to)
-                i += 1
+            with open_tar(self.container_file) as tar_object:
+                streamed = is_streamed(self.container_file)
+                members = tar_object if streamed else tar_object.getmembers()
+                if not streamed:
+                    total = len(members)
+                    print("Total: " + str(total))
+                i = 100
+                for member in members:
+                    if i % 100 == 0 and total:
+                        perc = (i*100)/total
+                        logger.debug("100 processed (item %d) ... (%d)" % (i, perc))
+                    tar_object.extract(member, extract_to)
+                    i += 1
+                if streamed:
+                    total = i - 100
         except (ValueError, OSError, IOError, tarfile.TarError) as why:
             logger.error('Problem to extract %s' % self.container_file, why)
         return total
 
-    def has_member(self, package_file_path, member_name):
-        tar_object = tarfile.open(name=package_file_path, mode='r', encoding='utf-8')
+    def extract_parallel(self, extract_to, progress_reporter=default_reporter):
+        """
+        Extract an uncompressed TAR container using a pool of threads. Regular files are copied by offset from a
+        file descriptor shared by the threads; directories are created before and other members (links, special
+        files) are extracted after the regular files. Of members occurring more than once, only the last occurrence
+        is extracted (as by a sequential extraction).
+        :param extract_to: target directory
+        :param progress_reporter: progress reporter (percentage of extracted files)
+        :return: number of members
+        """
+        total = 0
         try:
-            tar_object.getmember(member_name)
-            return True
-        except KeyError:
-            return False
+            with tarfile.open(name=self.container_file, mode='r:', encoding='utf-8') as tar_object:
+                members = tar_object.getmembers()
+                total = len(members)
+                # a member name can occur more than once, the last occurrence overrides the earlier ones
+                last_members = {member_target_path(extract_to, member.name): member for member in members}
+                directories, files, others = [], [], []
+                for member in members:
+                    target = member_target_path(extract_to, member.name)
+                    if last_members[target] is not member:
+                        continue
+                    if member.isdir():
+                        os.makedirs(target, exist_ok=True)
+                        directories.append((member, target))
+                    elif member.isreg() and not member.issparse():
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        files.append((member, target))
+                    else:
+                        others.append(member)
+                fd = os.open(self.container_file, os.O_RDONLY)
+                try:
+                    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                        futures = [pool.submit(copy_file_range_to, fd, member.offset_data, member.size, target)
+                                   for member, target in files]
+                        for i, future in enumerate(as_completed(futures), start=1):
+                            future.result()
+                            if i % 100 == 0:
+                                progress_reporter((i * 100) / len(files))
+                finally:
+                    os.close(fd)
+                for member in others:
+                    tar_object.extract(member, extract_to)
+                for member, target in files + list(reversed(directories)):
+                    tar_object.chown(member, target, False)
+                    tar_object.chmod(member, target)
+                    tar_object.utime(member, target)
+        except (ValueError, OSError, IOError, tarfile.TarError) as why:
+            logger.error('Problem to extract %s: %s' % (self.container_file, why))
+        return total
+
+    def has_member(self, package_file_path, member_name):
+        if PackageFormat.get(package_file_path) == PackageFormat.TAR:
+            return member_name in load_tar_index(package_file_path)
+        with open_tar(package_file_path) as tar_object:
+            if is_streamed(package_file_path):
+                return any(member.name == member_name for member in tar_object)
+            try:
+                tar_object.getmember(member_name)
+                return True
+            except KeyError:
+                return False
 
     def extract_with_report(self, package_file_path, extract_to, progress_reporter=default_reporter,
                             total=0, current=0):
         try:
             logger.info("Extracting package %s to %s" % (package_file_path, extract_to))
-            tar_object = tarfile.open(name=package_file_path, mode='r', encoding='utf-8')
-            members = tar_object.getmembers()
-            total = len(members)
-            for member in members:
-                if current % 2 == 0:
-                    perc = (current * 100) / total
-                    progress_reporter(perc)
-                tar_object.extract(member, extract_to)
-                current += 1
+            with open_tar(package_file_path) as tar_object:
+                streamed = is_streamed(package_file_path)
+                members = tar_object if streamed else tar_object.getmembers()
+                if not streamed:
+                    total = len(members)
+                for member in members:
+                    if current % 2 == 0 and total:
+                        perc = (current * 100) / total
+                        progress_reporter(perc)
+                    tar_object.extract(member, extract_to)
+                    current += 1
+                if streamed:
+                    total = current
+                    progress_reporter(100)
         except (ValueError, OSError, IOError, tarfile.TarError) as why:
             logger.error('Problem to extract %s' % package_file_path, why)
         return total
@@ -194,46 +381,57 @@ class TarContainer(PackagedContainer):
 
 class ZipContainer(PackagedContainer):
 
-    def __init__(self, container_file, stream=None):
-        super().__init__(container_file, stream)
+    def __init__(self, container_file, stream=None, workers=1, chunksize=EXTRACT_CHUNKSIZE):
+        """
+        Constructor
+        :param container_file: ZIP container file
+        :param stream: stream used for status messages (default: stdout)
+        :param workers: number of extraction threads
+        :param chunksize: size of the buffer used to copy the entries (memory used per extraction thread)
+        """
+        super().__init__(container_file, stream, workers)
+        self.chunksize = chunksize
 
     def extract(self, extract_to):
         return self.unzip(extract_to)
 
     def unzip(self, directory, progress_reporter=default_reporter):
+        """
+        Extract the ZIP container; entries are streamed in chunks, the memory used does not depend on the entry size.
+        :param directory: target directory
+        :param progress_reporter: progress reporter (percentage of extracted bytes, in steps of 10 percent)
+        :return: success (bool)
+        """
         self.percent = 10
         try:
             if not directory.endswith(':') and not os.path.exists(directory):
                 os.mkdir(directory)
 
-            zf = zipfile.ZipFile(self.container_file)
-
-            # create directory structure
-            self._createstructure(self.container_file, directory)
-
-            num_files = len(zf.namelist())
-            self.number_of_items = num_files
-
-            self.stream.write("Extracting %s items (directories and files)\n" % num_files)
-
-            percent = self.percent
-            divisions = 100 / percent
-
-            percent = int(num_files / divisions)
-
-            # extract files to directory structure
-            for i, name in enumerate(zf.namelist()):
-                if percent > 0 and (i % percent) == 0 and i > 0:
-                    complete = int(i / percent) * percent
-                    progress_reporter(complete)
-
-                if not name.endswith('/'):
-                    outfile = open(os.path.join(directory, name), 'wb')
-                    outfile.write(zf.read(name))
-                    outfile.flush()
-                    outfile.close()
-            num_f = sum([len(files) for r, d, files in os.walk(directory)])
-            self.stream.write("Extracted %s files\n" % num_f)
+            with zipfile.ZipFile(self.container_file) as zf:
+                infos = zf.infolist()
+
+                # create directory structure
+                self._makedirs(self._listdirs(infos), directory)
+
+                num_files = len(infos)
+                self.number_of_items = num_files
+
+                self.stream.write("Extracting %s items (directories and files)\n" % num_files)
+
+                files = [info for info in infos if not info.is_dir()]
+                if self.workers > 1:
+                    self._extract_parallel(files, directory, progress_reporter)
+                else:
+                    total_bytes = sum(info.file_size for info in files)
+                    progress = _ByteProgress(total_bytes, self.percent, progress_reporter)
+                    # extract files to directory structure
+                    for info in files:
+                        with zf.open(info) as source, \
+                                open(member_target_path(directory, info.filename), 'wb') as outfile:
+                            for chunk in iter(lambda: source.read(self.chunksize), b''):
+                                outfile.write(chunk)
+                                progress.update(len(chunk))
+            self.stream.write("Extracted %s files\n" % len(files))
             self.success = True
         except ValueError as e:
             self.stream.write('Problem to extract %s: %s\n' % (self.container_file, str(e)))
@@ -246,38 +444,86 @@ class ZipContainer(PackagedContainer):
             self.success = False
         return self.success
 
+    def _extract_parallel(self, files, directory, progress_reporter=default_reporter):
+        """
+        Extract files of the ZIP container using a pool of threads; each thread reads from its own ZipFile handle
+        and streams the entries in chunks into the target files (the directory structure must exist).
+        :param files: ZipInfo objects of the files
+        :param directory: target directory
+        :param progress_reporter: progress reporter (percentage of extracted bytes, in steps of 10 percent)
+        """
+        handles = threading.local()
+        opened = []
+        lock = threading.Lock()
+
+        def extract_entry(info):
+            zf = getattr(handles, "zf", None)
+            if zf is None:
+                zf = handles.zf = zipfile.ZipFile(self.container_file)
+                with lock:
+                    opened.append(zf)
+            target = member_target_path(directory, info.filename)
+            with zf.open(info) as source, open(target, 'wb') as outfile:
+                shutil.copyfileobj(source, outfile, self.chunksize)
+            return info.file_size
+
+        progress = _ByteProgress(sum(info.file_size for info in files), self.percent, progress_reporter)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(extract_entry, info) for info in files]
+                for future in as_completed(futures):
+                    progress.update(future.result())
+        finally:
+            for zf in opened:
+                zf.close()
+
     @staticmethod
     def has_member(package_file_path, member_name):
         zf = zipfile.ZipFile(package_file_path)
         return member_name in zf.namelist()
 
-    def _createstructure(self, file, directory):
-        self._makedirs(self._listdirs(file), directory)
-
     @classmethod
     def _makedirs(cls, directories, basedir):
         """ Create directories """
         for directory in directories:
-            curdir = os.path.join(basedir, directory)
+            curdir = member_target_path(basedir, directory)
             if not os.path.exists(curdir):
                 os.makedirs(curdir)
                 print(curdir)
 
     @classmethod
-    def _listdirs(cls, file):
-        """ Get the directories """
-        zf = zipfile.ZipFile(file)
-        dirs = []
-        filelist = filter(lambda x: not x.endswith('/'), zf.namelist())
-        dirlist = filter(lambda x: x.endswith('/'), zf.namelist())
-        for f in filelist:
-            path, filename = os.path.split(f)
-            if path.startswith("/"):
-                path = path[1:len(path)]
-            dirs.append(path)
-        dirs.extend(dirlist)
-        dirs.sort()
-        return dirs
+    def _listdirs(cls, infos):
+        """ Get the directories (sorted) from the ZipInfo objects of a container """
+        dirs = set()
+        for info in infos:
+            if info.is_dir():
+                dirs.add(info.filename)
+            else:
+                path, _ = os.path.split(info.filename)
+                dirs.add(path.lstrip("/"))
+        return sorted(dirs)
+
+
+class _ByteProgress(object):
+    """
+    Progress of an extraction measured in bytes, reported whenever a further step (e.g. 10 percent) is completed.
+    """
+
+    def __init__(self, total_bytes, step, progress_reporter):
+        self.total_bytes = total_bytes
+        self.step = step
+        self.progress_reporter = progress_reporter
+        self.bytes_done = 0
+        self.reported = 0
+
+    def update(self, num_bytes):
+        self.bytes_done += num_bytes
+        if self.total_bytes <= 0:
+            return
+        complete = int((self.bytes_done * 100 / self.total_bytes) / self.step) * self.step
+        if complete > self.reported:
+            self.reported = complete
+            self.progress_reporter(complete)
 
 
 class ChunkedTarEntryReader(object):
@@ -285,9 +531,10 @@ class ChunkedTarEntryReader(object):
     Chunked TAR entry reader allowing to read large TAR entries.
     """
 
-    def __init__(self, tfile: tarfile, chunksize: int = 512):
+    def __init__(self, tfile: tarfile, chunksize: int = DEFAULT_BLOCKSIZE, progress_reporter=default_reporter):
         self.tfile = tfile
         self.chunksize = chunksize
+        self.progress_reporter = progress_reporter
         self.bytesread = 0
 
     def close(self):
@@ -297,10 +544,16 @@ class ChunkedTarEntryReader(object):
 
     def chunks(self, entry, total_bytes_read=0, bytes_total=-1):
         """
-        Chunk generator, returns data chunks which can be iterated in a for loop.
+        Chunk generator, returns data chunks which can be iterated in a for loop. The progress is reported whenever
+        a further percent is completed.
         :return: generator with data chunks
         """
-        tinfo = self.tfile.getmember(entry)
+        seekable = getattr(self.tfile.fileobj, "seekable", None)
+        if self.tfile.name and seekable and seekable() and PackageFormat.get(self.tfile.name) == PackageFormat.TAR:
+            # seek to the member header instead of scanning all headers of the container
+            tinfo = load_tar_index(self.tfile.name).tarinfo(self.tfile, entry)
+        else:
+            tinfo = self.tfile.getmember(entry)
 
         if bytes_total == -1:
             bytes_total = tinfo.size
@@ -309,13 +562,15 @@ class ChunkedTarEntryReader(object):
         def readchunk():
             return f.read(self.chunksize)
 
-        for chunk in iter(readchunk, ''):
+        reported = -1
+        for chunk in iter(readchunk, b''):
             self.bytesread += len(chunk)
-            percent = (total_bytes_read+self.bytesread) * 100 / bytes_total
-            default_reporter(percent)
+            percent = int((total_bytes_read + self.bytesread) * 100 / bytes_total) if bytes_total > 0 else 100
+            if percent > reported:
+                reported = percent
+                self.progress_reporter(percent)
             yield chunk
-            if percent == 100:
-                break
+
 
 def get_deliveries(path, task_logger):
     package_files = [f for f in os.listdir(path) if re.search(r'.*\.(zip|tar)$', f)]
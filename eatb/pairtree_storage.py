@@ -1,17 +1,57 @@
+import mmap
 import os
 import pathlib
 import re
 import shutil
+import tarfile
+from collections import namedtuple
+from functools import lru_cache
 from itertools import groupby
 from pairtree import PairtreeStorageFactory, ObjectNotFoundException
-from eatb import VersionDirFormat
+from eatb import VersionDirFormat, VersionDirPattern
 from eatb.ipstate import IpState
+from eatb.repository_catalogue import RepositoryCatalogue
+from eatb.tar_index import TAR_INDEX_SUFFIX, load_tar_index, read_valid_tar_index, tar_index_path, write_tar_index
 from eatb.utils.fileutils import rec_find_files
-from eatb.utils.fileutils import to_safe_filename
+from eatb.checksum import get_sha256_hash, ChecksumAlgorithm
+from eatb.utils.fileutils import to_safe_filename, copy_file_content, reflink_file
 from eatb import logger
 from eatb.utils.reporters import default_reporter
 
 
+@lru_cache(maxsize=4096)
+def _scan_version_nums(data_directory, mtime_ns, nlink):
+    """
+    Scan the version directories of an object. Modification time and link count of the data directory are part of
+    the cache key, so that the cached result is not used anymore when a version directory is added or removed (see
+    PairtreeStorage._version_nums for changes which do not alter the key).
+    :param data_directory: data directory of the object
+    :param mtime_ns: modification time of the data directory
+    :param nlink: link count of the data directory
+    :return: frozen set of version numbers
+    """
+    version_nums = set()
+    with os.scandir(data_directory) as entries:
+        for entry in entries:
+            match = VersionDirPattern.match(entry.name)
+            if match and entry.is_dir():
+                version_nums.add(int(match.group(1)))
+    return frozenset(version_nums)
+
+
+# result of storing a container: version and number of bytes stored for the version (0 if the container is shared
+# with the previous version; a reflink of the source counts in full, it does not share data with earlier versions)
+StoredContainer = namedtuple("StoredContainer", ["version", "bytes_written"])
+
+
+class StorageMode:
+    """
+    Modes of writing containers to the storage
+    """
+    COPY, REFLINK, DEDUP = "copy", "reflink", "dedup"
+    modes = (COPY, REFLINK, DEDUP)
+
+
 class PairtreeStorage:
     """
     Pairtree storage class allowing to build a filesystem hierarchy for holding objects that are located by mapping
@@ -20,11 +60,13 @@ class PairtreeStorage:
     storage_factory = None
     repository_storage_dir = None
 
-    def __init__(self, repository_storage_dir, representations_directory="representations"):
+    def __init__(self, repository_storage_dir, representations_directory="representations", catalogue=False):
         """
         Constructor initialises pairtree repository
         :param repository_storage_dir: repository storage directory
         :param representations_directory: representations directory
+        :param catalogue: use the repository catalogue (see RepositoryCatalogue); the catalogue is built if it does
+                          not exist. An existing catalogue is always kept up to date when objects are stored.
         """
         #super().__init__(repository_storage_dir)
         self.storage_factory = PairtreeStorageFactory()
@@ -32,42 +74,157 @@ class PairtreeStorage:
         self.representations_directory = representations_directory
         self.repo_storage_client = self.storage_factory.get_store(store_dir=repository_storage_dir, uri_base="http://")
         self.representations_directory = representations_directory
+        self.catalogue = RepositoryCatalogue(repository_storage_dir)
+        if catalogue and not self.catalogue.exists():
+            self.rebuild_catalogue()
 
     # noinspection PyProtectedMember
-    def store(self, identifier, source_file_path, progress_reporter=default_reporter):
+    def store(self, identifier, source_file_path, progress_reporter=default_reporter, index=False,
+              mode=StorageMode.COPY):
         """
         Storing a directory in the pairtree path according to the given identifier. If a version of the object exists,
-        a new version is created.
+        a new version is created. A valid sidecar member index of the source container is stored alongside.
         :param identifier: identifier
         :param source_file_path: source file path
         :param progress_reporter: progress reporter
-        :return:
+        :param index: create the sidecar member index of the stored container if the source has none (uncompressed
+                      TAR containers only)
+        :param mode: storage mode (see StorageMode): 'copy' (default), 'reflink' (copy-on-write clone of the source
+                     if supported by the file system, otherwise copy) or 'dedup' (hardlink to the container of the
+                     previous version if it is identical, otherwise reflink or copy). A reflink avoids copying the
+                     data and saves space relative to the source only (as long as the source is kept); a changed
+                     container does not share any data with the previous version.
+        :return: version
+        """
+        return self.store_container(identifier, source_file_path, progress_reporter, index, mode).version
+
+    # noinspection PyProtectedMember
+    def store_container(self, identifier, source_file_path, progress_reporter=default_reporter, index=False,
+                        mode=StorageMode.COPY):
+        """
+        Store a container as new version of an object (see store)
+        :return: StoredContainer (version, number of bytes stored for the version)
         """
+        if mode not in StorageMode.modes:
+            raise ValueError("Unsupported storage mode: %s" % mode)
         # pairtree object path
         pairtree_object_path = self.repo_storage_client._id_to_dirpath(identifier)
+        # check source file exists
+        if not os.path.exists(source_file_path):
+            raise ValueError("Source file does not exist: %s" % source_file_path)
         # next version string
         next_version = self._next_version(identifier)
         # data directory
         target_data_directory = os.path.join(pairtree_object_path, "data")
         # create data directory path
         pathlib.Path(target_data_directory).mkdir(parents=True, exist_ok=True)
-        # data version directory
-        target_data_version_directory = os.path.join(target_data_directory, next_version)
-        # create data version directory
-        os.makedirs(target_data_version_directory, exist_ok=True)
+        # create data version directory; the directory must not exist (the cached version list can be outdated if
+        # the data directory was changed within the timestamp granularity of the file system), otherwise the next
+        # version number is tried, so that an existing version is never overwritten
+        while True:
+            target_data_version_directory = os.path.join(target_data_directory, next_version)
+            try:
+                os.mkdir(target_data_version_directory)
+                break
+            except FileExistsError:
+                next_version = VersionDirFormat % (int(next_version[1:]) + 1)
 
         # archive file name
         safe_identifier_name = to_safe_filename(identifier)
         archive_file = "%s.tar" % safe_identifier_name
-        # check source file exists
-        if not os.path.exists(source_file_path):
-            raise ValueError("Source file does not exist: %s" % source_file_path)
         # target file path
         target_file_path = os.path.join(target_data_version_directory, archive_file)
-        # copy file
-        shutil.copy2(source_file_path, target_file_path)
+        previous_version = self._previous_version(next_version) if mode == StorageMode.DEDUP else None
+        previous_file_path = os.path.join(target_data_directory, previous_version, archive_file) \
+            if previous_version else None
+        bytes_written, digest = self._write_container(source_file_path, target_file_path, mode, previous_file_path,
+                                                      progress_reporter)
+        logger.info("Stored %s (version %s): %d bytes stored" % (identifier, next_version, bytes_written))
+        self._store_tar_index(source_file_path, target_file_path, index, digest)
+        if self.catalogue.exists():
+            self.catalogue.update(identifier, int(next_version[1:]), target_file_path)
         progress_reporter(100)
-        return next_version
+        return StoredContainer(next_version, bytes_written)
+
+    @staticmethod
+    def _previous_version(version):
+        version_num = int(version[1:])
+        return VersionDirFormat % (version_num - 1) if version_num > 1 else None
+
+    @staticmethod
+    def _identical_container(source_file_path, previous_file_path):
+        """
+        Verify if a container is identical to the container of the previous version. Sizes and the sidecar member
+        indexes are compared first; the SHA-256 digests of the containers are taken from the sidecar indexes if
+        recorded there, a container is only hashed if its digest is not recorded.
+        :return: tuple (True if the containers are identical, SHA-256 digest of the source container or None if not
+                 computed)
+        """
+        if os.path.getsize(source_file_path) != os.path.getsize(previous_file_path):
+            return False, None
+        source_index = read_valid_tar_index(source_file_path)
+        previous_index = read_valid_tar_index(previous_file_path)
+        if source_index is not None and previous_index is not None:
+            if len(source_index) != len(previous_index):
+                return False, None
+            for entry, previous_entry in zip(source_index.entries.values(), previous_index.entries.values()):
+                if entry[:4] != previous_entry[:4] or \
+                        (entry.digest and previous_entry.digest and entry.digest != previous_entry.digest):
+                    return False, None
+        source_digest = source_index.tar_digest if source_index is not None and source_index.tar_digest \
+            else get_sha256_hash(source_file_path)
+        previous_digest = previous_index.tar_digest if previous_index is not None and previous_index.tar_digest \
+            else get_sha256_hash(previous_file_path)
+        return source_digest == previous_digest, source_digest
+
+    @staticmethod
+    def _write_container(source_file_path, target_file_path, mode, previous_file_path, progress_reporter):
+        """
+        Write the container to the version directory
+        :return: tuple (number of bytes stored, SHA-256 digest of the container or None if not computed)
+        """
+        digest = None
+        if previous_file_path and os.path.isfile(previous_file_path):
+            identical, digest = PairtreeStorage._identical_container(source_file_path, previous_file_path)
+            if identical:
+                # identical to the container of the previous version, the versions share the (immutable) file
+                os.link(previous_file_path, target_file_path)
+                logger.debug("Container %s is a hardlink of %s" % (target_file_path, previous_file_path))
+                return 0, digest
+        if mode in (StorageMode.REFLINK, StorageMode.DEDUP) and reflink_file(source_file_path, target_file_path):
+            shutil.copystat(source_file_path, target_file_path)
+            logger.debug("Container %s is a reflink of %s" % (target_file_path, source_file_path))
+            # the clone shares its data with the source only, which is usually removed after storing
+            return os.path.getsize(target_file_path), digest
+        # copy file (kernel copy if supported) and metadata; in dedup mode, the digest is computed during the copy
+        # (if not known already) to be recorded for the next version
+        algorithms = [ChecksumAlgorithm.SHA256] if mode == StorageMode.DEDUP and digest is None else None
+        copied, digests = copy_file_content(source_file_path, target_file_path, checksum_algorithms=algorithms,
+                                            progress_reporter=progress_reporter)
+        shutil.copystat(source_file_path, target_file_path)
+        return copied, digest if digest else digests.get(ChecksumAlgorithm.SHA256)
+
+    @staticmethod
+    def _store_tar_index(source_file_path, target_file_path, create, digest=None):
+        """
+        Store the sidecar member index of a container next to the stored container
+        :param source_file_path: source container path
+        :param target_file_path: stored container path
+        :param create: create the index from the stored container if the source has no valid index
+        :param digest: SHA-256 digest of the container recorded in the index, if known
+        """
+        tar_index = read_valid_tar_index(source_file_path)
+        if tar_index is not None:
+            st = os.stat(target_file_path)
+            tar_index.tar_size, tar_index.tar_mtime_ns = st.st_size, st.st_mtime_ns
+            tar_index.tar_digest = tar_index.tar_digest if tar_index.tar_digest else digest
+            tar_index.write(tar_index_path(target_file_path))
+            return
+        if create:
+            try:
+                write_tar_index(target_file_path, digest)
+            except tarfile.TarError as e:
+                logger.warning("Unable to create TAR index of %s: %s" % (target_file_path, e))
 
     def identifier_object_exists(self, identifier):
         """
@@ -99,16 +256,39 @@ class PairtreeStorage:
         """
         return self.repo_storage_client.list_parts(identifier, "data")
 
+    # noinspection PyProtectedMember
+    def _version_nums(self, identifier):
+        """
+        Get the version numbers of an object (single scan of the data directory, cached as long as the data directory
+        is unchanged)
+        :param identifier: identifier
+        :return: set of version numbers or None if the object does not exist
+        """
+        data_directory = os.path.join(self.repo_storage_client._id_to_dirpath(identifier), "data")
+        try:
+            st = os.stat(data_directory)
+        except FileNotFoundError:
+            return None
+        version_nums = _scan_version_nums(data_directory, st.st_mtime_ns, st.st_nlink)
+        # the cache key is unchanged if a version directory was added within the timestamp granularity of the file
+        # system, by another host (cached attributes on NFS) or on a file system with a constant directory link count
+        # (Btrfs): the data directory is scanned again if the version following the cached head exists
+        next_version_directory = os.path.join(data_directory, VersionDirFormat % (max(version_nums, default=0) + 1))
+        if os.path.isdir(next_version_directory):
+            version_nums = _scan_version_nums.__wrapped__(data_directory, st.st_mtime_ns, st.st_nlink)
+        return version_nums
+
     def _next_version(self, identifier):
         """
         Get next formatted version directory name
         :param identifier: identifier
         :return: next formatted version directory name
         """
-        if not self.identifier_object_exists(identifier):
+        version_nums = self._version_nums(identifier)
+        if version_nums is None:
             return VersionDirFormat % 1
         version_num = 2
-        while self.identifier_version_object_exists(identifier, version_num):
+        while version_num in version_nums:
             version_num += 1
         return VersionDirFormat % version_num
     
@@ -135,10 +315,11 @@ class PairtreeStorage:
         :param identifier: identifier
         :return: current version number
         """
-        if not self.identifier_object_exists(identifier):
+        version_nums = self._version_nums(identifier)
+        if version_nums is None:
             return -1
         version_num = 1
-        while self.identifier_version_object_exists(identifier, version_num):
+        while version_num in version_nums:
             version_num += 1
         version_num -= 1
         return version_num
@@ -164,19 +345,84 @@ class PairtreeStorage:
         logger.debug("Valid data directory found at: %s", target_data_version_directory)
         return target_data_version_directory
 
+    # noinspection PyProtectedMember
+    def get_container_path(self, identifier, version):
+        """
+        Get the path of the stored container of an object version
+        :param identifier: identifier
+        :param version: version (formatted version directory name, e.g. 'v00001', or version number)
+        :return: container path
+        :except ObjectNotFoundException: if the container does not exist
+        """
+        if isinstance(version, int):
+            version = VersionDirFormat % version
+        dirpath = self.repo_storage_client._id_to_dirpath(identifier)
+        container_path = os.path.join(dirpath, "data", version, "%s.tar" % to_safe_filename(identifier))
+        if not os.path.isfile(container_path):
+            raise ObjectNotFoundException(f"Container not found: {container_path}")
+        return container_path
+
+    def read_member_range(self, identifier, version, member, offset=0, length=None):
+        """
+        Read a byte range of a member of a stored (uncompressed) container. The range is memory mapped and returned
+        as a memoryview without copying the data; only the pages of the range are read when the buffer is accessed.
+        The member is located using the sidecar index of the container (see tar_index).
+        :param identifier: identifier
+        :param version: version (formatted version directory name, e.g. 'v00001', or version number)
+        :param member: member name
+        :param offset: offset of the range in the member data
+        :param length: length of the range (default: up to the end of the member); the range is truncated at the end
+                       of the member
+        :return: read-only memoryview of the range
+        :except ObjectNotFoundException: if the container does not exist
+        :except KeyError: if the container has no member of the given name
+        :except ValueError: if offset or length are not valid
+        """
+        container_path = self.get_container_path(identifier, version)
+        entry = load_tar_index(container_path).get(member)
+        if entry is None:
+            raise KeyError("Member not found: %s" % member)
+        if offset < 0 or offset > entry.size or (length is not None and length < 0):
+            raise ValueError("Invalid range (offset: %d, length: %s) of member %s (size: %d)" %
+                             (offset, length, member, entry.size))
+        end = entry.size if length is None else min(entry.size, offset + length)
+        if end == offset:
+            return memoryview(b'')
+        start = entry.data_offset + offset
+        # mmap offsets must be multiples of the allocation granularity
+        map_offset = start - start % mmap.ALLOCATIONGRANULARITY
+        with open(container_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), length=entry.data_offset + end - map_offset, offset=map_offset,
+                               access=mmap.ACCESS_READ)
+        # the mapping is released when the memoryview (and all views derived from it) are released
+        return memoryview(mapped)[start - map_offset:]
+
+    # noinspection PyProtectedMember
+    def rebuild_catalogue(self, workers=None):
+        """
+        Rebuild the repository catalogue by scanning the repository directories in parallel
+        :param workers: number of scanning threads (default: number of CPUs)
+        :return: number of objects
+        """
+        return self.catalogue.rebuild(self.repo_storage_client._get_id_from_dirpath, workers)
+
     # noinspection PyProtectedMember
     def latest_version_ip_list(self) -> list:
         """
-        Get a list of the latest version directories from repository storage.
+        Get a list of the latest version directories from repository storage. The repository catalogue is queried if
+        it exists, otherwise the repository is scanned.
         :return: list of latest version directories
         """
+        if self.catalogue.exists():
+            return self.catalogue.latest_versions()
+
         # Find all directories recursively in the repository storage
         directories = rec_find_files(self.repository_storage_dir)
         sortkeyfn = lambda s: s[1]  # Sort by version number
         tuples = []
 
         for directory in directories:
-            if "/data/v" in directory:
+            if "/data/v" in directory and not directory.endswith(TAR_INDEX_SUFFIX):
                 # Extract version from the path
                 version_match = re.search(r'v[0-9]{5,5}', directory)
                 if version_match:
@@ -193,6 +439,7 @@ class PairtreeStorage:
             items_grouped_by_version.append(dict(version=key, items=list(v[0] for v in valuesiter)))
 
         lastversionfiles = []
+        object_ids = set()
         for version_items in items_grouped_by_version:
             for item in version_items['items']:
                 # Get the root directory for the object
@@ -201,7 +448,8 @@ class PairtreeStorage:
                 obj_id = self.repo_storage_client._get_id_from_dirpath(root_dir)
 
                 # Avoid duplicates based on object ID
-                if obj_id not in [x['id'] for x in lastversionfiles]:
+                if obj_id not in object_ids:
+                    object_ids.add(obj_id)
                     lastversionfiles.append({
                         "id": obj_id,
                         "version": version_items['version'],
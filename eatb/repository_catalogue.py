@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import closing
+
+from eatb import logger, VersionDirPattern
+from eatb.tar_index import TAR_INDEX_SUFFIX
+
+# name of the catalogue database in the repository storage directory
+CATALOGUE_FILE = "eatb_catalogue.sqlite"
+
+# maximum length of the pairtree 'shorty' directory names
+SHORTY_LENGTH = 2
+
+
+class RepositoryCatalogue:
+    """
+    Persistent catalogue (SQLite) of the objects of a pairtree repository with their latest version and the path of
+    the stored item (container) of the latest version. The catalogue is updated by PairtreeStorage.store and can be
+    rebuilt from the repository (see rebuild).
+    """
+
+    def __init__(self, repository_storage_dir):
+        """
+        Constructor
+        :param repository_storage_dir: repository storage directory
+        """
+        self.repository_storage_dir = repository_storage_dir
+        self.db_path = os.path.join(repository_storage_dir, CATALOGUE_FILE)
+
+    def exists(self):
+        return os.path.exists(self.db_path)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            "id TEXT PRIMARY KEY, version INTEGER NOT NULL, path TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS objects_version ON objects (version)")
+        return conn
+
+    def update(self, identifier, version_num, path):
+        """
+        Record a stored version (an older version does not replace a newer one)
+        :param identifier: identifier
+        :param version_num: version number
+        :param path: path of the stored item
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO objects (id, version, path) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET version = excluded.version, path = excluded.path "
+                "WHERE excluded.version >= objects.version",
+                (identifier, version_num, path))
+
+    def latest_versions(self):
+        """
+        Get the latest versions of all objects
+        :return: list of dictionaries (keys: id, version, path), sorted by version number (descending order)
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT id, version, path FROM objects ORDER BY version DESC, rowid").fetchall()
+        return [{"id": obj_id, "version": version, "path": path} for obj_id, version, path in rows]
+
+    def rebuild(self, id_from_dirpath, workers=None):
+        """
+        Rebuild the catalogue by scanning the repository. Only directories are listed (the pairtree 'shorty'
+        directories, the data directories and the latest version directory of each object) using a pool of threads.
+        :param id_from_dirpath: function mapping an object directory path to the identifier
+        :param workers: number of scanning threads (default: number of CPUs)
+        :return: number of objects
+        """
+        objects = scan_repository(os.path.join(self.repository_storage_dir, "pairtree_root"), workers)
+        tmp_path = self.db_path + ".rebuild"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        rebuilt = RepositoryCatalogue(self.repository_storage_dir)
+        rebuilt.db_path = tmp_path
+        with closing(rebuilt._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO objects (id, version, path) VALUES (?, ?, ?)",
+                             [(id_from_dirpath(object_dir), version_num, path)
+                              for object_dir, version_num, path in objects])
+            conn.execute("PRAGMA journal_mode=DELETE")
+        os.replace(tmp_path, self.db_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+        logger.info("Repository catalogue rebuilt: %d objects" % len(objects))
+        return len(objects)
+
+
+def _latest_version_item(data_dir):
+    """
+    Get latest version number and stored item of an object
+    :param data_dir: data directory of the object
+    :return: tuple (version number, item path) or None if the object has no version with a stored item
+    """
+    versions = []
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            match = VersionDirPattern.match(entry.name)
+            if match and entry.is_dir():
+                versions.append((int(match.group(1)), entry.path))
+    for version_num, version_dir in sorted(versions, reverse=True):
+        for root, dirs, files in os.walk(version_dir):
+            dirs.sort()
+            items = sorted(f for f in files if not f.endswith(TAR_INDEX_SUFFIX))
+            if items:
+                return version_num, os.path.join(root, items[0])
+    return None
+
+
+def _scan_dir(directory):
+    """
+    Scan a pairtree directory
+    :param directory: directory
+    :return: tuple (list of sub-directories to scan, object tuple (object dir, version number, item path) or None)
+    """
+    subdirs = []
+    found = None
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if entry.name == "data":
+                latest = _latest_version_item(entry.path)
+                if latest:
+                    found = (directory, latest[0], latest[1])
+            elif len(entry.name) <= SHORTY_LENGTH:
+                subdirs.append(entry.path)
+    return subdirs, found
+
+
+def scan_repository(pairtree_root, workers=None):
+    """
+    Scan the pairtree directories of a repository in parallel
+    :param pairtree_root: pairtree root directory
+    :param workers: number of scanning threads (default: number of CPUs)
+    :return: list of tuples (object directory, latest version number, item path)
+    """
+    workers = workers if workers else (os.cpu_count() or 1)
+    objects = []
+    if not os.path.isdir(pairtree_root):
+        return objects
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, pairtree_root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirs, found = future.result()
+                if found:
+                    objects.append(found)
+                pending.update(pool.submit(_scan_dir, subdir) for subdir in subdirs)
+    return objects
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the catalogue of a pairtree repository.')
+    parser.add_argument('repository', type=str, help='Repository storage directory')
+    parser.add_argument('--workers', "-w", type=int, default=None, help='Number of scanning threads')
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.repository, "pairtree_root")):
+        print("Not a pairtree repository: %s" % args.repository)
+        sys.exit(1)
+    from eatb.pairtree_storage import PairtreeStorage
+    num_objects = PairtreeStorage(args.repository).rebuild_catalogue(args.workers)
+    print("Catalogue rebuilt: %d objects" % num_objects)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import hashlib
 import json
 import os
 import shutil
-import hashlib
 from typing import List, Tuple, Dict
 from collections import defaultdict
 from datetime import datetime
-from subprocess import check_output
 
-from eatb.cli import CliCommand, CliCommands
+from eatb.checksum import hash_file, hash_files
+from eatb.manifest import manifest_entries
 from eatb import VersionDirFormat
 
 
@@ -39,23 +39,21 @@ def get_previous_version_series(current_version: str, version_format: str = Vers
     return [version_format % i for i in range(1, current_number)]
 
 
-def get_hashed_filelist(strip_path_part, directory, commands=CliCommands()):
+def get_hashed_filelist(strip_path_part, directory, commands=None, workers=None):
     """
     e.g. get_hashed_filelist("/home/user/", "/home/user/test")
-    :param commands:
+    :param commands: not used anymore (the file list was created using 'summain' before)
     :param strip_path_part: part of the path to be removed for the key
     :param directory: directory for which the hashed file list is to be created
+    :param workers: number of hashing threads (default: number of CPUs)
     :return: hashed file list
     """
-    cli_command = CliCommand("summainstdout", commands.get_command_template("summainstdout"))
-    command = cli_command.get_command(dict(package_dir=directory))
-    summain_out = check_output(command)
-    json_summain_out = json.loads(summain_out)
     result = {}
-    for entry in json_summain_out:
+    for entry in manifest_entries(directory, workers):
         if "SHA256" in entry:
-            key = entry['Name'].lstrip(strip_path_part)
-            result[key] = {"hash": entry['SHA256'], "path": entry["Name"]}
+            name = entry['Name']
+            key = name[len(strip_path_part):] if strip_path_part and name.startswith(strip_path_part) else name
+            result[key] = {"hash": entry['SHA256'], "path": name}
     return result
 
 
@@ -63,41 +61,136 @@ def compute_sha512(file_path):
     """
     Computes the SHA-512 hash of a file.
     """
-    sha512_hash = hashlib.sha512()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):  # Read in 8KB chunks
-            sha512_hash.update(chunk)
-    return sha512_hash.hexdigest()
+    return hash_file(file_path, ["sha512"])["sha512"]
 
 
 def compute_md5(file_path):
     """
     Computes the MD5 hash of a file.
     """
-    md5_hash = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):  # Read in 8KB chunks
-            md5_hash.update(chunk)
-    return md5_hash.hexdigest()
+    return hash_file(file_path, ["md5"])["md5"]
 
 
 def compute_file_hashes(file_path):
     """
     Computes multiple hashes (e.g., SHA-512 and MD5) for a file and returns them as a dictionary.
+    The file is read only once.
     """
-    return {
-        "sha512": compute_sha512(file_path),
-        "md5": compute_md5(file_path),
-    }
+    return hash_file(file_path, ["sha512", "md5"])
 
 
 def get_sha512_hash(file_path):
     """Compute the SHA-512 hash of a file."""
-    h = hashlib.sha512()
-    with open(file_path, "rb") as f:
-        while chunk := f.read(8192):
-            h.update(chunk)
-    return h.hexdigest()
+    return compute_sha512(file_path)
+
+
+class ContentPool:
+    """
+    Repository-level content-addressed pool shared by OCFL objects: content files are stored once per SHA-512 digest
+    ('<pool>/<d[0:2]>/<d[2:4]>/<digest>') and the content paths of the objects are hardlinks of the pool files.
+    """
+
+    def __init__(self, pool_dir: str):
+        """
+        Constructor
+        :param pool_dir: pool directory (on the same file system as the objects)
+        """
+        self.pool_dir = pool_dir
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.pool_dir, digest[0:2], digest[2:4], digest)
+
+    def __contains__(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def link_to(self, digest: str, target_file: str) -> bool:
+        """
+        Create a content file as a hardlink of the pool file
+        :param digest: SHA-512 digest of the content
+        :param target_file: target file path
+        :return: True if the pool has the content and the link was created
+        """
+        if digest not in self:
+            return False
+        return _link_file(self.path(digest), target_file)
+
+    def add(self, digest: str, content_file: str):
+        """
+        Add a content file to the pool. If the pool already has the content, the content file is replaced by a
+        hardlink of the pool file (the content is stored once).
+        :param digest: SHA-512 digest of the content
+        :param content_file: content file path
+        """
+        pool_file = self.path(digest)
+        if os.path.exists(pool_file):
+            if not os.path.samefile(pool_file, content_file):
+                tmp_file = content_file + ".pool"
+                if _link_file(pool_file, tmp_file):
+                    os.replace(tmp_file, content_file)
+            return
+        os.makedirs(os.path.dirname(pool_file), exist_ok=True)
+        if not _link_file(content_file, pool_file):
+            shutil.copy2(content_file, pool_file)
+
+
+def _link_file(source_file: str, target_file: str) -> bool:
+    """
+    Create a hardlink (e.g. not possible across file systems)
+    :return: True if the link was created
+    """
+    try:
+        os.link(source_file, target_file)
+        return True
+    except OSError:
+        return False
+
+
+class InventoryIndex:
+    """
+    Indices of an OCFL inventory allowing to check files in constant time while a new version is added:
+    logical path -> digests of the path in the previous versions, and digest -> content paths (manifest).
+    """
+
+    def __init__(self, inventory: Dict):
+        """
+        Constructor
+        :param inventory: inventory dictionary ('manifest' and 'versions')
+        """
+        self.manifest = inventory["manifest"]
+        self.content_paths = {digest: set(paths) for digest, paths in self.manifest.items()}
+        self.path_digests = defaultdict(set)
+        for version_data in inventory["versions"].values():
+            for digest, paths in version_data["state"].items():
+                for path in paths:
+                    self.path_digests[path].add(digest)
+
+    def has_path_digest(self, logical_path: str, digest: str) -> bool:
+        """
+        Check if the logical path was recorded with the digest in a previous version
+        :param logical_path: logical path (relative to the version directory)
+        :param digest: digest
+        :return: True if the file is unchanged with respect to a previous version
+        """
+        return digest in self.path_digests.get(logical_path, ())
+
+    def has_content(self, digest: str) -> bool:
+        """
+        Check if content with the digest is stored in the object
+        :param digest: digest
+        :return: True if the manifest has content paths for the digest
+        """
+        return bool(self.content_paths.get(digest))
+
+    def add_content(self, digest: str, content_path: str):
+        """
+        Record a content path in the manifest (only once)
+        :param digest: digest
+        :param content_path: content path (e.g. 'v00002/data.txt')
+        """
+        paths = self.content_paths.setdefault(digest, set())
+        if content_path not in paths:
+            paths.add(content_path)
+            self.manifest[digest].append(content_path)
 
 
 def write_inventory_from_directory(
@@ -105,7 +198,10 @@ def write_inventory_from_directory(
         version: str, 
         data_dir: str, 
         action: str, 
-        metadata: Dict = None
+        metadata: Dict = None,
+        workers: int = 1,
+        deduplicate: bool = False,
+        content_pool: ContentPool = None
 ) -> bool:
     """
     Generates or updates an inventory based on the contents of a specified directory.
@@ -137,6 +233,19 @@ def write_inventory_from_directory(
             - Custom tags
             Defaults to `None`, meaning no additional metadata is included.
 
+        workers (int, optional): 
+            Number of workers used to compute the file hashes of the version directory in parallel. 
+            Defaults to `1`, meaning the files are hashed sequentially.
+
+        deduplicate (bool, optional): 
+            If `True`, a file of the version directory whose content is already stored in the object (in a previous 
+            version or in the same version) is recorded in the version state only and removed from the version 
+            directory (forward-delta). Defaults to `False`.
+
+        content_pool (ContentPool, optional): 
+            Repository-level content pool shared by objects. The content files of the version are added to the 
+            pool; content already in the pool is replaced by a hardlink of the pool file. Defaults to `None`.
+
     Returns:
         bool: 
             `True` if the inventory was successfully written or updated, 
@@ -195,65 +304,102 @@ def write_inventory_from_directory(
         "removed": metadata.get("removed", []),
     }
 
-    # Collect existing files from all previous versions
-    existing_files = {}
-    for prev_version, prev_data in inventory["versions"].items():
-        for hash_val, paths in prev_data["state"].items():
-            for path in paths:
-                existing_files[f"{prev_version}/{path}"] = hash_val
+    # Index the previous versions once (logical path -> digests, digest -> content paths)
+    inventory_index = InventoryIndex(inventory)
 
-    # Process files in the version directory
+    # Process files in the version directory (each file is read once for all digests)
     version_dir = os.path.join(data_dir, version)
-    for subdir, _, files in os.walk(version_dir):
-        for file in files:
-            file_path = os.path.join(subdir, file)
-            relative_path = os.path.relpath(file_path, version_dir)
-            full_ocfl_path = f"{version}/{relative_path}"  # Full path in the current version
-            hashes = compute_file_hashes(file_path)
-
-            if any(
-                existing_path.endswith(relative_path) and existing_files[existing_path] == hashes["sha512"]
-                for existing_path in existing_files
-            ):
-                print(f"Skipping {file_path} as it already exists")
-                continue
-
+    file_paths = [os.path.join(subdir, file) for subdir, _, files in os.walk(version_dir) for file in files]
+    version_hashes = hash_files(file_paths, ["sha512", "md5"], workers=workers)
+    for file_path in file_paths:
+        relative_path = os.path.relpath(file_path, version_dir)
+        full_ocfl_path = f"{version}/{relative_path}"  # Full path in the current version
+        hashes = version_hashes[file_path]
+
+        if inventory_index.has_path_digest(relative_path, hashes["sha512"]):
+            print(f"Skipping {file_path} as it already exists")
+            continue
+
+        if deduplicate and inventory_index.has_content(hashes["sha512"]):
+            # the content is stored already, the file is recorded in the version state only
+            os.remove(file_path)
+        else:
             for algo, hash_val in hashes.items():
                 inventory["fixity"][algo][hash_val].append(full_ocfl_path)
-
-                # Ensure the relative_path is added only once to manifest
-                if full_ocfl_path not in inventory["manifest"][hashes["sha512"]]:
-                    inventory["manifest"][hashes["sha512"]].append(full_ocfl_path)
-
-                # Ensure the relative_path is added only once to state
-                if relative_path not in version_entry["state"][hashes["sha512"]]:
-                    version_entry["state"][hashes["sha512"]].append(relative_path)
+            inventory_index.add_content(hashes["sha512"], full_ocfl_path)
+            if content_pool:
+                content_pool.add(hashes["sha512"], file_path)
+        # Ensure the relative_path is added only once to state
+        if relative_path not in version_entry["state"][hashes["sha512"]]:
+            version_entry["state"][hashes["sha512"]].append(relative_path)
+
+    if deduplicate:
+        # remove directories left empty by deduplicated files
+        for subdir, dirs, files in os.walk(version_dir, topdown=False):
+            if subdir != version_dir and not os.listdir(subdir):
+                os.rmdir(subdir)
 
     # Update inventory
     inventory["versions"][version] = version_entry
     inventory["head"] = version
 
-    # Write updated inventory
-    with open(inventory_path, "w", encoding="utf-8") as f:
-        json.dump(inventory, f, indent=4)
+    # Write updated inventory (the sidecar digest is computed from the serialized inventory)
+    inventory_data = json.dumps(inventory, indent=4).encode("utf-8")
+    with open(inventory_path, "wb") as f:
+        f.write(inventory_data)
 
     # Write OCFL object declaration and checksum
     with open(os.path.join(data_dir, "0=ocfl_object_1.0"), "w", encoding="utf-8") as ocfl_file:
         ocfl_file.write("ocfl_object_1.0")
-    inventory_hash = get_sha512_hash(inventory_path)
+    inventory_hash = hashlib.sha512(inventory_data).hexdigest()
     with open(os.path.join(data_dir, "inventory.json.sha512"), "w", encoding="utf-8") as hash_file:
         hash_file.write(f"{inventory_hash} inventory.json")
 
     return os.path.exists(inventory_path) and os.path.exists(inventory_path)
 
 
+def _same_content(file_path: str, other_file_path: str) -> bool:
+    """
+    Compare two files by size and modification time (copies made by shutil.copy2) and by digest only if needed.
+    """
+    st, other_st = os.stat(file_path), os.stat(other_file_path)
+    if st.st_size != other_st.st_size:
+        return False
+    if st.st_mtime_ns == other_st.st_mtime_ns:
+        return True
+    return hash_file(file_path, ["sha512"]) == hash_file(other_file_path, ["sha512"])
+
+
+def _link_stored_content(digest: str, target_file: str, object_dir: str, manifest: Dict, copied_content: Dict,
+                         content_pool: ContentPool = None) -> bool:
+    """
+    Create a file as a hardlink of stored content with the same digest (object content, content copied for the new
+    version, content pool)
+    :return: True if the link was created
+    """
+    if os.path.exists(target_file):
+        os.remove(target_file)
+    stored_files = [os.path.join(object_dir, content_path) for content_path in manifest.get(digest, [])]
+    if digest in copied_content:
+        stored_files.append(copied_content[digest])
+    for stored_file in stored_files:
+        if os.path.exists(stored_file) and _link_file(stored_file, target_file):
+            return True
+    return bool(content_pool) and content_pool.link_to(digest, target_file)
+
+
 def update_storage_with_differences(
         working_dir: str, new_version_target_dir: str, previous_versions: List[str],
-        inventory_path: str, exclude_files: List[str] = None
+        inventory_path: str, exclude_files: List[str] = None, workers: int = None,
+        deduplicate: bool = False, content_pool: ContentPool = None
 ) -> Tuple[List[str], List[str]]:
     """
     Copies only new or modified files to the storage directory and identifies deleted files.
 
+    The working directory is walked once. A file is unchanged if size and modification time match the stored content
+    of the previous version (content copied with shutil.copy2), changed if the size differs; only the remaining files
+    are hashed (in parallel, each file read once) and compared with the inventory digest.
+
     Parameters:
         working_dir (str): 
             The directory containing the current version of the files that need to be compared 
@@ -278,6 +424,20 @@ def update_storage_with_differences(
             These files will be ignored even if they differ between versions. 
             Defaults to `None`, meaning no files are excluded.
 
+        workers (int, optional): 
+            Number of workers used to hash the files which cannot be compared by size and modification time. 
+            Defaults to `None`, meaning the number of CPUs.
+
+        deduplicate (bool, optional): 
+            If `True`, new or modified files whose content is already stored in the object (or was copied for 
+            another file of the new version) are not copied but created as hardlinks of the stored content, to be 
+            recorded in the version state only by `write_inventory_from_directory` (with `deduplicate=True`). 
+            Defaults to `False`.
+
+        content_pool (ContentPool, optional): 
+            Repository-level content pool; new or modified files whose content is in the pool are created as 
+            hardlinks of the pool files instead of being copied. Defaults to `None`.
+
     Returns:
         Tuple[List[str], List[str]]: 
             A tuple containing:
@@ -298,6 +458,7 @@ def update_storage_with_differences(
     added_or_changed = []
     deleted_files = []
     previous_files = {}
+    manifest = {}
 
     assert isinstance(previous_versions, list), \
         "param 'previous_versions' must be of type list"
@@ -309,41 +470,75 @@ def update_storage_with_differences(
     if os.path.exists(inventory_path):
         with open(inventory_path, "r", encoding="utf-8") as f:
             inventory = json.load(f)
+            manifest = inventory.get("manifest", {})
             for prev_version in previous_versions:
                 version_state = inventory["versions"].get(prev_version, {}).get("state", {})
                 for hash_val, paths in version_state.items():
                     for path in paths:
                         previous_files[path] = hash_val
+    object_dir = os.path.dirname(inventory_path)
 
-    # Compare files in the working directory with all previous versions
+    # Walk the working directory once
+    working_files = {}
     for subdir, _, files in os.walk(working_dir):
         for file in files:
             source_file = os.path.join(subdir, file)
-            relative_path = os.path.relpath(source_file, working_dir)
-            target_file = os.path.join(new_version_target_dir, relative_path)
-            os.makedirs(os.path.dirname(target_file), exist_ok=True)
-
-            # Compute hash for the current file
-            current_hash = compute_file_hashes(source_file)["sha512"]
-            #Files which exist in previous versions with the same hash do not get copied
-            if any(
-                existing_path.endswith(relative_path) and previous_files[existing_path] == current_hash
-                for existing_path in previous_files
-            ):
-                print(f"Skipping {source_file} as it already exists in previous versions")
-                continue
-
-            # Check if the file is new or has changed
-            if (relative_path not in previous_files or previous_files[relative_path] != current_hash) and file not in (exclude_files or []):
-                # Check if the file already exists with the same content
-                if not os.path.exists(target_file) or compute_file_hashes(target_file)["sha512"] != current_hash:
-                    shutil.copy2(source_file, target_file)
-                    added_or_changed.append(relative_path)
+            working_files[os.path.relpath(source_file, working_dir)] = source_file
+
+    # Compare with the stored content of the previous versions by size and modification time first
+    candidates = []
+    unchanged = set()
+    to_hash = []
+    for relative_path, source_file in working_files.items():
+        if os.path.basename(relative_path) in (exclude_files or []):
+            continue
+        candidates.append(relative_path)
+        if relative_path not in previous_files:
+            continue
+        source_stat = os.stat(source_file)
+        content_stats = [os.stat(p) for p in (os.path.join(object_dir, content_path)
+                                              for content_path in manifest.get(previous_files[relative_path], []))
+                         if os.path.exists(p)]
+        if any((st.st_size, st.st_mtime_ns) == (source_stat.st_size, source_stat.st_mtime_ns) for st in content_stats):
+            unchanged.add(relative_path)
+        elif not content_stats or any(st.st_size == source_stat.st_size for st in content_stats):
+            to_hash.append(relative_path)
+
+    # Hash only the files which could not be decided by size and modification time (each file is read once)
+    source_hashes = hash_files([working_files[p] for p in to_hash], ["sha512"], workers=workers)
+    unchanged.update(p for p in to_hash if source_hashes[working_files[p]]["sha512"] == previous_files[p])
+
+    # Digests of the new or modified files are needed to find stored content
+    if deduplicate or content_pool:
+        source_hashes.update(hash_files([working_files[p] for p in candidates
+                                         if p not in unchanged and working_files[p] not in source_hashes],
+                                        ["sha512"], workers=workers))
+    copied_content = {}
+
+    for relative_path in candidates:
+        source_file = working_files[relative_path]
+        if relative_path in unchanged:
+            # Files which exist in previous versions with the same hash do not get copied
+            print(f"Skipping {source_file} as it already exists in previous versions")
+            continue
+        target_file = os.path.join(new_version_target_dir, relative_path)
+        os.makedirs(os.path.dirname(target_file), exist_ok=True)
+        # Check if the file already exists with the same content
+        if os.path.exists(target_file) and _same_content(source_file, target_file):
+            continue
+        digest = source_hashes[source_file]["sha512"] if source_file in source_hashes else None
+        if digest and _link_stored_content(digest, target_file, object_dir, manifest if deduplicate else {},
+                                           copied_content if deduplicate else {}, content_pool):
+            added_or_changed.append(relative_path)
+            continue
+        shutil.copy2(source_file, target_file)
+        if digest:
+            copied_content[digest] = target_file
+        added_or_changed.append(relative_path)
 
     # Identify deleted files
-    current_files = {os.path.relpath(os.path.join(subdir, file), working_dir) for subdir, _, files in os.walk(working_dir) for file in files}
     for path in previous_files.keys():
-        if path not in current_files:
+        if path not in working_files:
             deleted_files.append(path)
 
     return added_or_changed, deleted_files
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import tarfile
+from collections import namedtuple
+from functools import lru_cache
+
+from eatb import logger
+from eatb.checksum import DEFAULT_BLOCKSIZE
+
+# suffix of the sidecar index file stored next to the TAR container (e.g. 'xyz.tar.index.json')
+TAR_INDEX_SUFFIX = ".index.json"
+
+TAR_INDEX_VERSION = 1
+
+TAR_INDEX_DIGEST_ALGORITHM = "sha256"
+
+TarIndexEntry = namedtuple("TarIndexEntry", ["name", "header_offset", "data_offset", "size", "digest"])
+
+
+def tar_index_path(tar_path):
+    """
+    Get the path of the sidecar index file of a TAR container
+    :param tar_path: TAR container path
+    :return: index file path
+    """
+    return tar_path + TAR_INDEX_SUFFIX
+
+
+class TarIndex:
+    """
+    Index of the members of an uncompressed TAR container (member name -> header offset, data offset, size and SHA-256
+    digest of regular files) allowing to seek directly to a member without scanning the headers of the container.
+
+    The index is valid as long as size and modification time of the container are unchanged. The SHA-256 digest of
+    the whole container (tar_digest) is recorded if it is known when the index is written (e.g. by the storage).
+    """
+
+    def __init__(self, tar_size=None, tar_mtime_ns=None, entries=None, tar_digest=None):
+        self.tar_size = tar_size
+        self.tar_mtime_ns = tar_mtime_ns
+        self.tar_digest = tar_digest
+        self.entries = {}
+        for entry in entries or []:
+            self.entries[entry.name] = entry
+
+    def add(self, entry):
+        self.entries[entry.name] = entry
+
+    def get(self, member_name):
+        """
+        Get index entry of a member
+        :param member_name: member name
+        :return: TarIndexEntry or None if the container does not have the member
+        """
+        return self.entries.get(member_name)
+
+    def __contains__(self, member_name):
+        return member_name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_valid_for(self, tar_path):
+        """
+        Verify that the index matches the container (size and modification time)
+        :param tar_path: TAR container path
+        :return: True if the index is valid for the container
+        """
+        st = os.stat(tar_path)
+        return st.st_size == self.tar_size and st.st_mtime_ns == self.tar_mtime_ns
+
+    def tarinfo(self, tfile, member_name):
+        """
+        Read the TarInfo object of a member by seeking to its header; the read position of the TarFile object is
+        restored, so that its sequential member iteration (getmembers, next, extractall) is not affected
+        :param tfile: TarFile object opened for reading (uncompressed)
+        :param member_name: member name
+        :return: TarInfo object
+        :except KeyError: if the container does not have the member
+        """
+        entry = self.entries.get(member_name)
+        if entry is None:
+            raise KeyError("Member not found: %s" % member_name)
+        # TarInfo.fromtarfile advances the member offset of the TarFile object
+        offset = tfile.offset
+        position = tfile.fileobj.tell()
+        try:
+            tfile.fileobj.seek(entry.header_offset)
+            return tarfile.TarInfo.fromtarfile(tfile)
+        finally:
+            tfile.offset = offset
+            tfile.fileobj.seek(position)
+
+    def write(self, index_path):
+        """
+        Write index file (the file is replaced atomically)
+        :param index_path: index file path
+        """
+        doc = {
+            "version": TAR_INDEX_VERSION,
+            "tar_size": self.tar_size,
+            "tar_mtime_ns": self.tar_mtime_ns,
+            "algorithm": TAR_INDEX_DIGEST_ALGORITHM,
+            "tar_digest": self.tar_digest,
+            "members": [[e.name, e.header_offset, e.data_offset, e.size, e.digest] for e in self.entries.values()],
+        }
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, separators=(",", ":"))
+        os.replace(tmp_path, index_path)
+
+    @staticmethod
+    def read(index_path):
+        """
+        Read index file
+        :param index_path: index file path
+        :return: TarIndex object
+        :except ValueError: if the index file is not supported
+        """
+        with open(index_path, encoding="utf-8") as f:
+            doc = json.load(f)
+        if doc.get("version") != TAR_INDEX_VERSION:
+            raise ValueError("Unsupported TAR index version: %s" % doc.get("version"))
+        return TarIndex(doc["tar_size"], doc["tar_mtime_ns"], [TarIndexEntry(*member) for member in doc["members"]],
+                        doc.get("tar_digest"))
+
+    @staticmethod
+    def build(tar_path, digests=True):
+        """
+        Build the index by reading the container once
+        :param tar_path: TAR container path (uncompressed)
+        :param digests: compute the digests of the regular files (reads the data of all members); if False, only the
+                        member headers are read and the digests are not available (None)
+        :return: TarIndex object
+        """
+        st = os.stat(tar_path)
+        index = TarIndex(st.st_size, st.st_mtime_ns)
+        with tarfile.open(tar_path, "r:") as tfile:
+            for member in tfile:
+                digest = None
+                if digests and member.isreg():
+                    hasher = hashlib.new(TAR_INDEX_DIGEST_ALGORITHM)
+                    f = tfile.extractfile(member)
+                    for chunk in iter(lambda: f.read(DEFAULT_BLOCKSIZE), b''):
+                        hasher.update(chunk)
+                    digest = hasher.hexdigest()
+                index.add(TarIndexEntry(member.name, member.offset, member.offset_data, member.size, digest))
+        return index
+
+
+class _HashingReader:
+    """
+    Readable file object computing the digest of the data read through it
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.new(TAR_INDEX_DIGEST_ALGORITHM)
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+
+def add_indexed(tar, name, arcname, index):
+    """
+    Add a file or directory (non-recursive) to a TAR container opened for writing and record the member in the index;
+    regular files are hashed while they are written to the container.
+    :param tar: TarFile object (uncompressed stream or file)
+    :param name: path of the file or directory
+    :param arcname: member name
+    :param index: TarIndex object
+    """
+    tarinfo = tar.gettarinfo(name, arcname)
+    header_offset = tar.offset
+    if tarinfo.isreg():
+        with open(name, "rb") as f:
+            reader = _HashingReader(f)
+            tar.addfile(tarinfo, reader)
+        digest = reader.hasher.hexdigest()
+    else:
+        tar.addfile(tarinfo)
+        digest = None
+    blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+    data_size = (blocks + (1 if remainder else 0)) * tarfile.BLOCKSIZE if tarinfo.isreg() else 0
+    index.add(TarIndexEntry(tarinfo.name, header_offset, tar.offset - data_size, tarinfo.size, digest))
+
+
+def read_valid_tar_index(tar_path):
+    """
+    Read the sidecar index file of a TAR container
+    :param tar_path: TAR container path
+    :return: TarIndex object or None if there is no index file or it is not valid for the container
+    """
+    index_path = tar_index_path(tar_path)
+    if os.path.exists(index_path):
+        try:
+            index = TarIndex.read(index_path)
+            if index.is_valid_for(tar_path):
+                return index
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Unable to read TAR index %s: %s" % (index_path, e))
+    return None
+
+
+def write_tar_index(tar_path, tar_digest=None):
+    """
+    Build the index of a TAR container and persist it in the sidecar file next to the container
+    :param tar_path: TAR container path (uncompressed)
+    :param tar_digest: SHA-256 digest of the container, if known
+    :return: TarIndex object
+    """
+    index = TarIndex.build(tar_path)
+    index.tar_digest = tar_digest
+    index.write(tar_index_path(tar_path))
+    return index
+
+
+@lru_cache(maxsize=64)
+def _load_tar_index(tar_path, tar_size, tar_mtime_ns):
+    index_path = tar_index_path(tar_path)
+    if os.path.exists(index_path):
+        try:
+            index = TarIndex.read(index_path)
+            if index.tar_size == tar_size and index.tar_mtime_ns == tar_mtime_ns:
+                return index
+            logger.debug("TAR index is outdated: %s" % index_path)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Unable to read TAR index %s: %s" % (index_path, e))
+    return TarIndex.build(tar_path, digests=False)
+
+
+def load_tar_index(tar_path):
+    """
+    Get the index of a TAR container: the sidecar index file is used if it is valid for the container, otherwise the
+    index is built by reading the member headers of the container (without digests; the index file is not written,
+    see write_tar_index). Loaded indexes are cached as long as size and modification time of the container are
+    unchanged.
+    :param tar_path: TAR container path (uncompressed)
+    :return: TarIndex object
+    """
+    tar_path = os.path.abspath(tar_path)
+    st = os.stat(tar_path)
+    return _load_tar_index(tar_path, st.st_size, st.st_mtime_ns)
@@ -48,7 +48,11 @@ def get_date_from_iso_str(origin_fmt, origin_dts):
 def get_file_ctime_iso_date_str(file_path, fmt=DT_ISO_FORMAT, wd=None):
     fp = file_path
     path = fp if wd is None else os.path.join(wd, fp)
-    dt = timezone('Europe/Vienna').localize(datetime.fromtimestamp(os.path.getctime(path)).replace(microsecond=0))
+    return get_timestamp_iso_date_str(os.path.getctime(path), fmt)
+
+
+def get_timestamp_iso_date_str(timestamp, fmt=DT_ISO_FORMAT):
+    dt = timezone('Europe/Vienna').localize(datetime.fromtimestamp(timestamp).replace(microsecond=0))
     return dt.strftime(fmt)
 
 
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import re
@@ -8,10 +9,22 @@ import shutil
 import mimetypes
 from urllib.parse import quote, unquote
 
+try:
+    import fcntl
+    fcntl_disabled = False
+except ImportError:
+    fcntl_disabled = True
+
 from eatb.utils.datetime import get_file_ctime_iso_date_str, EU_UI_FORMAT, get_local_datetime_now
 from eatb.utils.reporters import default_reporter
 
 MAX_TRIES = 10000
+
+# size of the chunks copied at a time by the copy engine (8 MiB)
+COPY_CHUNKSIZE = 8 * 1024 * 1024
+
+# Linux ioctl request cloning a file (reflink, shared copy-on-write extents), e.g. on Btrfs, XFS or OCFS2
+FICLONE = 0x40049409
 mimetypes.add_type('text/plain', '.log')
 
 
@@ -107,9 +120,13 @@ def secure_force_copy_file(source_file, target_file):
     :raises: IOError if the checksum verification failed
     """
     if os.path.isfile(source_file):
-        shutil.copy2(source_file, target_file)
+        if os.path.isdir(target_file):
+            target_file = os.path.join(target_file, os.path.basename(source_file))
+        # the source is hashed during the copy, only the target is read again for the verification
+        _, digests = copy_file_content(source_file, target_file, checksum_algorithms=["sha256"])
+        shutil.copystat(source_file, target_file)
         from eatb.checksum import get_sha256_hash
-        if not os.path.exists(target_file) or not get_sha256_hash(source_file) == get_sha256_hash(target_file):
+        if not os.path.exists(target_file) or not digests["sha256"] == get_sha256_hash(target_file):
             raise IOError("File copy operation failed  (checksums not equal: %s vs. %s)." % (source_file, target_file))
         return os.path.exists(target_file)
 
@@ -581,22 +598,129 @@ class FileBinaryDataChunks(object):
         """
         if bytes_total == -1:
             bytes_total = self.current_file_size
-        f = open(self.filepath, 'rb')
-
-        def readchunk():
-            return f.read(self.chunksize)
-
-        for chunk in iter(readchunk, ''):
-            self.bytesread += len(chunk)
-            percent = (total_bytes_read+self.bytesread) * 100 / bytes_total
-            self.progress_reporter(percent)
-            yield chunk
+        with open(self.filepath, 'rb') as f:
+
+            def readchunk():
+                return f.read(self.chunksize)
+
+            for chunk in iter(readchunk, b''):
+                self.bytesread += len(chunk)
+                percent = (total_bytes_read+self.bytesread) * 100 / bytes_total if bytes_total > 0 else 100
+                self.progress_reporter(percent)
+                yield chunk
+
+
+def _copy_range_kernel(src_fd, dst_fd, copied, size, progress):
+    """
+    Copy the remaining bytes of a file within the kernel (os.copy_file_range, os.sendfile as fallback)
+    :return: number of bytes copied so far (less than size if neither system call is supported)
+    """
+    for method in ("copy_file_range", "sendfile"):
+        if not hasattr(os, method):
+            continue
+        try:
+            if method == "sendfile":
+                # sendfile writes at the current position of the target file
+                os.lseek(dst_fd, copied, os.SEEK_SET)
+            while copied < size:
+                count = min(COPY_CHUNKSIZE, size - copied)
+                if method == "copy_file_range":
+                    n = os.copy_file_range(src_fd, dst_fd, count, copied, copied)
+                else:
+                    n = os.sendfile(dst_fd, src_fd, copied, count)
+                if n == 0:
+                    # file truncated while it was copied or system call not supported for this file
+                    break
+                copied += n
+                progress(copied)
+        except OSError:
+            # e.g. not supported by the file systems (EXDEV, ENOSYS, EINVAL), continue with the next method
+            continue
+        if copied >= size:
+            break
+    return copied
+
+
+def copy_file_content(source, target, checksum_algorithms=None, progress_reporter=None, total_bytes_read=0,
+                      bytes_total=-1):
+    """
+    Copy the content of a file (copy engine). Without checksum algorithms, the data is copied within the kernel
+    (os.copy_file_range, os.sendfile) if supported, otherwise by a loop using a large buffer. If checksum algorithms
+    are given, the data is read once by the buffer loop and hashed while it is written (tee), so that the digests of
+    the source are available without reading it again.
+    :param source: source file path
+    :param target: target file path
+    :param checksum_algorithms: Algorithms of the digests computed during the copy (ChecksumAlgorithm values or
+                                algorithm strings)
+    :param progress_reporter: progress reporter (percentage), not reported if not provided
+    :param total_bytes_read: bytes read before (if the file is part of a larger copy operation)
+    :param bytes_total: total bytes of the copy operation (default: file size)
+    :return: tuple (number of bytes copied, dictionary of hex digests keyed by the algorithms as passed)
+    """
+    size = os.path.getsize(source)
+    if bytes_total == -1:
+        bytes_total = size
+
+    def progress(copied):
+        if progress_reporter:
+            progress_reporter((total_bytes_read + copied) * 100 / bytes_total if bytes_total > 0 else 100)
+
+    with open(source, 'rb', buffering=0) as fsrc, open(target, 'wb', buffering=0) as fdst:
+        copied = 0
+        hashers = []
+        if checksum_algorithms:
+            from eatb.checksum import hashlib_name
+            hashers = [(alg, hashlib.new(hashlib_name(alg))) for alg in checksum_algorithms]
+        else:
+            copied = _copy_range_kernel(fsrc.fileno(), fdst.fileno(), copied, size, progress)
+        if copied < size or hashers:
+            fsrc.seek(copied)
+            fdst.seek(copied)
+            buffer = bytearray(COPY_CHUNKSIZE)
+            view = memoryview(buffer)
+            while True:
+                n = fsrc.readinto(buffer)
+                if not n:
+                    break
+                for _, hasher in hashers:
+                    hasher.update(view[:n])
+                written = 0
+                while written < n:
+                    written += fdst.write(view[written:n])
+                copied += n
+                progress(copied)
+    return copied, {alg: hasher.hexdigest() for alg, hasher in hashers}
+
+
+def reflink_file(source, target):
+    """
+    Create the target file as a reflink (copy-on-write clone) of the source file; no data is written, the file
+    system shares the extents of the source until one of the files is modified.
+    :param source: source file path
+    :param target: target file path (created or truncated)
+    :return: True if the clone was created, False if reflinks are not supported (the target is removed in this case)
+    """
+    if fcntl_disabled:
+        return False
+    with open(source, 'rb') as fsrc, open(target, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(target)
+    return False
 
 
 def copy_file(source, target, progress_reporter=default_reporter, total_bytes_read=0):
-    with open(target, 'wb') as target_file:
-        for chunk in FileBinaryDataChunks(source, 65536, progress_reporter).chunks(total_bytes_read, total_bytes_read):
-            target_file.write(chunk)
-        target_file.close()
-        total_bytes_read += fsize(source)
-    return total_bytes_read
+    """
+    Copy file content (see copy_file_content)
+    :param source: source file path
+    :param target: target file path
+    :param progress_reporter: progress reporter
+    :param total_bytes_read: bytes read before
+    :return: bytes read including the size of the copied file
+    """
+    copied, _ = copy_file_content(source, target, progress_reporter=progress_reporter,
+                                  total_bytes_read=total_bytes_read)
+    return total_bytes_read + copied
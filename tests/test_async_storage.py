@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from eatb.async_storage import LocalAsyncBackend, OcflAsyncBackend, PairtreeAsyncBackend, s3_disabled
+
+try:
+    from moto import mock_aws
+    moto_disabled = False
+except ImportError:
+    moto_disabled = True
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestAsyncStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.tmp_dir, "source")
+        os.makedirs(os.path.join(self.source_dir, "metadata"))
+        self.files = {"a.txt": b"a" * 100, "metadata/b.xml": b"<b/>", "c.bin": os.urandom(300000)}
+        for rel_path, data in self.files.items():
+            with open(os.path.join(self.source_dir, rel_path), "wb") as f:
+                f.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_backend(self, backend, prefix):
+        stored = run(backend.put_directory(self.source_dir, prefix))
+        self.assertEqual({prefix + k: len(v) for k, v in self.files.items()}, stored)
+        self.assertEqual(sorted(stored), run(backend.list(prefix)))
+        self.assertTrue(run(backend.exists(prefix + "metadata/b.xml")))
+        self.assertFalse(run(backend.exists(prefix + "missing.txt")))
+        self.assertEqual(300000, run(backend.stat(prefix + "c.bin")).size)
+        with self.assertRaises(FileNotFoundError):
+            run(backend.stat(prefix + "missing.txt"))
+        target = os.path.join(self.tmp_dir, "retrieved", "c.bin")
+        self.assertEqual(300000, run(backend.get(prefix + "c.bin", target)))
+        with open(target, "rb") as f:
+            self.assertEqual(self.files["c.bin"], f.read())
+
+    def test_local_backend(self):
+        backend = LocalAsyncBackend(os.path.join(self.tmp_dir, "store"), max_concurrency=2)
+        self._check_backend(backend, "obj/")
+        with self.assertRaises(ValueError):
+            run(backend.put("../outside.txt", os.path.join(self.source_dir, "a.txt")))
+        backend.close()
+
+    def test_pairtree_backend(self):
+        backend = PairtreeAsyncBackend(os.path.join(self.tmp_dir, "repo"))
+        shutil.copy(os.path.join(self.source_dir, "c.bin"), os.path.join(self.tmp_dir, "container.tar"))
+        stored = run(backend.store("urn:uuid:123", os.path.join(self.tmp_dir, "container.tar")))
+        self.assertEqual(("v00001", 300000), stored)
+        self.assertEqual(["urn:uuid:123/v00001/urn+uuid+123.tar"], run(backend.list("urn:uuid:123/")))
+        run(backend.put("urn:uuid:456/v00001/c.bin", os.path.join(self.source_dir, "c.bin")))
+        self.assertTrue(run(backend.exists("urn:uuid:456/v00001/c.bin")))
+        self.assertEqual(300000, run(backend.stat("urn:uuid:456/v00001/c.bin")).size)
+        self.assertEqual(2, len(run(backend.list())))
+        with self.assertRaises(ValueError):
+            run(backend.exists("urn:uuid:456/c.bin"))
+        backend.close()
+
+    def test_pairtree_backend_concurrent_store(self):
+        backend = PairtreeAsyncBackend(os.path.join(self.tmp_dir, "repo"))
+        containers = []
+        for i in range(4):
+            container = os.path.join(self.tmp_dir, "container%d.tar" % i)
+            with open(container, "wb") as f:
+                f.write(b"%d" % i * (i + 1))
+            containers.append(container)
+
+        async def store_all():
+            return await asyncio.gather(*[backend.store("urn:uuid:123", c) for c in containers])
+        stored = run(store_all())
+        self.assertEqual(["v00001", "v00002", "v00003", "v00004"], sorted(s.version for s in stored))
+        self.assertEqual([1, 2, 3, 4], [s.bytes_written for s in stored])
+        self.assertEqual(4, len(run(backend.list("urn:uuid:123/"))))
+        backend.close()
+
+    def test_concurrent_put_same_key(self):
+        backend = LocalAsyncBackend(os.path.join(self.tmp_dir, "store"))
+
+        async def put_twice():
+            return await asyncio.gather(backend.put("obj/c.bin", os.path.join(self.source_dir, "c.bin")),
+                                        backend.put("obj/c.bin", os.path.join(self.source_dir, "c.bin")))
+        self.assertEqual([300000, 300000], run(put_twice()))
+        self.assertEqual(["c.bin"], os.listdir(os.path.join(self.tmp_dir, "store", "obj")))
+        backend.close()
+
+    def test_ocfl_backend(self):
+        backend = OcflAsyncBackend(os.path.join(self.tmp_dir, "aip", "data"))
+        self.assertIsNone(run(backend.head_version()))
+        version, added, deleted = run(backend.commit_version("urn:uuid:789", self.source_dir))
+        self.assertEqual("v00001", version)
+        self.assertEqual(sorted(self.files), sorted(added))
+        self.assertEqual([], deleted)
+        self.assertEqual("v00001", run(backend.head_version()))
+        self.assertEqual(sorted("v00001/" + k for k in self.files), run(backend.list()))
+        with open(os.path.join(self.source_dir, "d.txt"), "w") as f:
+            f.write("d")
+        version, added, _ = run(backend.commit_version("urn:uuid:789", self.source_dir, action="update"))
+        self.assertEqual("v00002", version)
+        self.assertEqual(["d.txt"], added)
+        with open(os.path.join(self.tmp_dir, "aip", "data", "inventory.json")) as f:
+            self.assertEqual("v00002", json.load(f)["head"])
+        backend.close()
+
+    def test_ocfl_backend_concurrent_commits(self):
+        backend = OcflAsyncBackend(os.path.join(self.tmp_dir, "aip", "data"))
+
+        async def commit_twice():
+            return await asyncio.gather(backend.commit_version("urn:uuid:789", self.source_dir),
+                                        backend.commit_version("urn:uuid:789", self.source_dir, action="update"))
+        (first, added, _), (second, added_again, _) = run(commit_twice())
+        self.assertEqual(("v00001", "v00002"), (first, second))
+        self.assertEqual(sorted(self.files), sorted(added))
+        self.assertEqual([], added_again)
+        self.assertEqual("v00002", run(backend.head_version()))
+        backend.close()
+
+    def test_ocfl_backend_version_allocated(self):
+        data_dir = os.path.join(self.tmp_dir, "aip", "data")
+        backend = OcflAsyncBackend(data_dir)
+        run(backend.commit_version("urn:uuid:789", self.source_dir))
+        # version directory created by another writer which has not updated the inventory yet
+        os.mkdir(os.path.join(data_dir, "v00002"))
+        with self.assertRaises(FileExistsError):
+            run(backend.commit_version("urn:uuid:789", self.source_dir))
+        self.assertEqual("v00001", run(backend.head_version()))
+        backend.close()
+
+    @unittest.skipIf(s3_disabled or moto_disabled, "boto3 and moto are required")
+    def test_s3_backend(self):
+        import boto3
+        from eatb.async_storage import S3AsyncBackend
+        with mock_aws():
+            client = boto3.client("s3", region_name="us-east-1")
+            client.create_bucket(Bucket="repository")
+            backend = S3AsyncBackend("repository", client=client, prefix="aips/", multipart_threshold=5 * 1024 * 1024,
+                                     multipart_chunksize=5 * 1024 * 1024)
+            large_file = os.path.join(self.tmp_dir, "large.bin")
+            with open(large_file, "wb") as f:
+                f.write(os.urandom(11 * 1024 * 1024))
+            self.assertEqual(11 * 1024 * 1024, run(backend.put("multipart/large.bin", large_file)))
+            self.assertEqual(11 * 1024 * 1024, run(backend.stat("multipart/large.bin")).size)
+            self._check_backend(backend, "obj2/")
+            backend.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
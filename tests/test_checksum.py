@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import shutil
+import tempfile
 import unittest
 
 from eatb import ROOT
-from eatb.checksum import ChecksumFile, ChecksumValidation, ChecksumAlgorithm
+from eatb.checksum import ChecksumFile, ChecksumValidation, ChecksumAlgorithm, hash_file, hash_tree, \
+    verified_transfer, check_transfer, files_identical
 
 
 class TestChecksum(unittest.TestCase):
@@ -62,6 +65,53 @@ class TestChecksum(unittest.TestCase):
         actual = self.csval.validate_checksum(self.test_file, expected, ChecksumAlgorithm.SHA256)
         self.assertFalse(actual, "Must not validate an incorrect SHA256 checksum")
 
+    def test_hash_file_multiple_digests(self):
+        """
+        Single pass hashing must return the digests of all requested algorithms
+        """
+        actual = hash_file(self.test_file, [ChecksumAlgorithm.MD5, "SHA-256", "sha512"], blocksize=2)
+        self.assertEqual(actual[ChecksumAlgorithm.MD5], "098f6bcd4621d373cade4e832627b4f6")
+        self.assertEqual(actual["SHA-256"], "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08")
+        self.assertEqual(actual["sha512"], "ee26b0dd4af7e749aa1a8ee3c10ae9923f618980772e473f8819a5d4940e0db2"
+                                           "7ac185f8a0e1d5f84f88bc887fd67b143732c304cc5fa9ad8e6f57f50028a8ff")
+
+    def test_hash_file_unsupported_algorithm(self):
+        """
+        Unsupported algorithms must be rejected
+        """
+        with self.assertRaises(ValueError):
+            hash_file(self.test_file, ["crc32"])
+
+    def test_hash_tree_parallel(self):
+        """
+        Parallel hashing (thread and process pool) must return the same digests as sequential hashing
+        """
+        sequential = hash_tree(os.path.join(self.test_dir, 'eark-ip'), ["md5", "sha256"], workers=1)
+        self.assertIn(os.path.join(self.test_dir, 'eark-ip', 'metadata', 'EAD.xml'), sequential)
+        for executor in ["thread", "process"]:
+            parallel = hash_tree(os.path.join(self.test_dir, 'eark-ip'), ["md5", "sha256"], workers=4,
+                                 executor=executor)
+            self.assertEqual(sequential, parallel)
+
+    def test_verified_transfer(self):
+        """
+        Verified transfer must copy the file and return the digest of the source
+        """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            target = os.path.join(temp_dir, 'test.txt')
+            digest = verified_transfer(self.test_file, target)
+            self.assertEqual("9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08", digest)
+            self.assertEqual(digest, check_transfer(self.test_file, target, source_digest=digest))
+            self.assertTrue(files_identical(self.test_file, target))
+            with open(target, 'a') as f:
+                f.write("x")
+            with self.assertRaises(ValueError):
+                check_transfer(self.test_file, target)
+            self.assertFalse(files_identical(self.test_file, target))
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
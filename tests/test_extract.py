@@ -1,13 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import io
 import os
 
 import shutil
+import tarfile
 import unittest
 
 from eatb import ROOT
 from eatb.utils import randomutils
-from eatb.packaging import PackagedContainer
+from eatb.packaging import PackagedContainer, create_package
 
 
 class TestExtract(unittest.TestCase):
@@ -29,9 +31,9 @@ class TestExtract(unittest.TestCase):
         shutil.rmtree(TestExtract.temp_extract_dir)
         os.makedirs(TestExtract.temp_extract_dir)
 
-    def assert_extract(self, package_file):
+    def assert_extract(self, package_file, workers=1):
         package_file_path = os.path.join(TestExtract.test_dir, package_file)
-        packaged_container = PackagedContainer.factory(package_file_path)
+        packaged_container = PackagedContainer.factory(package_file_path, workers=workers)
         packaged_container.extract(TestExtract.temp_extract_dir)
         # must be 8 extracted files
         item_counts = [(len(r), len(d), len(files)) for r, d, files in os.walk(TestExtract.temp_extract_dir)]
@@ -53,6 +55,54 @@ class TestExtract(unittest.TestCase):
     def test_extract_tar(self):
         self.assert_extract("package.tar.gz")
 
+    def test_extract_zip_parallel(self):
+        self.assert_extract("package.zip", workers=4)
+
+    def test_extract_tar_parallel(self):
+        """
+        Parallel extraction of an uncompressed TAR container must restore content and modes of the files
+        """
+        tar_dir = '/tmp/temp-' + randomutils.randomword(10)
+        os.makedirs(tar_dir)
+        try:
+            input_dir = os.path.join(TestExtract.test_dir, 'eark-ip')
+            create_package(input_dir, "package", output_directory=tar_dir)
+            packaged_container = PackagedContainer.factory(os.path.join(tar_dir, "package.tar"), workers=4)
+            self.assertEqual(5, packaged_container.extract(TestExtract.temp_extract_dir))
+            for file in ('metadata/EAD.xml', 'representations/repr1/data/testfile1.txt', 'schemas/xlink.xsd'):
+                with open(os.path.join(input_dir, file), 'rb') as expected, \
+                        open(os.path.join(TestExtract.temp_extract_dir, file), 'rb') as actual:
+                    self.assertEqual(expected.read(), actual.read())
+                self.assertEqual(os.stat(os.path.join(input_dir, file)).st_mode,
+                                 os.stat(os.path.join(TestExtract.temp_extract_dir, file)).st_mode)
+        finally:
+            shutil.rmtree(tar_dir)
+            TestExtract.reset_test_dir()
+
+    def test_extract_tar_parallel_duplicate_members(self):
+        """
+        Of members occurring more than once, the last occurrence must be extracted
+        """
+        tar_dir = '/tmp/temp-' + randomutils.randomword(10)
+        os.makedirs(tar_dir)
+        try:
+            tar_path = os.path.join(tar_dir, "duplicates.tar")
+            with tarfile.open(tar_path, "w") as tar:
+                for i in range(20):
+                    for name in ("dir/a.txt", "dir/b.txt"):
+                        content = (b"%s version %d" % (name.encode(), i)) * (1000 * (20 - i))
+                        tarinfo = tarfile.TarInfo(name)
+                        tarinfo.size = len(content)
+                        tar.addfile(tarinfo, io.BytesIO(content))
+            packaged_container = PackagedContainer.factory(tar_path, workers=4)
+            self.assertEqual(40, packaged_container.extract(TestExtract.temp_extract_dir))
+            for name in ("dir/a.txt", "dir/b.txt"):
+                with open(os.path.join(TestExtract.temp_extract_dir, name), 'rb') as f:
+                    self.assertEqual((b"%s version 19" % name.encode()) * 1000, f.read())
+        finally:
+            shutil.rmtree(tar_dir)
+            TestExtract.reset_test_dir()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import shutil
+import unittest
+
+from eatb import ROOT
+from eatb.checksum import ChecksumAlgorithm
+from eatb.file_facts import PackageFileFacts
+from eatb.utils.randomutils import randomword
+
+
+class TestPackageFileFacts(unittest.TestCase):
+
+    test_ip_dir = os.path.join(ROOT, 'tests/test_resources/eark-ip')
+    tmp_ip_dir = os.path.join('/tmp/temp-' + randomword(10), 'eark-ip')
+
+    @classmethod
+    def setUpClass(cls):
+        shutil.copytree(cls.test_ip_dir, cls.tmp_ip_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(os.path.dirname(cls.tmp_ip_dir))
+
+    def test_scan(self):
+        """
+        Scan must collect size, mime type and digests of all package files
+        """
+        file_facts = PackageFileFacts(self.tmp_ip_dir).scan()
+        file_path = os.path.join(self.tmp_ip_dir, 'representations/repr1/data/testfile1.txt')
+        fact = file_facts.get(file_path)
+        self.assertEqual(os.path.getsize(file_path), fact.size)
+        self.assertEqual("text/plain", fact.mimetype)
+        self.assertEqual(64, len(file_facts.digest(file_path, ChecksumAlgorithm.SHA256)))
+        self.assertEqual(19, len(file_facts.created(file_path)))
+
+    def test_changed_file_not_covered(self):
+        """
+        Files changed after the scan must not be covered by the facts
+        """
+        file_facts = PackageFileFacts(self.tmp_ip_dir).scan()
+        file_path = os.path.join(self.tmp_ip_dir, 'representations/repr2/data/testfile2.csv')
+        with open(file_path, 'a') as f:
+            f.write("additional,line\n")
+        self.assertIsNone(file_facts.get(file_path))
+        self.assertIsNone(file_facts.digest(file_path))
+        self.assertIsNone(file_facts.get(os.path.join(self.tmp_ip_dir, 'METS.xml')))
+
+    def test_rewritten_file_not_covered(self):
+        """
+        Files rewritten with the same size and modification time after the scan must not be covered by the facts
+        """
+        file_path = os.path.join(self.tmp_ip_dir, 'representations/repr1/data/testfile1.txt')
+        file_facts = PackageFileFacts(self.tmp_ip_dir).scan()
+        self.assertIsNotNone(file_facts.get(file_path))
+        st = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        os.remove(file_path)
+        with open(file_path, 'wb') as f:
+            f.write(content[::-1])
+        os.utime(file_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertIsNone(file_facts.get(file_path))
+        self.assertNotEqual(file_facts.facts[file_path].digests,
+                            PackageFileFacts(self.tmp_ip_dir).scan().get(file_path).digests)
+
+    def test_recently_modified_file_not_covered(self):
+        """
+        Files modified within the racy window before the scan must not be covered by the facts
+        """
+        file_path = os.path.join(self.tmp_ip_dir, 'representations/repr1/data/recent.txt')
+        with open(file_path, 'w') as f:
+            f.write("recent")
+        try:
+            self.assertIsNone(PackageFileFacts(self.tmp_ip_dir).scan().get(file_path))
+        finally:
+            os.remove(file_path)
+
+    def test_subset(self):
+        """
+        The facts of a representation must be transferable to a worker process
+        """
+        file_facts = PackageFileFacts(self.tmp_ip_dir).scan()
+        rep_path = os.path.join(self.tmp_ip_dir, 'representations/repr1')
+        subset = pickle.loads(pickle.dumps(file_facts.subset(rep_path)))
+        file_path = os.path.join(rep_path, 'data/testfile1.txt')
+        self.assertEqual(file_facts.digest(file_path), subset.digest(file_path))
+        self.assertIsNone(subset.get(os.path.join(self.tmp_ip_dir, 'representations/repr2/data/testfile2.csv')))
+        self.assertTrue(all(path.startswith(rep_path + os.sep) for path in subset.facts))
+        self.assertEqual({}, subset.puids)
+
+
+if __name__ == '__main__':
+    unittest.main()
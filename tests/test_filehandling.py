@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import hashlib
 import os
-
+import shutil
+import tempfile
 import unittest
 
 from eatb import ROOT
-from eatb.utils.fileutils import remove_protocol, strip_prefixes, get_sub_path_from_relative_path
+from eatb.utils import fileutils
+from eatb.utils.fileutils import remove_protocol, strip_prefixes, get_sub_path_from_relative_path, \
+    copy_file, copy_file_content, secure_force_copy_file
 
 
 class TestPathFunctions(unittest.TestCase):
@@ -43,5 +47,61 @@ class TestPathFunctions(unittest.TestCase):
                          get_sub_path_from_relative_path(test_ip_root, containing_file_path, relative_path))
 
 
+class TestCopyFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        self.source = os.path.join(self.temp_dir, "source.bin")
+        with open(self.source, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assert_copied(self, target):
+        with open(target, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+
+    def test_copy_file(self):
+        target = os.path.join(self.temp_dir, "target.bin")
+        self.assertEqual(len(self.data) + 10, copy_file(self.source, target, lambda p: None, 10))
+        self.assert_copied(target)
+
+    def test_copy_file_content_tee_hash(self):
+        """
+        Digests computed during the copy must be the digests of the source
+        """
+        target = os.path.join(self.temp_dir, "target.bin")
+        reported = []
+        copied, digests = copy_file_content(self.source, target, ["sha256", "md5"], reported.append)
+        self.assertEqual(len(self.data), copied)
+        self.assertEqual(hashlib.sha256(self.data).hexdigest(), digests["sha256"])
+        self.assertEqual(hashlib.md5(self.data).hexdigest(), digests["md5"])
+        self.assertEqual(100, reported[-1])
+        self.assert_copied(target)
+
+    def test_copy_file_content_small_chunks(self):
+        """
+        Copy must be complete if the data is copied in several chunks (kernel copy and buffer loop)
+        """
+        chunksize = fileutils.COPY_CHUNKSIZE
+        fileutils.COPY_CHUNKSIZE = 1000000
+        try:
+            target = os.path.join(self.temp_dir, "target.bin")
+            self.assertEqual(len(self.data), copy_file_content(self.source, target)[0])
+            self.assert_copied(target)
+            self.assertEqual(len(self.data), copy_file_content(self.source, target, ["sha256"])[0])
+            self.assert_copied(target)
+        finally:
+            fileutils.COPY_CHUNKSIZE = chunksize
+
+    def test_secure_force_copy_file(self):
+        target_dir = os.path.join(self.temp_dir, "target")
+        os.makedirs(target_dir)
+        self.assertTrue(secure_force_copy_file(self.source, target_dir))
+        self.assert_copied(os.path.join(target_dir, "source.bin"))
+
+
 if __name__ == '__main__':
     unittest.main()
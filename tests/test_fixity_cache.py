@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import time
+import unittest
+
+from eatb.checksum import enable_fixity_cache, disable_fixity_cache, hash_file, hash_files, ChecksumAlgorithm
+from eatb.fixity_cache import FixityCache
+from eatb.utils.randomutils import randomword
+
+
+class TestFixityCache(unittest.TestCase):
+
+    tmp_dir = '/tmp/temp-' + randomword(10)
+    cache_file = os.path.join(tmp_dir, '.fixity-cache.sqlite')
+
+    def setUp(self):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.test_file = os.path.join(self.tmp_dir, 'test.txt')
+        self.write_file(self.test_file, b'test')
+
+    def tearDown(self):
+        disable_fixity_cache()
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def write_file(file_path, content, age=3600):
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        mtime = time.time() - age
+        os.utime(file_path, (mtime, mtime))
+
+    def test_cached_digest_is_used(self):
+        """
+        Digests of unchanged files must be taken from the cache
+        """
+        cache = enable_fixity_cache(self.cache_file)
+        expected = "098f6bcd4621d373cade4e832627b4f6"
+        self.assertEqual(expected, hash_file(self.test_file, [ChecksumAlgorithm.MD5])[ChecksumAlgorithm.MD5])
+        self.assertEqual({"md5": expected}, cache.lookup(self.test_file, ["md5"]))
+        self.assertIsNone(cache.lookup(self.test_file, ["md5", "sha256"]))
+
+    def test_changed_file_is_rehashed(self):
+        """
+        Cache entries must be invalidated if the modification time changed (even if the size is the same)
+        """
+        enable_fixity_cache(self.cache_file)
+        hash_file(self.test_file, ["md5"])
+        self.write_file(self.test_file, b'tset', age=1800)
+        self.assertEqual("751ec45015a704a39dc403001c963e97", hash_file(self.test_file, ["md5"])["md5"])
+
+    def test_recently_modified_file_not_cached(self):
+        """
+        Files modified within the racy window must not be cached
+        """
+        cache = enable_fixity_cache(self.cache_file)
+        self.write_file(self.test_file, b'test', age=0)
+        hash_files([self.test_file], ["md5"], workers=1)
+        self.assertEqual(0, len(cache))
+
+    def test_lru_eviction(self):
+        """
+        Least recently used entries must be evicted when the size cap is exceeded
+        """
+        cache = FixityCache(self.cache_file, max_entries=2)
+        for i in range(4):
+            file_path = os.path.join(self.tmp_dir, 'file%d.txt' % i)
+            self.write_file(file_path, b'%d' % i)
+            cache.store(file_path, {"md5": "digest%d" % i})
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.lookup(os.path.join(self.tmp_dir, 'file0.txt'), ["md5"]))
+        self.assertEqual({"md5": "digest3"}, cache.lookup(os.path.join(self.tmp_dir, 'file3.txt'), ["md5"]))
+        cache.close()
+
+    def test_lookup_does_not_write(self):
+        """
+        Lookups must not write to the database, the recorded accesses must be considered by the eviction
+        """
+        cache = FixityCache(self.cache_file, max_entries=2)
+        file_paths = [os.path.join(self.tmp_dir, 'file%d.txt' % i) for i in range(3)]
+        for i, file_path in enumerate(file_paths[:2]):
+            self.write_file(file_path, b'%d' % i)
+            cache.store(file_path, {"md5": "digest%d" % i})
+        changes = cache.conn.total_changes
+        self.assertEqual({"md5": "digest0"}, cache.lookup(file_paths[0], ["md5"]))
+        self.assertEqual(changes, cache.conn.total_changes)
+        self.write_file(file_paths[2], b'2')
+        cache.store(file_paths[2], {"md5": "digest2"})
+        self.assertEqual({"md5": "digest0"}, cache.lookup(file_paths[0], ["md5"]))
+        self.assertIsNone(cache.lookup(file_paths[1], ["md5"]))
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
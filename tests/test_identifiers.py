@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from eatb.metadata.identifiers import get_id_factory, IdScheme, CounterIdFactory, ContentIdFactory
+from eatb.metadata.mets_generator import MetsGenerator
+
+
+class TestIdFactory(unittest.TestCase):
+
+    def test_uuid4(self):
+        id_factory = get_id_factory()
+        self.assertTrue(id_factory("file", "data/a.txt").startswith("ID"))
+        self.assertNotEqual(id_factory("file", "data/a.txt"), id_factory("file", "data/a.txt"))
+
+    def test_counter(self):
+        id_factory = get_id_factory(IdScheme.COUNTER)
+        self.assertIsInstance(id_factory, CounterIdFactory)
+        self.assertEqual(["ID00000001", "ID00000002"], [id_factory("div"), id_factory("div")])
+        id_factory.reset()
+        self.assertEqual("ID00000001", id_factory())
+
+    def test_uuid5(self):
+        id_factory = get_id_factory(IdScheme.UUID5)
+        self.assertIsInstance(id_factory, ContentIdFactory)
+        id_factory.reset("urn:uuid:1")
+        ids = [id_factory("file", "data/a.txt"), id_factory("file", "data/b.txt"), id_factory("file", "data/a.txt")]
+        self.assertEqual(3, len(set(ids)))
+        id_factory.reset("urn:uuid:1")
+        self.assertEqual(ids[0], id_factory("file", "data/a.txt"))
+        id_factory.reset("urn:uuid:2")
+        self.assertNotEqual(ids[0], id_factory("file", "data/a.txt"))
+        # a seed given to the constructor takes precedence
+        id_factory = get_id_factory(IdScheme.UUID5, seed="urn:uuid:1")
+        id_factory.reset("urn:uuid:2")
+        self.assertEqual(ids[0], id_factory("file", "data/a.txt"))
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            get_id_factory("uuid1")
+
+    def test_reproducible_mets(self):
+        package_dir = os.path.join(tempfile.mkdtemp(), "pkg")
+        try:
+            for rel_path in ['metadata/descriptive/ead.xml', 'schemas/mets.xsd', 'documentation/a.txt',
+                             'documentation/sub/b.txt']:
+                os.makedirs(os.path.dirname(os.path.join(package_dir, rel_path)), exist_ok=True)
+                with open(os.path.join(package_dir, rel_path), "w") as f:
+                    f.write(rel_path)
+            mets_data = {'packageid': 'pkg', 'type': 'SIP', 'schemas': os.path.join(package_dir, 'schemas'),
+                         'parent': ''}
+            mets_ids = []
+            for mets_file_name in ['first.xml', 'second.xml']:
+                mets_file_path = os.path.join(os.path.dirname(package_dir), mets_file_name)
+                MetsGenerator(package_dir, id_factory=get_id_factory(IdScheme.UUID5)).createMets(mets_data,
+                                                                                                mets_file_path)
+                mets_ids.append([e.get("ID") for e in etree.parse(mets_file_path).iter() if e.get("ID")])
+            self.assertEqual(mets_ids[0], mets_ids[1])
+            self.assertEqual(len(mets_ids[0]), len(set(mets_ids[0])))
+        finally:
+            shutil.rmtree(os.path.dirname(package_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
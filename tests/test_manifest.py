@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import unittest
+
+from eatb import ROOT
+from eatb.manifest import manifest_entries, write_manifest
+from eatb.packaging import ManifestCreation
+from eatb.storage import get_hashed_filelist
+from eatb.utils.randomutils import randomword
+
+
+class TestManifest(unittest.TestCase):
+
+    test_dir = os.path.join(ROOT, 'tests/test_resources/eark-ip')
+    tmp_dir = '/tmp/temp-' + randomword(10)
+
+    @classmethod
+    def setUpClass(cls):
+        os.makedirs(cls.tmp_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_manifest_entries(self):
+        """
+        Parallel and sequential manifest creation must yield the same entries in walk order
+        """
+        sequential = list(manifest_entries(self.test_dir, workers=1))
+        parallel = list(manifest_entries(self.test_dir, workers=4))
+        self.assertEqual(sequential, parallel)
+        files = [entry for entry in sequential if "SHA256" in entry]
+        self.assertEqual(5, len(files))
+        self.assertEqual({"Name", "Mtime", "Size", "SHA256"}, set(files[0].keys()))
+
+    def test_write_manifest(self):
+        """
+        JSON array and JSON Lines manifest must contain the same entries
+        """
+        manifest_file = os.path.join(self.tmp_dir, 'manifest.json')
+        manifest_lines_file = os.path.join(self.tmp_dir, 'manifest.jsonl')
+        num_entries = ManifestCreation(self.tmp_dir).create_manifest(self.test_dir, manifest_file)
+        write_manifest(self.test_dir, manifest_lines_file, json_lines=True)
+        with open(manifest_file) as f:
+            entries = json.load(f)
+        with open(manifest_lines_file) as f:
+            lines_entries = [json.loads(line) for line in f]
+        self.assertEqual(num_entries, len(entries))
+        self.assertEqual(entries, lines_entries)
+
+    def test_get_hashed_filelist(self):
+        """
+        Keys of the hashed file list must be the paths without the stripped prefix
+        """
+        filelist = get_hashed_filelist(self.test_dir + "/", self.test_dir)
+        self.assertIn("metadata/EAD.xml", filelist)
+        self.assertIn("schemas/xlink.xsd", filelist)
+        self.assertEqual(os.path.join(self.test_dir, "metadata/EAD.xml"), filelist["metadata/EAD.xml"]["path"])
+
+
+if __name__ == '__main__':
+    unittest.main()
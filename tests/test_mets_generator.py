@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import hashlib
 import os
 import shutil
+import tempfile
+import time
 import unittest
 
 from eatb import ROOT
@@ -46,5 +49,70 @@ class TestMetsCreation(unittest.TestCase):
         self.assertEqual("996ed635-3e13-4ee5-8e5b-e9661e1d9a93", obj_id)
 
 
+class TestIncrementalMetsCreation(unittest.TestCase):
+
+    def setUp(self):
+        self.package_dir = os.path.join(tempfile.mkdtemp(), "pkg")
+        for rel_path, content in [('metadata/descriptive/ead.xml', '<ead/>'), ('documentation/a.txt', 'aaa'),
+                                  ('documentation/b.txt', 'bbb')]:
+            self.write(rel_path, content)
+            # files are regarded as unchanged only if modified before the METS file was written, backdate them so
+            # that the test does not depend on the timestamp resolution of the file system
+            backdated = time.time() - 60
+            os.utime(os.path.join(self.package_dir, rel_path), (backdated, backdated))
+        self.mets_data = {'packageid': 'pkg', 'type': 'SIP', 'schemas': os.path.join(self.package_dir, 'schemas'),
+                          'parent': ''}
+        self.mets_file_path = os.path.join(self.package_dir, 'METS.xml')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.package_dir))
+
+    def write(self, rel_path, content):
+        file_path = os.path.join(self.package_dir, rel_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w") as f:
+            f.write(content)
+
+    def entries(self):
+        parsed_mets = ParsedMets(self.package_dir)
+        parsed_mets.load_mets(self.mets_file_path)
+        return parsed_mets.get_file_entries()
+
+    def test_incremental_mets(self):
+        # without an existing METS file all files are described
+        MetsGenerator(self.package_dir).createMets(self.mets_data, incremental=True)
+        previous = self.entries()
+        self.assertEqual(['documentation/a.txt', 'documentation/b.txt', 'metadata/descriptive/ead.xml'],
+                         sorted(previous))
+        # same size and modification time: the entry is taken over without hashing the file
+        a_stat = os.stat(os.path.join(self.package_dir, 'documentation/a.txt'))
+        self.write('documentation/a.txt', 'xxx')
+        os.utime(os.path.join(self.package_dir, 'documentation/a.txt'), ns=(a_stat.st_atime_ns, a_stat.st_mtime_ns))
+        # modified and new files are described again
+        self.write('documentation/b.txt', 'bbbb')
+        self.write('documentation/c.txt', 'ccc')
+        MetsGenerator(self.package_dir).createMets(self.mets_data, incremental=True)
+        entries = self.entries()
+        self.assertEqual(previous['documentation/a.txt'], entries['documentation/a.txt'])
+        self.assertEqual(previous['metadata/descriptive/ead.xml'], entries['metadata/descriptive/ead.xml'])
+        self.assertNotEqual(previous['documentation/b.txt'].id, entries['documentation/b.txt'].id)
+        self.assertEqual(hashlib.sha256(b'bbbb').hexdigest(), entries['documentation/b.txt'].checksum)
+        self.assertEqual(hashlib.sha256(b'ccc').hexdigest(), entries['documentation/c.txt'].checksum)
+        # all fptrs reference the file entries
+        file_ids = {entry.id for entry in entries.values()}
+        parsed_mets = ParsedMets(self.package_dir)
+        parsed_mets.load_mets(self.mets_file_path)
+        fptr_ids = {e.get('FILEID') for e in parsed_mets.get_root().iter('{%s}fptr' % ParsedMets.ns['mets'])}
+        self.assertEqual(file_ids, fptr_ids)
+
+    def test_make_mdref(self):
+        metadata_dir = os.path.join(self.package_dir, 'metadata/descriptive')
+        mdref = MetsGenerator(self.package_dir).make_mdref(metadata_dir, 'ead.xml', 'ID1', 'EAD')
+        self.assertEqual('metadata/descriptive/ead.xml', mdref['{http://www.w3.org/1999/xlink}href'])
+        self.assertEqual(hashlib.sha256(b'<ead/>').hexdigest(), mdref['CHECKSUM'])
+        self.assertEqual(6, mdref['SIZE'])
+        self.assertEqual(('ID1', 'EAD'), (mdref['ID'], mdref['MDTYPE']))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from eatb import ROOT
+from eatb.checksum import get_sha256_hash
+from eatb.metadata.parsed_mets import ParsedMets
+from eatb.oais_ip import create_sip, create_aip
+
+
+class TestRepresentationWorkers(unittest.TestCase):
+    """
+    Representations processed in worker processes
+    """
+
+    test_ip_dir = os.path.join(ROOT, 'tests/test_resources/eark-ip')
+    representations = ['repr1', 'repr2']
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.package_dir = os.path.join(self.tmp_dir, 'eark-ip')
+        shutil.copytree(self.test_ip_dir, self.package_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_representations_listed(self):
+        parsed_mets = ParsedMets(self.package_dir)
+        parsed_mets.load_mets(os.path.join(self.package_dir, 'METS.xml'))
+        entries = parsed_mets.get_file_entries()
+        for name in self.representations:
+            rep_mets_path = os.path.join(self.package_dir, 'representations', name, 'METS.xml')
+            self.assertTrue(os.path.exists(rep_mets_path))
+            entry = entries['representations/%s/METS.xml' % name]
+            self.assertEqual(get_sha256_hash(rep_mets_path), entry.checksum)
+            self.assertEqual(str(os.path.getsize(rep_mets_path)), entry.size)
+
+    def make_representation_fail(self):
+        # the METS file of the representation cannot be written
+        os.makedirs(os.path.join(self.package_dir, 'representations/repr2/METS.xml'))
+
+    def test_create_sip(self):
+        self.assertTrue(create_sip(self.package_dir, 'eark-ip', 'eark-ip', generate_package=False, workers=2))
+        self.assert_representations_listed()
+
+    def test_create_aip(self):
+        self.assertTrue(create_aip(self.package_dir, 'urn:uuid:1234', 'eark-ip', generate_package=False, workers=2))
+        self.assert_representations_listed()
+
+    def test_create_sip_worker_error(self):
+        self.make_representation_fail()
+        with self.assertRaises(IsADirectoryError):
+            create_sip(self.package_dir, 'eark-ip', 'eark-ip', generate_package=False, workers=2)
+        self.assertFalse(os.path.exists(os.path.join(self.package_dir, 'METS.xml')))
+
+    def test_create_aip_worker_error(self):
+        self.make_representation_fail()
+        with self.assertRaises(IsADirectoryError):
+            create_aip(self.package_dir, 'urn:uuid:1234', 'eark-ip', generate_package=False, workers=2)
+        self.assertFalse(os.path.exists(os.path.join(self.package_dir, 'METS.xml')))
+
+
+if __name__ == '__main__':
+    unittest.main()
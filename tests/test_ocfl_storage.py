@@ -4,11 +4,14 @@
 import os
 import shutil
 import json
+import tempfile
 import unittest
+from collections import defaultdict
 from eatb import ROOT
 from eatb.utils import randomutils
 from eatb.storage import update_storage_with_differences
 from eatb.storage import write_inventory_from_directory
+from eatb.storage import get_sha512_hash, InventoryIndex, ContentPool
 
 OCFL_TEST_RESOURCES = os.path.join(ROOT, 'tests/test_resources/ocfl-storage/')
 EXAMPLE_WORKING_DIR = os.path.join(OCFL_TEST_RESOURCES, 'working-dir')
@@ -139,6 +142,135 @@ class TestOcflStorage(unittest.TestCase):
         added_files = inventory.get("versions", {}).get("v00002", {}).get("added", [])
         self.assertIn("additionalfile.txt", added_files)
 
+    def test_5_inventory_digest(self):
+        """Test that the inventory sidecar file holds the digest of the inventory"""
+        with open(os.path.join(AIP_DATA_DIR, "inventory.json.sha512"), "r", encoding="utf-8") as f:
+            digest, name = f.read().split()
+        self.assertEqual("inventory.json", name)
+        self.assertEqual(get_sha512_hash(os.path.join(AIP_DATA_DIR, "inventory.json")), digest)
+
+
+class TestInventoryIndex(unittest.TestCase):
+    """Test inventory index"""
+
+    def test_index(self):
+        """Test lookups of logical paths and content"""
+        inventory = {
+            "manifest": defaultdict(list, {"d1": ["v00001/a.txt"], "d2": ["v00002/sub/a.txt"]}),
+            "versions": {
+                "v00001": {"state": {"d1": ["a.txt"]}},
+                "v00002": {"state": {"d2": ["sub/a.txt"]}},
+            }
+        }
+        index = InventoryIndex(inventory)
+        self.assertTrue(index.has_path_digest("a.txt", "d1"))
+        self.assertTrue(index.has_path_digest("sub/a.txt", "d2"))
+        self.assertFalse(index.has_path_digest("a.txt", "d2"))
+        self.assertFalse(index.has_path_digest("b.txt", "d1"))
+        self.assertTrue(index.has_content("d1"))
+        self.assertFalse(index.has_content("d3"))
+        index.add_content("d3", "v00003/b.txt")
+        index.add_content("d3", "v00003/b.txt")
+        self.assertEqual(["v00003/b.txt"], inventory["manifest"]["d3"])
+        self.assertTrue(index.has_content("d3"))
+
+
+
+class TestStorageDifferences(unittest.TestCase):
+    """Test detection of changed files"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.working_dir = os.path.join(self.tmp_dir, "working")
+        self.data_dir = os.path.join(self.tmp_dir, "data")
+        os.makedirs(os.path.join(self.working_dir, "sub"))
+        for rel_path, content in (("a.txt", "aaaa"), ("sub/b.txt", "bbbb"), ("c.txt", "cccc")):
+            with open(os.path.join(self.working_dir, rel_path), "w", encoding="utf-8") as f:
+                f.write(content)
+        self.store_version("v00001", [])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def store_version(self, version, previous_versions):
+        version_dir = os.path.join(self.data_dir, version)
+        os.makedirs(version_dir, exist_ok=True)
+        changed, deleted = update_storage_with_differences(
+            self.working_dir, version_dir, previous_versions, os.path.join(self.data_dir, "inventory.json"), workers=2)
+        write_inventory_from_directory("id", version, self.data_dir, "update", {"added": changed, "removed": deleted})
+        return sorted(changed), sorted(deleted)
+
+    def test_differences(self):
+        """Test added, changed, touched and deleted files"""
+        with open(os.path.join(self.working_dir, "a.txt"), "w", encoding="utf-8") as f:
+            f.write("AAAA")  # same size, new content
+        os.utime(os.path.join(self.working_dir, "sub/b.txt"))  # same content, new modification time
+        with open(os.path.join(self.working_dir, "d.txt"), "w", encoding="utf-8") as f:
+            f.write("d")
+        os.remove(os.path.join(self.working_dir, "c.txt"))
+        changed, deleted = self.store_version("v00002", ["v00001"])
+        self.assertEqual(["a.txt", "d.txt"], changed)
+        self.assertEqual(["c.txt"], deleted)
+        self.assertFalse(os.path.exists(os.path.join(self.data_dir, "v00002", "sub", "b.txt")))
+
+
+class TestStorageDeduplication(unittest.TestCase):
+    """Test content deduplication across versions and objects"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.working_dir = os.path.join(self.tmp_dir, "working")
+        os.makedirs(self.working_dir)
+        self.write_file("a.txt", "content a")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, rel_path, content):
+        with open(os.path.join(self.working_dir, rel_path), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def store_version(self, data_dir, version, previous_versions, content_pool=None):
+        version_dir = os.path.join(data_dir, version)
+        os.makedirs(version_dir, exist_ok=True)
+        inventory_path = os.path.join(data_dir, "inventory.json")
+        changed, deleted = update_storage_with_differences(
+            self.working_dir, version_dir, previous_versions, inventory_path, deduplicate=True,
+            content_pool=content_pool)
+        write_inventory_from_directory("id", version, data_dir, "update", {"added": changed, "removed": deleted},
+                                       deduplicate=True, content_pool=content_pool)
+        with open(inventory_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_forward_delta(self):
+        """Test that known content is recorded in the version state only"""
+        data_dir = os.path.join(self.tmp_dir, "data")
+        self.store_version(data_dir, "v00001", [])
+        self.write_file("copy-of-a.txt", "content a")
+        self.write_file("b.txt", "content b")
+        self.write_file("copy-of-b.txt", "content b")
+        inventory = self.store_version(data_dir, "v00002", ["v00001"])
+        # only one copy of the new content is stored in the version directory
+        self.assertEqual(1, len(os.listdir(os.path.join(data_dir, "v00002"))))
+        digest_a = get_sha512_hash(os.path.join(self.working_dir, "a.txt"))
+        digest_b = get_sha512_hash(os.path.join(self.working_dir, "b.txt"))
+        self.assertEqual(["v00001/a.txt"], inventory["manifest"][digest_a])
+        self.assertEqual(1, len(inventory["manifest"][digest_b]))
+        state = inventory["versions"]["v00002"]["state"]
+        self.assertEqual(["copy-of-a.txt"], state[digest_a])
+        self.assertEqual(["b.txt", "copy-of-b.txt"], sorted(state[digest_b]))
+
+    def test_content_pool(self):
+        """Test content shared by objects through the content pool"""
+        content_pool = ContentPool(os.path.join(self.tmp_dir, "pool"))
+        first_dir = os.path.join(self.tmp_dir, "first", "data")
+        second_dir = os.path.join(self.tmp_dir, "second", "data")
+        self.store_version(first_dir, "v00001", [], content_pool)
+        self.store_version(second_dir, "v00001", [], content_pool)
+        first_file = os.path.join(first_dir, "v00001", "a.txt")
+        second_file = os.path.join(second_dir, "v00001", "a.txt")
+        self.assertTrue(os.path.samefile(first_file, second_file))
+        self.assertTrue(os.path.samefile(first_file, content_pool.path(get_sha512_hash(first_file))))
 
 
 if __name__ == '__main__':
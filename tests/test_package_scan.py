@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from eatb.metadata.mets_generator import MetsGenerator
+from eatb.metadata.mets_validation import METS_NS, XLINK_NS
+from eatb.metadata.package_scan import scan_package, PackageFileKind
+
+
+class TestPackageScan(unittest.TestCase):
+
+    files = {
+        'rootfile.txt': 'ignored',
+        'metadata/descriptive/ead.xml': '<ead/>',
+        'metadata/preservation/premis.xml': '<premis/>',
+        'metadata/unknown/x.txt': 'unclassified',
+        'schemas/mets.xsd': '<xs/>',
+        'documentation/doc.txt': 'doc',
+        'representations/rep1/METS.xml': '<mets/>',
+        'representations/rep1/data/a.txt': 'not listed (representation METS)',
+        'representations/rep2/documentation/b.txt': 'bb',
+        'representations/rep2/metadata/preservation/p.xml': 'not listed',
+    }
+
+    def setUp(self):
+        self.package_dir = os.path.join(tempfile.mkdtemp(), "pkg")
+        for rel_path, content in self.files.items():
+            file_path = os.path.join(self.package_dir, rel_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.package_dir))
+
+    def test_scan_package(self):
+        table = scan_package(self.package_dir)
+        listed = {f.rel_path: (f.kind, f.use, f.size) for f in table.files()}
+        self.assertEqual({
+            'metadata/descriptive/ead.xml': (PackageFileKind.DESCRIPTIVE, 'other', 6),
+            'metadata/preservation/premis.xml': (PackageFileKind.PRESERVATION, 'other', 9),
+            'schemas/mets.xsd': (PackageFileKind.SCHEMA, 'schemas', 5),
+            'documentation/doc.txt': (PackageFileKind.CONTENT, 'documentation', 3),
+            'representations/rep1/METS.xml': (PackageFileKind.METS, 'representations', 7),
+            'representations/rep2/documentation/b.txt': (PackageFileKind.CONTENT, 'documentation', 2),
+        }, listed)
+        self.assertEqual(6, len(table))
+        self.assertEqual(['documentation', 'representations', 'schemas'], sorted(table.use_folders))
+        self.assertNotIn('representations', [d.rel_path for d in table.directories])
+        self.assertIn('representations/rep2/metadata', [d.rel_path for d in table.directories])
+
+    def test_create_mets_from_table(self):
+        table = scan_package(self.package_dir)
+        mets_data = {'packageid': 'pkg', 'type': 'SIP', 'schemas': os.path.join(self.package_dir, 'schemas'),
+                     'parent': ''}
+        MetsGenerator(self.package_dir).createMets(mets_data, file_table=table)
+        root = etree.parse(os.path.join(self.package_dir, 'METS.xml')).getroot()
+        hrefs = [e.get('{%s}href' % XLINK_NS) for e in root.iter('{%s}FLocat' % METS_NS, '{%s}mdRef' % METS_NS)]
+        self.assertEqual(sorted(f.rel_path for f in table.files()), sorted(hrefs))
+        self.assertEqual(1, len(root.findall('{%s}dmdSec' % METS_NS)))
+
+    def test_create_mets_streaming(self):
+        mets_data = {'packageid': 'pkg', 'type': 'SIP', 'schemas': os.path.join(self.package_dir, 'schemas'),
+                     'parent': ''}
+        tree_mets = os.path.join(os.path.dirname(self.package_dir), 'tree.xml')
+        MetsGenerator(self.package_dir).createMets(mets_data, tree_mets)
+        MetsGenerator(self.package_dir).createMets(mets_data, streaming=True)
+        tree_root = etree.parse(tree_mets).getroot()
+        stream_root = etree.parse(os.path.join(self.package_dir, 'METS.xml')).getroot()
+        self.assertEqual([e.tag for e in tree_root.iter()], [e.tag for e in stream_root.iter()])
+        href = '{%s}href' % XLINK_NS
+        self.assertEqual([e.get(href) for e in tree_root.iter() if e.get(href)],
+                         [e.get(href) for e in stream_root.iter() if e.get(href)])
+        file_ids = {e.get('ID') for e in stream_root.iter('{%s}file' % METS_NS, '{%s}mdRef' % METS_NS)}
+        fptr_ids = {e.get('FILEID') for e in stream_root.iter('{%s}fptr' % METS_NS)}
+        self.assertEqual(file_ids, fptr_ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import gzip
+import io
+import tarfile
+import unittest
+
+from eatb import ROOT
+from eatb.checksum import ChecksumAlgorithm, ChecksumFile
+from eatb.compression import ParallelGzipWriter, zstd_disabled
+from eatb.packaging import create_package, PackagedContainer, PackageFormat
+from eatb.utils import randomutils
+
+
+class TestPackaging(unittest.TestCase):
+    test_dir = os.path.join(ROOT, 'tests/test_resources/eark-ip')
+    temp_dir = '/tmp/temp-' + randomutils.randomword(10)
+
+    @classmethod
+    def setUpClass(cls):
+        os.makedirs(TestPackaging.temp_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TestPackaging.temp_dir)
+
+    def test_create_package(self):
+        """
+        Checksum returned by create_package must be the checksum of the package file
+        """
+        md5 = create_package(self.test_dir, "package", output_directory=self.temp_dir)
+        package_file = os.path.join(self.temp_dir, "package.tar")
+        self.assertEqual(ChecksumFile(package_file).get(ChecksumAlgorithm.MD5), md5)
+        with tarfile.open(package_file) as tar:
+            self.assertIn("metadata/EAD.xml", tar.getnames())
+
+    def test_create_package_sha256(self):
+        """
+        Package checksum algorithm must be configurable
+        """
+        sha256 = create_package(self.test_dir, "package-sha256", output_directory=self.temp_dir,
+                                use_input_dir_as_root=True, checksum_algorithm=ChecksumAlgorithm.SHA256)
+        package_file = os.path.join(self.temp_dir, "package-sha256.tar")
+        self.assertEqual(ChecksumFile(package_file).get(ChecksumAlgorithm.SHA256), sha256)
+        with tarfile.open(package_file) as tar:
+            self.assertIn("eark-ip/metadata/EAD.xml", tar.getnames())
+
+    def assert_compressed_package(self, compression, extension):
+        md5 = create_package(self.test_dir, "package-" + compression, output_directory=self.temp_dir,
+                             compression=compression, compression_level=1, workers=2)
+        package_file = os.path.join(self.temp_dir, "package-%s%s" % (compression, extension))
+        self.assertEqual(ChecksumFile(package_file).get(ChecksumAlgorithm.MD5), md5)
+        extract_dir = os.path.join(self.temp_dir, "extracted-" + compression)
+        self.assertEqual(5, PackagedContainer.factory(package_file).extract(extract_dir))
+        self.assertTrue(os.path.isfile(os.path.join(extract_dir, "metadata/EAD.xml")))
+
+    def test_create_package_gzip(self):
+        """
+        gunzip flag must create a gzip compressed container
+        """
+        create_package(self.test_dir, "package-gunzip", gunzip=True, output_directory=self.temp_dir)
+        package_file = os.path.join(self.temp_dir, "package-gunzip.tar.gz")
+        self.assertEqual(PackageFormat.TARGZ, PackageFormat.get(package_file))
+        with open(package_file, 'rb') as f:
+            self.assertEqual(b'\x1f\x8b', f.read(2))
+        self.assert_compressed_package("gzip", ".tar.gz")
+
+    def test_create_package_pgzip(self):
+        self.assert_compressed_package("pgzip", ".tar.gz")
+
+    def test_create_package_xz(self):
+        self.assert_compressed_package("xz", ".tar.xz")
+
+    @unittest.skipIf(zstd_disabled, "zstandard package not available")
+    def test_create_package_zstd(self):
+        self.assert_compressed_package("zstd", ".tar.zst")
+
+    def test_create_package_unsupported_compression(self):
+        with self.assertRaises(ValueError):
+            create_package(self.test_dir, "package-bz2", output_directory=self.temp_dir, compression="bz2")
+
+    def test_parallel_gzip_writer(self):
+        """
+        Blocks compressed in parallel must decompress to the original data
+        """
+        data = os.urandom(10000) * 20
+        out = io.BytesIO()
+        with ParallelGzipWriter(out, workers=4, blocksize=7000) as writer:
+            writer.write(data[:50000])
+            writer.write(data[50000:])
+        self.assertEqual(data, gzip.decompress(out.getvalue()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,16 @@
 # -*- coding: utf-8 -*-
 import os
 import shutil
+import tempfile
 import unittest
+from unittest import mock
 
 from pairtree import ObjectNotFoundException
 
 from eatb import ROOT
-from eatb.pairtree_storage import PairtreeStorage
+from eatb.checksum import files_identical, get_sha256_hash
+from eatb.pairtree_storage import PairtreeStorage, StorageMode, _scan_version_nums
+from eatb.tar_index import TarIndex, tar_index_path, write_tar_index
 from eatb.utils import randomutils
 
 source_dir = os.path.join(ROOT, 'tests/test_resources/storage-test/')
@@ -60,6 +64,136 @@ class TestPairtreeStorage(unittest.TestCase):
         pts.store("xyz", package_file_path)
         self.assertEqual(2, pts.curr_version_num("xyz"))
 
+    def test_read_member_range(self):
+        pts = PairtreeStorage(repository_storage_dir)
+        version = pts.store("range", package_file_path)
+        member = "xyz/representations/default/data/example.txt"
+        self.assertEqual(b"example content\n", pts.read_member_range("range", version, member).tobytes())
+        self.assertEqual(b"content", bytes(pts.read_member_range("range", version, member, 8, 7)))
+        self.assertEqual(b"content\n", bytes(pts.read_member_range("range", 1, member, 8, 1000)))
+        self.assertEqual(b"", bytes(pts.read_member_range("range", version, member, 16)))
+        with self.assertRaises(KeyError):
+            pts.read_member_range("range", version, "xyz/missing.txt")
+        with self.assertRaises(ValueError):
+            pts.read_member_range("range", version, member, 17)
+        with self.assertRaises(ObjectNotFoundException):
+            pts.read_member_range("range", "v00002", member)
+
+    def test_store_modes(self):
+        pts = PairtreeStorage(repository_storage_dir)
+        size = os.path.getsize(package_file_path)
+        stored = pts.store_container("modes", package_file_path, mode=StorageMode.DEDUP)
+        self.assertEqual("v00001", stored.version)
+        self.assertEqual(size, stored.bytes_written)
+        # identical container: hardlink to the previous version
+        self.assertEqual(0, pts.store_container("modes", package_file_path, mode=StorageMode.DEDUP).bytes_written)
+        first = pts.get_container_path("modes", 1)
+        second = pts.get_container_path("modes", 2)
+        self.assertEqual(os.stat(first).st_ino, os.stat(second).st_ino)
+        # a reflink (or the copy if reflinks are not supported) counts in full
+        self.assertEqual(size, pts.store_container("modes", package_file_path, mode=StorageMode.REFLINK).bytes_written)
+        self.assertTrue(files_identical(package_file_path, pts.get_container_path("modes", 3)))
+        self.assertEqual(size, pts.store_container("modes", package_file_path).bytes_written)
+        with self.assertRaises(ValueError):
+            pts.store("modes", package_file_path, mode="move")
+
+    def test_reflink_counts_in_full(self):
+        pts = PairtreeStorage(repository_storage_dir)
+
+        def reflink(source, target):
+            shutil.copyfile(source, target)
+            return True
+        with mock.patch("eatb.pairtree_storage.reflink_file", side_effect=reflink) as reflink_file:
+            stored = pts.store_container("reflink", package_file_path, mode=StorageMode.REFLINK)
+        reflink_file.assert_called_once()
+        self.assertEqual(os.path.getsize(package_file_path), stored.bytes_written)
+
+    def test_dedup_uses_recorded_digest(self):
+        pts = PairtreeStorage(repository_storage_dir)
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        source = os.path.join(source_dir, "dedup.tar")
+        shutil.copy2(package_file_path, source)
+        write_tar_index(source)
+        pts.store("dedup", source, mode=StorageMode.DEDUP)
+        # the digest of the stored container is recorded in its index, the stored container is not hashed again
+        stored_index = TarIndex.read(tar_index_path(pts.get_container_path("dedup", 1)))
+        self.assertEqual(get_sha256_hash(source), stored_index.tar_digest)
+        with mock.patch("eatb.pairtree_storage.get_sha256_hash", wraps=get_sha256_hash) as hash_mock:
+            self.assertEqual(0, pts.store_container("dedup", source, mode=StorageMode.DEDUP).bytes_written)
+            source_index = TarIndex.read(tar_index_path(source))
+            self.assertIsNone(source_index.tar_digest)
+            self.assertEqual(1, hash_mock.call_count)
+            # different size: no hashing at all
+            with open(source, "ab") as f:
+                f.write(b"\0" * 512)
+            hash_mock.reset_mock()
+            pts.store("dedup", source, mode=StorageMode.DEDUP)
+            hash_mock.assert_not_called()
+
+    def test_version_index(self):
+        pts = PairtreeStorage(repository_storage_dir)
+        self.assertEqual(-1, pts.curr_version_num("versions"))
+        self.assertEqual("v00001", pts.next_version("versions"))
+        pts.store("versions", package_file_path)
+        pts.store("versions", package_file_path)
+        self.assertEqual(2, pts.curr_version_num("versions"))
+        self.assertEqual("v00003", pts.next_version("versions"))
+        # version directories created by another process must be recognised
+        data_directory = os.path.join(pts.get_dir_path_from_id("versions"), "data")
+        os.makedirs(os.path.join(data_directory, "v00003"))
+        self.assertEqual("v00003", pts.curr_version("versions"))
+        self.assertEqual("v00004", pts.next_version("versions"))
+        shutil.rmtree(os.path.join(data_directory, "v00003"))
+        self.assertEqual("v00002", pts.curr_version("versions"))
+
+    def test_store_with_outdated_version_cache(self):
+        """
+        A store must not overwrite an existing version if the data directory looks unchanged (coarse timestamps,
+        constant link count)
+        """
+        pts = PairtreeStorage(repository_storage_dir)
+        data_directory = os.path.join(pts.get_dir_path_from_id("stale"), "data")
+        os_stat = os.stat
+
+        def stat(path, *args, **kwargs):
+            if path == data_directory:
+                return os.stat_result((0o40755, 0, 0, 1, 0, 0, 0, 0, 0, 0))
+            return os_stat(path, *args, **kwargs)
+
+        _scan_version_nums.cache_clear()
+        self.addCleanup(_scan_version_nums.cache_clear)
+        pts.store("stale", package_file_path)
+        with mock.patch("eatb.pairtree_storage.os.stat", side_effect=stat):
+            self.assertEqual({1}, pts._version_nums("stale"))
+            self.assertEqual("v00002", pts.store("stale", package_file_path))
+            # the cached version list is outdated now, the version following the cached head is detected
+            self.assertEqual({1, 2}, pts._version_nums("stale"))
+            self.assertEqual(2, pts.curr_version_num("stale"))
+            self.assertTrue(pts.get_object_path("stale").endswith("v00002"))
+            self.assertEqual("v00003", pts.store("stale", package_file_path))
+            # version allocated concurrently: the next version number is tried
+            with mock.patch.object(pts, "_next_version", return_value="v00002"):
+                self.assertEqual("v00004", pts.store("stale", package_file_path))
+        self.assertEqual(4, pts.curr_version_num("stale"))
+
+    def test_catalogue(self):
+        catalogue_repo = os.path.join(repository_storage_dir, "catalogue-repo")
+        shutil.copytree(test_repo, catalogue_repo)
+        pts = PairtreeStorage(catalogue_repo)
+        scanned = pts.latest_version_ip_list()
+        pts = PairtreeStorage(catalogue_repo, catalogue=True)
+        self.assertTrue(pts.catalogue.exists())
+        self.assertEqual(sorted((x["id"], x["version"]) for x in scanned),
+                         sorted((x["id"], x["version"]) for x in pts.latest_version_ip_list()))
+        pts.store("bar", package_file_path)
+        pts.store("xyz", package_file_path)
+        latest = {x["id"]: x for x in pts.latest_version_ip_list()}
+        self.assertEqual(int(pts.curr_version("bar")[1:]), latest["bar"]["version"])
+        self.assertEqual(pts.get_container_path("xyz", 1), latest["xyz"]["path"])
+        self.assertEqual(len(latest), pts.rebuild_catalogue(workers=4))
+        self.assertEqual(latest, {x["id"]: x for x in pts.latest_version_ip_list()})
+
     def test_get_object_path(self):
         pts = PairtreeStorage(test_repo)
         expected = os.path.join(test_repo, "pairtree_root/ba/r/data/v00002")
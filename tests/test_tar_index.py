@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import shutil
+import tarfile
+import unittest
+
+from eatb.packaging import create_package, ChunkedTarEntryReader, TarContainer
+from eatb.pairtree_storage import PairtreeStorage
+from eatb.tar_index import TarIndex, load_tar_index, tar_index_path, write_tar_index
+from eatb.utils import randomutils
+
+
+class TestTarIndex(unittest.TestCase):
+    temp_dir = '/tmp/temp-' + randomutils.randomword(10)
+    long_name = "representations/" + "x" * 120 + "/data/long-name.txt"
+
+    @classmethod
+    def setUpClass(cls):
+        package_dir = os.path.join(TestTarIndex.temp_dir, "package")
+        os.makedirs(os.path.join(package_dir, os.path.dirname(TestTarIndex.long_name)))
+        os.makedirs(os.path.join(package_dir, "empty"))
+        with open(os.path.join(package_dir, TestTarIndex.long_name), 'w') as f:
+            f.write("content of a member with a long name\n")
+        with open(os.path.join(package_dir, "first.txt"), 'wb') as f:
+            f.write(os.urandom(10000))
+        create_package(package_dir, "package", output_directory=TestTarIndex.temp_dir, index=True)
+        TestTarIndex.tar_path = os.path.join(TestTarIndex.temp_dir, "package.tar")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TestTarIndex.temp_dir)
+
+    def test_index_entries(self):
+        """
+        Offsets, sizes and digests of the index created by create_package must match the container
+        """
+        self.assertTrue(os.path.exists(tar_index_path(self.tar_path)))
+        tar_index = TarIndex.read(tar_index_path(self.tar_path))
+        self.assertTrue(tar_index.is_valid_for(self.tar_path))
+        with tarfile.open(self.tar_path) as tfile:
+            members = tfile.getmembers()
+            self.assertEqual(len(members), len(tar_index))
+            for member in members:
+                entry = tar_index.get(member.name)
+                self.assertEqual((member.offset, member.offset_data, member.size),
+                                 (entry.header_offset, entry.data_offset, entry.size))
+                if member.isreg():
+                    self.assertEqual(hashlib.sha256(tfile.extractfile(member).read()).hexdigest(), entry.digest)
+        built = TarIndex.build(self.tar_path)
+        self.assertEqual(tar_index.entries, built.entries)
+
+    def test_member_lookup(self):
+        """
+        Members must be read by seeking to the offset recorded in the index
+        """
+        self.assertTrue(TarContainer(self.tar_path).has_member(self.tar_path, self.long_name))
+        self.assertFalse(TarContainer(self.tar_path).has_member(self.tar_path, "missing.txt"))
+        reader = ChunkedTarEntryReader(tarfile.open(self.tar_path, 'r'), 8192)
+        content = b''.join(reader.chunks(self.long_name))
+        reader.close()
+        self.assertEqual(b"content of a member with a long name\n", content)
+
+    def test_member_iteration_after_lookup(self):
+        """
+        Reading a member using the index must not affect the member iteration of the TarFile object
+        """
+        with tarfile.open(self.tar_path) as tfile:
+            names = tfile.getnames()
+        last_name = list(load_tar_index(self.tar_path).entries)[-1]
+        with tarfile.open(self.tar_path, 'r') as tfile:
+            content = b''.join(ChunkedTarEntryReader(tfile, 8192).chunks(last_name))
+            self.assertEqual(names, tfile.getnames())
+            self.assertEqual(content, tfile.extractfile(last_name).read())
+        with tarfile.open(self.tar_path, 'r') as tfile:
+            b''.join(ChunkedTarEntryReader(tfile, 8192).chunks(self.long_name))
+            self.assertEqual(names, [member.name for member in tfile])
+
+    def test_outdated_index(self):
+        """
+        An index file which does not match the container must not be used
+        """
+        tar_path = os.path.join(self.temp_dir, "outdated.tar")
+        shutil.copy(self.tar_path, tar_path)
+        shutil.copy(tar_index_path(self.tar_path), tar_index_path(tar_path))
+        with open(tar_path, 'ab') as f:
+            f.write(b'\0' * tarfile.RECORDSIZE)
+        self.assertTrue(self.long_name in load_tar_index(tar_path))
+        self.assertEqual(os.path.getsize(tar_path), load_tar_index(tar_path).tar_size)
+        self.assertEqual(os.path.getsize(tar_path), write_tar_index(tar_path).tar_size)
+
+    def test_store_index(self):
+        """
+        The index must be stored next to the container in the pairtree version directory
+        """
+        repository_storage_dir = os.path.join(self.temp_dir, "repo")
+        pts = PairtreeStorage(repository_storage_dir)
+        version = pts.store("urn:uuid:xyz", self.tar_path)
+        stored_tar_path = os.path.join(pts.get_object_path("urn:uuid:xyz"), "urn+uuid+xyz.tar")
+        self.assertEqual("v00001", version)
+        self.assertTrue(TarIndex.read(tar_index_path(stored_tar_path)).is_valid_for(stored_tar_path))
+        self.assertEqual(["urn+uuid+xyz.tar"], [os.path.basename(item["path"]) for item in pts.latest_version_ip_list()])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@
 import os
 import shutil
 import unittest
+import zipfile
 
 from eatb import ROOT
 from eatb.packaging import ZipContainer
@@ -41,6 +42,22 @@ class TestExtraction(unittest.TestCase):
         for file in files_to_check:
             self.assertTrue(os.path.isfile(file), "File %s not found in extracted directory" + file)
 
+    def test_extract_streamed_progress(self):
+        """
+        Entries must be copied in chunks and the progress must be reported by extracted bytes
+        """
+        extract_dir = os.path.join(TestExtraction.temp_extract_dir, "streamed")
+        zip_container_file_path = os.path.join(TestExtraction.temp_extract_dir, "package.zip")
+        reported = []
+        zip_container = ZipContainer(zip_container_file_path, chunksize=2)
+        self.assertTrue(zip_container.unzip(extract_dir, progress_reporter=reported.append))
+        self.assertEqual(100, reported[-1])
+        self.assertEqual(sorted(reported), reported)
+        with open(os.path.join(extract_dir, "package/subfolder/second_level.txt"), 'rb') as f:
+            content = f.read()
+        with zipfile.ZipFile(zip_container_file_path) as zf:
+            self.assertEqual(zf.read("package/subfolder/second_level.txt"), content)
+
 
 if __name__ == '__main__':
     unittest.main()